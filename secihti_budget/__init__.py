@@ -1,3 +1,8 @@
 # -*- coding: utf-8 -*-
 from . import models
 from . import wizards
+
+
+def uninstall_hook(cr, registry):
+    """Elimina la vista materializada del dashboard, que Odoo no borra solo."""
+    cr.execute("DROP MATERIALIZED VIEW IF EXISTS sec_rubro_dashboard CASCADE")
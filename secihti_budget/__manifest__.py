@@ -26,11 +26,17 @@
         "views/purchase_order_export_wizard_views.xml",
         "views/assets_report_wizard_views.xml",
         "views/sec_attachment_export_wizard_view.xml",
+        "views/sec_export_job_views.xml",
+        "views/sec_attachment_export_manifest_views.xml",
         "views/sec_menus.xml",
         "security/ir.model.access.csv",
         "data/sec_rubro_data.xml",
+        "data/sec_rubro_dashboard_cron.xml",
+        "data/sec_export_job_cron.xml",
+        "data/sec_purchase_pdf_cache_cron.xml",
     ],
     "application": True,
     "icon": "/secihti_budget/static/description/icon.png",
     "installable": True,
+    "uninstall_hook": "uninstall_hook",
 }
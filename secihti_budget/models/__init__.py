@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
 from . import sec_project
 from . import purchase_order
+from . import sec_execution_ledger
+from . import sec_export_mixin
 from . import budget_transfer
 from . import sec_rubro_dashboard
+from . import sec_export_job
+from . import sec_purchase_pdf_cache
+from . import sec_attachment_export_manifest
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 import csv
 import base64
-from io import StringIO, BytesIO
+from collections import defaultdict
+from io import StringIO
 from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError, UserError
 from odoo.tools import float_is_zero
 from odoo.tools.misc import formatLang
 
+from .sec_export_mixin import XLSX_MIMETYPE
+
 try:
     import xlsxwriter
 except ImportError:
@@ -91,6 +94,29 @@ class SecBudgetTransfer(models.Model):
         tracking=True,
     )
 
+    def init(self):
+        # Alinea los contadores de transferencias confirmadas de las líneas.
+        self.env.cr.execute(
+            """
+            UPDATE sec_activity_budget_line bl
+               SET transfer_in_count = counts.transfer_in,
+                   transfer_out_count = counts.transfer_out
+              FROM (
+                  SELECT line.id,
+                         COUNT(*) FILTER (WHERE t.line_to_id = line.id) AS transfer_in,
+                         COUNT(*) FILTER (WHERE t.line_from_id = line.id) AS transfer_out
+                    FROM sec_activity_budget_line line
+                    LEFT JOIN sec_budget_transfer t
+                      ON t.state = 'confirmed'
+                     AND (t.line_from_id = line.id OR t.line_to_id = line.id)
+                   GROUP BY line.id
+              ) counts
+             WHERE counts.id = bl.id
+               AND (bl.transfer_in_count IS DISTINCT FROM counts.transfer_in
+                    OR bl.transfer_out_count IS DISTINCT FROM counts.transfer_out)
+            """
+        )
+
     @api.onchange("stage_id")
     def _onchange_stage(self):
         for transfer in self:
@@ -305,6 +331,7 @@ class SecBudgetTransfer(models.Model):
                 vals["amount_concurrente"] = total * (project.pct_concurrente / 100.0)
         record = super().create(vals)
         if record.state == "confirmed":
+            record._update_line_transfer_counters({}, record._get_confirmed_line_pairs())
             record.action_confirm()
         return record
 
@@ -317,6 +344,10 @@ class SecBudgetTransfer(models.Model):
             "line_to_id",
         }
 
+        counters_before = None
+        if {"state", "line_from_id", "line_to_id"} & set(vals.keys()):
+            counters_before = self._get_confirmed_line_pairs()
+
         confirmed_to_update = self.filtered(lambda t: t.state == "confirmed")
         should_update_budget = bool(tracked_fields & set(vals.keys()))
 
@@ -368,24 +399,123 @@ class SecBudgetTransfer(models.Model):
                     transfer,
                 )
 
+        if counters_before is not None:
+            self._update_line_transfer_counters(
+                counters_before, self._get_confirmed_line_pairs()
+            )
         return res
 
-    def action_confirm(self):
-        for transfer in self:
-            if transfer.state == "confirmed":
+    def _get_confirmed_line_pairs(self):
+        """{transfer_id: (línea origen, línea destino)} de las transferencias confirmadas."""
+        return {
+            transfer.id: (transfer.line_from_id.id, transfer.line_to_id.id)
+            for transfer in self
+            if transfer.state == "confirmed"
+        }
+
+    @api.model
+    def _update_line_transfer_counters(self, before, after):
+        """Ajusta los contadores de transferencias confirmadas de las líneas.
+
+        Solo se escriben las líneas cuyo conteo cambió entre ``before`` y
+        ``after`` (ver ``_get_confirmed_line_pairs``).
+        """
+        deltas = defaultdict(lambda: [0, 0])  # line_id -> [entrantes, salientes]
+        for pairs, sign in ((before, -1), (after, 1)):
+            for line_from_id, line_to_id in pairs.values():
+                if line_from_id:
+                    deltas[line_from_id][1] += sign
+                if line_to_id:
+                    deltas[line_to_id][0] += sign
+        Line = self.env["sec.activity.budget.line"]
+        for line_id, (delta_in, delta_out) in deltas.items():
+            if not delta_in and not delta_out:
                 continue
+            line = Line.browse(line_id)
+            line.write({
+                "transfer_in_count": max(line.transfer_in_count + delta_in, 0),
+                "transfer_out_count": max(line.transfer_out_count + delta_out, 0),
+            })
+
+    def action_confirm(self):
+        """Confirma las transferencias en lote.
+
+        Se validan todas en el mismo orden que el recorrido secuencial,
+        acumulando el saldo de cada línea en memoria, de modo que el primer
+        error es el mismo que se obtendría confirmándolas una por una. Cada
+        línea afectada se escribe una sola vez y recibe un único mensaje.
+        """
+        transfers = self.filtered(lambda t: t.state != "confirmed")
+        if not transfers:
+            return True
+
+        balances = {}  # line_id -> [programa, concurrente]
+        moves = defaultdict(list)  # line_id -> [(transfer, dirección, programa, concurrente)]
+        lines = self.env["sec.activity.budget.line"]
+        for transfer in transfers:
             transfer._validate_lines()
             transfer._validate_amounts()
 
-            transfer.line_from_id.apply_transfer_out(
-                transfer.amount_programa, transfer.amount_concurrente, transfer
+            amount_programa = transfer.amount_programa or 0.0
+            amount_concurrente = transfer.amount_concurrente or 0.0
+            line_from = transfer.line_from_id
+            line_to = transfer.line_to_id
+            lines |= line_from | line_to
+
+            balance_from = balances.setdefault(
+                line_from.id,
+                [line_from.amount_programa or 0.0, line_from.amount_concurrente or 0.0],
             )
-            transfer.line_to_id.apply_transfer_in(
-                transfer.amount_programa, transfer.amount_concurrente, transfer
+            line_from._validate_outgoing_transfer(
+                amount_programa,
+                amount_concurrente,
+                budget_programa=balance_from[0],
+                budget_concurrente=balance_from[1],
+            )
+            new_from = [
+                balance_from[0] - amount_programa,
+                balance_from[1] - amount_concurrente,
+            ]
+            line_from._check_transfer_result(*new_from)
+            balance_from[:] = new_from
+            moves[line_from.id].append(
+                (transfer, "out", -amount_programa, -amount_concurrente)
+            )
+
+            balance_to = balances.setdefault(
+                line_to.id,
+                [line_to.amount_programa or 0.0, line_to.amount_concurrente or 0.0],
+            )
+            new_to = [
+                balance_to[0] + amount_programa,
+                balance_to[1] + amount_concurrente,
+            ]
+            line_to._check_transfer_result(*new_to)
+            balance_to[:] = new_to
+            moves[line_to.id].append(
+                (transfer, "in", amount_programa, amount_concurrente)
+            )
+
+        for line in lines:
+            new_programa, new_concurrente = balances[line.id]
+            line.write(
+                {
+                    "amount_programa": new_programa,
+                    "amount_concurrente": new_concurrente,
+                }
+            )
+            messages = [
+                line._get_transfer_message(transfer, direction, delta_programa, delta_concurrente)
+                for transfer, direction, delta_programa, delta_concurrente in moves[line.id]
+            ]
+            line.message_post(
+                body="<p>%s</p>" % "<br/>".join(messages),
+                subtype_xmlid="mail.mt_note",
             )
 
-            transfer.write({"state": "confirmed"})
+        transfers.write({"state": "confirmed"})
 
+        for transfer in transfers:
             currency = transfer.currency_id or self.env.company.currency_id
             body = _(
                 "Transferencia aplicada: %(monto)s (Programa: %(prog)s, Concurrente: %(conc)s).",
@@ -401,6 +531,7 @@ class SecBudgetTransfer(models.Model):
         return True
 
     def unlink(self):
+        self._update_line_transfer_counters(self._get_confirmed_line_pairs(), {})
         for transfer in self:
             if transfer.state != "confirmed":
                 continue
@@ -608,69 +739,88 @@ class SecBudgetTransfer(models.Model):
         ])
 
         # Build current state (after all transfers have been applied)
-        # Key: (activity_id, rubro_id), Value: {programa, concurrente, total}
-        current_state = {}
+        # Key: (activity_id, rubro_id), Value: {rubro_id, programa, concurrente, total}
+        working_state = {}
         for line in all_stage_lines:
             key = (line.activity_id.id, line.rubro_id.id)
-            current_state[key] = {
-                'line_id': line.id,
-                'activity_name': line.activity_id.name,
+            working_state[key] = {
                 'rubro_id': line.rubro_id.id,
-                'rubro_name': line.rubro_id.name,
                 'programa': line.amount_programa or 0.0,
                 'concurrente': line.amount_concurrente or 0.0,
                 'total': line.amount_total or 0.0,
             }
 
+        # Running totals per rubro: {rubro_id: [programa, concurrente]}.
+        # They are kept up to date while reversing transfers instead of
+        # rescanning the whole state for every transfer.
+        rubro_totals = defaultdict(lambda: [0.0, 0.0])
+        for data in working_state.values():
+            rubro_totals[data['rubro_id']][0] += data['programa']
+            rubro_totals[data['rubro_id']][1] += data['concurrente']
+
+        def _reverse(key, delta_programa, delta_concurrente):
+            data = working_state.get(key)
+            if not data:
+                return
+            data['programa'] += delta_programa
+            data['concurrente'] += delta_concurrente
+            data['total'] = data['programa'] + data['concurrente']
+            rubro_totals[data['rubro_id']][0] += delta_programa
+            rubro_totals[data['rubro_id']][1] += delta_concurrente
+
+        empty = {'programa': 0.0, 'concurrente': 0.0, 'total': 0.0}
+
+        def _snapshot(key_from, key_to, rubro_from_id, rubro_to_id):
+            return {
+                'from': dict(working_state.get(key_from, empty)),
+                'to': dict(working_state.get(key_to, empty)),
+                'rubro_from': tuple(rubro_totals.get(rubro_from_id, (0.0, 0.0))),
+                'rubro_to': tuple(rubro_totals.get(rubro_to_id, (0.0, 0.0))),
+            }
+
         # Sort transfers from most recent to oldest for state reconstruction
         transfers_desc = self.sorted(key=lambda t: (t.date, t.id), reverse=True)
 
-        # Dictionary to store the before/after state for each transfer
-        # {transfer_id: {'before': state_dict, 'after': state_dict}}
+        # Only the values this transfer touches are kept:
+        # {transfer_id: {'before': snapshot, 'after': snapshot}}
         transfer_history = {}
 
-        # Process transfers from most recent to oldest, reversing each one
-        working_state = {}
-        for key, data in current_state.items():
-            working_state[key] = data.copy()
-
         for transfer in transfers_desc:
-            # The "after" state for this transfer is the current working_state
-            after_state = {}
-            for key, data in working_state.items():
-                after_state[key] = data.copy()
-
-            # Now reverse this transfer in the working_state
-            line_from = transfer.line_from_id
-            line_to = transfer.line_to_id
+            key_from = (transfer.line_from_id.activity_id.id, transfer.line_from_id.rubro_id.id)
+            key_to = (transfer.line_to_id.activity_id.id, transfer.line_to_id.rubro_id.id)
+            rubro_from_id = transfer.line_from_id.rubro_id.id
+            rubro_to_id = transfer.line_to_id.rubro_id.id
 
-            key_from = (line_from.activity_id.id, line_from.rubro_id.id)
-            key_to = (line_to.activity_id.id, line_to.rubro_id.id)
+            # The "after" state for this transfer is the current working_state
+            after_state = _snapshot(key_from, key_to, rubro_from_id, rubro_to_id)
 
             # Reverse the transfer: add back to origin, subtract from destination
-            if key_from in working_state:
-                working_state[key_from]['programa'] += transfer.amount_programa or 0.0
-                working_state[key_from]['concurrente'] += transfer.amount_concurrente or 0.0
-                working_state[key_from]['total'] = working_state[key_from]['programa'] + working_state[key_from]['concurrente']
-
-            if key_to in working_state:
-                working_state[key_to]['programa'] -= transfer.amount_programa or 0.0
-                working_state[key_to]['concurrente'] -= transfer.amount_concurrente or 0.0
-                working_state[key_to]['total'] = working_state[key_to]['programa'] + working_state[key_to]['concurrente']
+            _reverse(key_from, transfer.amount_programa or 0.0, transfer.amount_concurrente or 0.0)
+            _reverse(key_to, -(transfer.amount_programa or 0.0), -(transfer.amount_concurrente or 0.0))
 
             # The "before" state for this transfer is the new working_state
-            before_state = {}
-            for key, data in working_state.items():
-                before_state[key] = data.copy()
-
             transfer_history[transfer.id] = {
-                'before': before_state,
+                'before': _snapshot(key_from, key_to, rubro_from_id, rubro_to_id),
                 'after': after_state,
             }
 
-        # Create Excel file
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        # Create Excel file (streamed to a temporary file)
+        export = self.env['sec.export.mixin']
+        filename = f"historial_transferencias_{stage.name}_{fields.Date.today()}.xlsx"
+        path = export._new_export_path('.xlsx')
+        try:
+            workbook = export._new_xlsx_workbook(path)
+            self._write_transfers_history(workbook, stage, currency, transfer_history)
+            workbook.close()
+            attachment = export._store_export_file(path, filename, XLSX_MIMETYPE)
+        finally:
+            export._remove_export_path(path)
+
+        # Return download action
+        return export._get_download_action(attachment)
+
+    def _write_transfers_history(self, workbook, stage, currency, transfer_history):
+        """Write the transfer history sheet into ``workbook``."""
         worksheet = workbook.add_worksheet('Historial de Transferencias')
 
         # Define formats
@@ -773,17 +923,14 @@ class SecBudgetTransfer(models.Model):
             rubro_from = line_from.rubro_id
             rubro_to = line_to.rubro_id
 
-            key_from = (line_from.activity_id.id, rubro_from.id)
-            key_to = (line_to.activity_id.id, rubro_to.id)
-
             # RUBRO ORIGEN
             worksheet.write(row, 0, rubro_from.name, subheader_format)
             worksheet.write(row, 1, 'ORIGEN', subheader_format)
             row += 1
 
             # Origin activity line
-            before_from = before_state.get(key_from, {'programa': 0.0, 'concurrente': 0.0, 'total': 0.0})
-            after_from = after_state.get(key_from, {'programa': 0.0, 'concurrente': 0.0, 'total': 0.0})
+            before_from = before_state['from']
+            after_from = after_state['from']
 
             worksheet.write(row, 0, f'  {line_from.activity_id.name}', cell_format)
             worksheet.write(row, 1, 'Actividad', cell_format)
@@ -795,25 +942,10 @@ class SecBudgetTransfer(models.Model):
             worksheet.write(row, 7, after_from['total'], number_format)
             row += 1
 
-            # Calculate rubro origin totals (all activities in this rubro)
-            before_rubro_from_programa = sum(
-                data['programa'] for key, data in before_state.items()
-                if data['rubro_id'] == rubro_from.id
-            )
-            before_rubro_from_concurrente = sum(
-                data['concurrente'] for key, data in before_state.items()
-                if data['rubro_id'] == rubro_from.id
-            )
+            # Rubro origin totals (all activities in this rubro)
+            before_rubro_from_programa, before_rubro_from_concurrente = before_state['rubro_from']
             before_rubro_from_total = before_rubro_from_programa + before_rubro_from_concurrente
-
-            after_rubro_from_programa = sum(
-                data['programa'] for key, data in after_state.items()
-                if data['rubro_id'] == rubro_from.id
-            )
-            after_rubro_from_concurrente = sum(
-                data['concurrente'] for key, data in after_state.items()
-                if data['rubro_id'] == rubro_from.id
-            )
+            after_rubro_from_programa, after_rubro_from_concurrente = after_state['rubro_from']
             after_rubro_from_total = after_rubro_from_programa + after_rubro_from_concurrente
 
             # Rubro origin total
@@ -833,8 +965,8 @@ class SecBudgetTransfer(models.Model):
             row += 1
 
             # Destination activity line
-            before_to = before_state.get(key_to, {'programa': 0.0, 'concurrente': 0.0, 'total': 0.0})
-            after_to = after_state.get(key_to, {'programa': 0.0, 'concurrente': 0.0, 'total': 0.0})
+            before_to = before_state['to']
+            after_to = after_state['to']
 
             worksheet.write(row, 0, f'  {line_to.activity_id.name}', cell_format)
             worksheet.write(row, 1, 'Actividad', cell_format)
@@ -846,25 +978,10 @@ class SecBudgetTransfer(models.Model):
             worksheet.write(row, 7, after_to['total'], number_format)
             row += 1
 
-            # Calculate rubro destination totals (all activities in this rubro)
-            before_rubro_to_programa = sum(
-                data['programa'] for key, data in before_state.items()
-                if data['rubro_id'] == rubro_to.id
-            )
-            before_rubro_to_concurrente = sum(
-                data['concurrente'] for key, data in before_state.items()
-                if data['rubro_id'] == rubro_to.id
-            )
+            # Rubro destination totals (all activities in this rubro)
+            before_rubro_to_programa, before_rubro_to_concurrente = before_state['rubro_to']
             before_rubro_to_total = before_rubro_to_programa + before_rubro_to_concurrente
-
-            after_rubro_to_programa = sum(
-                data['programa'] for key, data in after_state.items()
-                if data['rubro_id'] == rubro_to.id
-            )
-            after_rubro_to_concurrente = sum(
-                data['concurrente'] for key, data in after_state.items()
-                if data['rubro_id'] == rubro_to.id
-            )
+            after_rubro_to_programa, after_rubro_to_concurrente = after_state['rubro_to']
             after_rubro_to_total = after_rubro_to_programa + after_rubro_to_concurrente
 
             # Rubro destination total
@@ -877,23 +994,3 @@ class SecBudgetTransfer(models.Model):
             worksheet.write(row, 6, after_rubro_to_concurrente, total_format)
             worksheet.write(row, 7, after_rubro_to_total, total_format)
             row += 2  # Extra space between transfers
-
-        workbook.close()
-
-        # Create attachment
-        filename = f"historial_transferencias_{stage.name}_{fields.Date.today()}.xlsx"
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(output.getvalue()),
-            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        })
-
-        output.close()
-
-        # Return download action
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'self',
-        }
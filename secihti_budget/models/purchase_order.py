@@ -2,14 +2,25 @@
 from odoo import api, fields, models, _
 from odoo.tools import float_round
 
+# Campos de la orden que alteran su aportación a la ejecución SECIHTI.
+SEC_EXECUTION_FIELDS = (
+    "state",
+    "sec_project_id",
+    "sec_stage_id",
+    "sec_activity_id",
+    "sec_rubro_id",
+    "sec_total_mxn_manual",
+)
+
 
 class PurchaseOrder(models.Model):
     _inherit = "purchase.order"
 
+    # sec_project_id y sec_stage_id se indexan con los índices compuestos de init().
     sec_project_id = fields.Many2one("sec.project", string="Proyecto SECIHTI")
     sec_stage_id = fields.Many2one("sec.stage", string="Etapa SECIHTI")
-    sec_activity_id = fields.Many2one("sec.activity", string="Actividad SECIHTI")
-    sec_rubro_id = fields.Many2one("sec.rubro", string="Rubro SECIHTI")
+    sec_activity_id = fields.Many2one("sec.activity", string="Actividad SECIHTI", index=True)
+    sec_rubro_id = fields.Many2one("sec.rubro", string="Rubro SECIHTI", index=True)
     sec_bank_statement_verified = fields.Boolean(
         string="Gasto verificado en estado de cuenta",
         help="Indica si el gasto ya fue contrastado contra el estado de cuenta bancario.",
@@ -62,6 +73,30 @@ class PurchaseOrder(models.Model):
         if field and isinstance(field.selection, list) and new_option not in field.selection:
             field.selection.append(new_option)"""
 
+    def init(self):
+        super().init()
+        # Los cómputos de ejecución, los asistentes de exportación y los
+        # read_group del proyecto filtran siempre por estos campos y el estado.
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS purchase_order_sec_project_state_idx
+                ON purchase_order (sec_project_id, state)
+            """
+        )
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS purchase_order_sec_stage_rubro_state_idx
+                ON purchase_order (sec_stage_id, sec_rubro_id, state)
+            """
+        )
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS purchase_order_sec_mxn_pending_idx
+                ON purchase_order (sec_project_id, state)
+                WHERE sec_mxn_pending = true
+            """
+        )
+
     def _ensure_budget_line_for_activity_rubro(self):
         """Si la actividad no tiene subpartida para el rubro, crearla con montos en 0."""
         for order in self:
@@ -83,6 +118,62 @@ class PurchaseOrder(models.Model):
 
     
 
+    def _sec_execution_ledger_values(self):
+        """Valores de la bitácora de ejecución, o False si la orden no aporta."""
+        self.ensure_one()
+        amount_mxn = self.sec_total_mxn_manual or 0.0
+        if self.state not in ("purchase", "done") or not self.sec_project_id:
+            return False
+        if amount_mxn <= 0.0:
+            return False
+        activity = self.sec_activity_id
+        stage = self.sec_stage_id or activity.stage_id
+        return {
+            "project_id": self.sec_project_id.id,
+            "stage_id": stage.id,
+            "activity_id": activity.id,
+            "rubro_id": self.sec_rubro_id.id,
+            "amount_mxn": amount_mxn,
+        }
+
+    def _sec_sync_execution_ledger(self):
+        """Actualiza solo las filas de la bitácora de estas órdenes."""
+        Ledger = self.env["sec.execution.ledger"].sudo()
+        entries = Ledger.search([("purchase_order_id", "in", self.ids)])
+        entry_by_order = {entry.purchase_order_id.id: entry for entry in entries}
+        to_create = []
+        to_unlink = Ledger
+        to_assign = Ledger
+        for order in self:
+            vals = order._sec_execution_ledger_values()
+            entry = entry_by_order.get(order.id)
+            if not vals:
+                if entry:
+                    to_unlink |= entry
+                continue
+            if not entry:
+                vals["purchase_order_id"] = order.id
+                to_create.append(vals)
+                continue
+            changed = {}
+            for fname, value in vals.items():
+                current = entry[fname]
+                if isinstance(current, models.BaseModel):
+                    current = current.id
+                if current != value:
+                    changed[fname] = value
+            if changed:
+                entry.write(changed)
+                if "activity_id" in changed or "rubro_id" in changed:
+                    to_assign |= entry
+        if to_unlink:
+            to_unlink.unlink()
+        if to_create:
+            to_assign |= Ledger.create(to_create)
+        to_assign._assign_budget_lines()
+        self.env["sec.project"]._invalidate_execution_cache()
+        self.env["sec.rubro.dashboard"]._schedule_refresh()
+
     @api.depends("sec_project_id", "currency_id", "sec_total_mxn_manual", "amount_total", "state")
     def _compute_sec_mxn_pending(self):
         for order in self:
@@ -206,6 +297,7 @@ class PurchaseOrder(models.Model):
         # Sincroniza manual MXN si aplica
         order._sync_mxn_manual_if_needed()
         order._add_sec_bank_fee_line_if_needed()
+        order._sec_sync_execution_ledger()
         return order
 
     def write(self, vals):
@@ -228,6 +320,14 @@ class PurchaseOrder(models.Model):
         ):
             for order in self:
                 order._add_sec_bank_fee_line_if_needed()
+        if any(k in vals for k in SEC_EXECUTION_FIELDS):
+            self._sec_sync_execution_ledger()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        # La bitácora se elimina en cascada; descarta los agregados memorizados.
+        self.env["sec.project"]._invalidate_execution_cache()
         return res
 
 
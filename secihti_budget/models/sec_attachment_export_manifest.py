@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+
+from odoo import api, fields, models
+
+# Clave en ``cr.cache`` de las entradas ya decodificadas en la transacción.
+MANIFEST_ENTRIES_CACHE_KEY = "secihti_budget.manifest_entries"
+
+# Filtros de la exportación que determinan qué archivos abarca.
+MANIFEST_SCOPE_FIELDS = (
+    "project_id",
+    "date_from",
+    "date_to",
+    "state_filter",
+    "rubro_id",
+    "include_pending",
+    "export_attachments",
+    "export_purchase_orders",
+)
+
+
+class SecAttachmentExportManifest(models.Model):
+    """Contenido de una exportación de adjuntos terminada.
+
+    Guarda, por adjunto (su id) o PDF de orden (``pdf-<id>``), el checksum y
+    la ruta dentro del ZIP. Una exportación diferencial compara contra este
+    manifiesto y solo empaqueta lo nuevo o modificado; para eso ambas deben
+    abarcar lo mismo (mismos filtros), lo que se compara con ``scope_key``.
+    """
+    _name = "sec.attachment.export.manifest"
+    _description = "Manifiesto de exportación de adjuntos SECIHTI"
+    _order = "create_date desc, id desc"
+
+    name = fields.Char(string="Archivo", required=True, readonly=True)
+    project_id = fields.Many2one(
+        "sec.project", string="Proyecto", required=True, readonly=True,
+        ondelete="cascade", index=True,
+    )
+    export_mode = fields.Selection(
+        [
+            ("full", "Completa"),
+            ("delta", "Solo nuevos o modificados"),
+        ],
+        string="Tipo de exportación",
+        readonly=True,
+    )
+    base_manifest_id = fields.Many2one(
+        "sec.attachment.export.manifest",
+        string="Desde la exportación",
+        readonly=True,
+        ondelete="set null",
+    )
+    user_id = fields.Many2one("res.users", string="Usuario", readonly=True)
+    date_from = fields.Date(string="Fecha desde", readonly=True)
+    date_to = fields.Date(string="Fecha hasta", readonly=True)
+    state_filter = fields.Selection(
+        [
+            ("purchase,done", "Confirmado y recibido"),
+            ("purchase", "Solo confirmados"),
+            ("done", "Solo recibidos"),
+            ("all", "Todos los estados"),
+        ],
+        string="Estados",
+        readonly=True,
+    )
+    rubro_id = fields.Many2one(
+        "sec.rubro", string="Rubro / Tipo de gasto", readonly=True, ondelete="set null"
+    )
+    include_pending = fields.Boolean(string="Incluir MXN pendiente", readonly=True)
+    export_attachments = fields.Boolean(string="Adjuntos", readonly=True)
+    export_purchase_orders = fields.Boolean(
+        string="Órdenes de compra (PDF)", readonly=True
+    )
+    scope_key = fields.Char(string="Alcance", readonly=True, index=True)
+    entries = fields.Text(string="Entradas (JSON)", readonly=True)
+    entry_count = fields.Integer(string="Archivos", readonly=True)
+
+    def name_get(self):
+        return [
+            (
+                manifest.id,
+                "%s (%s)" % (
+                    manifest.name,
+                    fields.Datetime.to_string(manifest.create_date),
+                ),
+            )
+            for manifest in self
+        ]
+
+    @api.model
+    def _get_scope_key(self, values):
+        """Huella de los filtros de exportación en ``values``.
+
+        ``values`` trae los campos de ``MANIFEST_SCOPE_FIELDS`` con ids en los
+        many2one; dos exportaciones con la misma huella abarcan lo mismo.
+        """
+        scope = [
+            fields.Date.to_string(values.get(name)) if name in ("date_from", "date_to")
+            else values.get(name) or False
+            for name in MANIFEST_SCOPE_FIELDS
+        ]
+        return hashlib.sha1(json.dumps(scope).encode()).hexdigest()[:16]
+
+    def _set_entries(self, entries):
+        self.ensure_one()
+        self.write({"entries": json.dumps(entries), "entry_count": len(entries)})
+        return self
+
+    def _get_entries(self):
+        """``{clave: [checksum, ruta]}`` decodificado una vez por transacción.
+
+        El manifiesto no cambia tras crearse; el memo vive en ``cr.cache`` y
+        se descarta al hacer commit o rollback.
+        """
+        if not self:
+            return {}
+        cr = self.env.cr
+        cache = cr.cache.get(MANIFEST_ENTRIES_CACHE_KEY)
+        if cache is None:
+            cache = cr.cache[MANIFEST_ENTRIES_CACHE_KEY] = {}
+
+            def _discard():
+                cr.cache.pop(MANIFEST_ENTRIES_CACHE_KEY, None)
+
+            cr.after("commit", _discard)
+            cr.after("rollback", _discard)
+        if self.id not in cache:
+            entries = self.sudo().entries
+            cache[self.id] = json.loads(entries) if entries else {}
+        return cache[self.id]
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from odoo import api, fields, models
+
+
+class SecExecutionLedger(models.Model):
+    """Aportación de cada orden de compra a la ejecución del proyecto.
+
+    Se mantiene una fila por orden confirmada con monto MXN, de forma
+    incremental desde ``purchase.order``; los montos ejecutados se leen de
+    aquí en lugar de recorrer todas las órdenes del proyecto.
+    """
+    _name = "sec.execution.ledger"
+    _description = "Bitácora de ejecución SECIHTI"
+    _rec_name = "purchase_order_id"
+
+    purchase_order_id = fields.Many2one(
+        "purchase.order", required=True, ondelete="cascade", index=True
+    )
+    project_id = fields.Many2one(
+        "sec.project", required=True, ondelete="cascade", index=True
+    )
+    stage_id = fields.Many2one("sec.stage", ondelete="set null", index=True)
+    activity_id = fields.Many2one("sec.activity", ondelete="set null", index=True)
+    rubro_id = fields.Many2one("sec.rubro", ondelete="set null")
+    budget_line_id = fields.Many2one(
+        "sec.activity.budget.line", ondelete="set null", index=True
+    )
+    amount_mxn = fields.Float(string="Monto MXN")
+
+    _sql_constraints = [
+        (
+            "purchase_order_uniq",
+            "unique(purchase_order_id)",
+            "Cada orden de compra solo puede tener un registro de ejecución.",
+        ),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        entries = super().create(vals_list)
+        self.env["sec.project"]._invalidate_execution_cache()
+        entries._mark_sibling_lines()
+        return entries
+
+    def write(self, vals):
+        tracked = {"activity_id", "rubro_id", "amount_mxn"}
+        previous_keys = self._get_line_keys() if tracked & set(vals) else set()
+        res = super().write(vals)
+        if tracked & set(vals) or "project_id" in vals or "stage_id" in vals:
+            self.env["sec.project"]._invalidate_execution_cache()
+        if tracked & set(vals):
+            self._mark_sibling_lines(previous_keys)
+        return res
+
+    def unlink(self):
+        keys = self._get_line_keys()
+        res = super().unlink()
+        self.env["sec.project"]._invalidate_execution_cache()
+        self._mark_sibling_lines(keys)
+        return res
+
+    def _get_line_keys(self):
+        return {
+            (entry.activity_id.id, entry.rubro_id.id)
+            for entry in self
+            if entry.activity_id and entry.rubro_id
+        }
+
+    def _mark_sibling_lines(self, extra_keys=()):
+        """Marca para recálculo todas las líneas de cada (actividad, rubro).
+
+        La fila solo apunta a una línea (``budget_line_id``); si hay líneas
+        duplicadas con la misma actividad y rubro, también muestran la
+        ejecución compartida y deben recalcularse aunque no tengan filas.
+        """
+        keys = self.exists()._get_line_keys() | set(extra_keys)
+        if not keys:
+            return
+        lines = self.env["sec.activity.budget.line"].sudo().search(
+            [
+                ("activity_id", "in", list({key[0] for key in keys})),
+                ("rubro_id", "in", list({key[1] for key in keys})),
+            ]
+        )
+        siblings = lines.filtered(
+            lambda line: (line.activity_id.id, line.rubro_id.id) in keys
+        )
+        if siblings:
+            siblings.modified(["execution_ledger_ids"])
+
+    def _assign_budget_lines(self):
+        """Apunta cada fila a la línea presupuestal de su actividad y rubro.
+
+        Las dependencias de los montos ejecutados pasan por este enlace, de
+        modo que un cambio en una orden solo marca su línea, actividad,
+        etapa y proyecto.
+        """
+        if not self:
+            return
+        lines = self.env["sec.activity.budget.line"].sudo().search(
+            [
+                ("activity_id", "in", self.mapped("activity_id").ids),
+                ("rubro_id", "in", self.mapped("rubro_id").ids),
+            ],
+            order="id",
+        )
+        line_by_key = {}
+        for line in lines:
+            line_by_key.setdefault((line.activity_id.id, line.rubro_id.id), line.id)
+        to_write = defaultdict(lambda: self.browse())
+        for entry in self:
+            line_id = line_by_key.get((entry.activity_id.id, entry.rubro_id.id), False)
+            if entry.budget_line_id.id != line_id:
+                to_write[line_id] |= entry
+        for line_id, entries in to_write.items():
+            entries.write({"budget_line_id": line_id})
+
+    def init(self):
+        """Índice para los agregados por línea y carga inicial de la bitácora."""
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS sec_execution_ledger_activity_rubro_idx
+                ON sec_execution_ledger (activity_id, rubro_id)
+            """
+        )
+        # Solo agrega las órdenes que aún no tienen registro, así que es
+        # seguro ejecutarlo en cada actualización del módulo.
+        self.env.cr.execute(
+            """
+            INSERT INTO sec_execution_ledger (
+                purchase_order_id, project_id, stage_id, activity_id, rubro_id,
+                amount_mxn, create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                po.id,
+                po.sec_project_id,
+                COALESCE(po.sec_stage_id, a.stage_id),
+                po.sec_activity_id,
+                po.sec_rubro_id,
+                po.sec_total_mxn_manual,
+                %(uid)s, NOW() AT TIME ZONE 'UTC',
+                %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM purchase_order po
+            LEFT JOIN sec_activity a ON a.id = po.sec_activity_id
+            WHERE po.state IN ('purchase', 'done')
+              AND po.sec_project_id IS NOT NULL
+              AND po.sec_total_mxn_manual > 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM sec_execution_ledger l
+                  WHERE l.purchase_order_id = po.id
+              )
+            """,
+            {"uid": self.env.uid},
+        )
+        self.env.cr.execute(
+            """
+            UPDATE sec_execution_ledger l
+               SET budget_line_id = (
+                   SELECT MIN(bl.id) FROM sec_activity_budget_line bl
+                   WHERE bl.activity_id = l.activity_id
+                     AND bl.rubro_id = l.rubro_id
+               )
+             WHERE l.budget_line_id IS NULL
+               AND l.activity_id IS NOT NULL
+               AND l.rubro_id IS NOT NULL
+            """
+        )
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Parámetros del sistema (ir.config_parameter).
+JOB_MAX_RUNNING_PARAM = "secihti_budget.export_job_max_running"
+JOB_STALE_MINUTES_PARAM = "secihti_budget.export_job_stale_minutes"
+JOB_MAX_ATTEMPTS_PARAM = "secihti_budget.export_job_max_attempts"
+JOB_RETENTION_DAYS_PARAM = "secihti_budget.export_job_retention_days"
+
+# Candado consultivo para que dos ejecutores no tomen trabajos a la vez.
+JOB_CLAIM_LOCK = 7311020211
+
+# Solo se pueden encolar métodos con este prefijo...
+JOB_METHOD_PREFIX = "_job_"
+
+# ...de registros de estos modelos.
+JOB_SOURCE_MODELS = ("sec.attachment.export.wizard",)
+
+# Segundos mínimos entre dos señales de vida del mismo trabajo.
+JOB_HEARTBEAT_INTERVAL = 30
+
+# Última señal enviada por trabajo en este proceso (job_id -> monotonic).
+_last_heartbeats = {}
+
+
+class JobLostError(Exception):
+    """El trabajo ya no pertenece a este ejecutor (cancelado o reasignado)."""
+
+
+class SecExportJob(models.Model):
+    """Trabajo de exportación en segundo plano.
+
+    Los trabajos se ejecutan desde los ``ir.cron`` de ejecución (uno por
+    ranura), respetando un máximo de trabajos simultáneos. El método del
+    registro de origen recibe el trabajo y guarda su avance con
+    ``_save_checkpoint``; si el proceso muere, el trabajo se reanuda desde
+    el último punto guardado.
+    """
+    _name = "sec.export.job"
+    _description = "Trabajo de exportación SECIHTI"
+    _order = "id desc"
+
+    name = fields.Char(string="Descripción", required=True, readonly=True)
+    res_model = fields.Char(string="Modelo", required=True, readonly=True)
+    res_id = fields.Integer(string="Registro", required=True, readonly=True)
+    method_name = fields.Char(string="Método", required=True, readonly=True)
+    res_values = fields.Text(
+        string="Parámetros",
+        readonly=True,
+        help="Valores para volver a crear el registro de origen si era "
+        "transitorio y se eliminó antes de terminar el trabajo.",
+    )
+    runner_token = fields.Char(readonly=True, copy=False)
+    user_id = fields.Many2one(
+        "res.users", string="Usuario", required=True, readonly=True,
+        default=lambda self: self.env.user,
+    )
+    state = fields.Selection(
+        [
+            ("pending", "En cola"),
+            ("running", "En ejecución"),
+            ("done", "Terminado"),
+            ("failed", "Fallido"),
+            ("cancelled", "Cancelado"),
+        ],
+        default="pending",
+        required=True,
+        readonly=True,
+        index=True,
+    )
+    progress = fields.Float(string="Avance (%)", readonly=True)
+    progress_message = fields.Char(string="Progreso", readonly=True)
+    error_message = fields.Text(string="Mensaje de error", readonly=True)
+    checkpoint = fields.Text(string="Punto de control", readonly=True)
+    attempts = fields.Integer(string="Intentos", readonly=True)
+    heartbeat = fields.Datetime(string="Última señal", readonly=True)
+    date_started = fields.Datetime(string="Inicio", readonly=True)
+    date_done = fields.Datetime(string="Fin", readonly=True)
+    attachment_ids = fields.Many2many(
+        "ir.attachment",
+        "sec_export_job_attachment_rel",
+        "job_id",
+        "attachment_id",
+        string="Archivos",
+        readonly=True,
+    )
+
+    # ------------------------------------------------------------------
+    # Encolado
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _enqueue(self, record, method_name, name):
+        """Encola ``record.<method_name>(job)`` y despierta a los ejecutores."""
+        record.ensure_one()
+        self._check_job_target(record._name, method_name)
+        res_values = False
+        if record._transient and hasattr(record, "_get_job_values"):
+            res_values = json.dumps(record._get_job_values())
+        job = self.sudo().create({
+            "name": name,
+            "res_model": record._name,
+            "res_id": record.id,
+            "res_values": res_values,
+            "method_name": method_name,
+            "user_id": self.env.uid,
+        })
+        self._trigger_runners()
+        return job
+
+    @api.model
+    def _check_job_target(self, res_model, method_name):
+        """Valida que ``res_model.method_name`` sea un método de trabajo.
+
+        Se comprueba al encolar y de nuevo al ejecutar: el trabajo corre con
+        el usuario que lo encoló y no debe poder apuntar a otro método.
+        """
+        if (
+            res_model not in JOB_SOURCE_MODELS
+            or res_model not in self.env
+            or not (method_name or "").startswith(JOB_METHOD_PREFIX)
+            or not callable(getattr(self.env[res_model], method_name, None))
+        ):
+            raise UserError(
+                _("Método de trabajo no válido: %s.%s") % (res_model, method_name)
+            )
+
+    @api.model
+    def _trigger_runners(self):
+        crons = self.env["ir.cron"].sudo().search([
+            ("model_id.model", "=", self._name),
+            ("code", "=like", "model._cron_run_jobs%"),
+        ])
+        for cron in crons:
+            cron._trigger()
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_max_running(self):
+        value = self.env["ir.config_parameter"].sudo().get_param(JOB_MAX_RUNNING_PARAM, "2")
+        return max(int(value), 1)
+
+    @api.model
+    def _cron_run_jobs(self):
+        """Toma y ejecuta trabajos en cola mientras haya cupo."""
+        while True:
+            job = self._claim_next_job()
+            if not job:
+                return
+            job._run()
+
+    @api.model
+    def _claim_next_job(self):
+        """Reserva el siguiente trabajo en cola, o nada si no hay cupo.
+
+        El trabajo devuelto lleva en su contexto la ficha del ejecutor; solo
+        quien la tiene puede guardar avance o terminarlo.
+        """
+        cr = self.env.cr
+        self._requeue_stale_jobs()
+        cr.execute("SELECT pg_try_advisory_xact_lock(%s)", (JOB_CLAIM_LOCK,))
+        if not cr.fetchone()[0]:
+            cr.commit()
+            return self.browse()
+        cr.execute("SELECT COUNT(*) FROM sec_export_job WHERE state = 'running'")
+        if cr.fetchone()[0] >= self._get_max_running():
+            cr.commit()
+            return self.browse()
+        cr.execute(
+            """
+            SELECT id FROM sec_export_job
+             WHERE state = 'pending'
+             ORDER BY id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+            """
+        )
+        row = cr.fetchone()
+        if not row:
+            cr.commit()
+            return self.browse()
+        job = self.browse(row[0])
+        now = fields.Datetime.now()
+        token = uuid.uuid4().hex
+        job.write({
+            "state": "running",
+            "runner_token": token,
+            "heartbeat": now,
+            "date_started": job.date_started or now,
+            "attempts": job.attempts + 1,
+            "error_message": False,
+        })
+        cr.commit()
+        return job.with_context(sec_export_job_token=token)
+
+    @api.model
+    def _requeue_stale_jobs(self):
+        """Devuelve a la cola los trabajos cuyo proceso dejó de dar señales."""
+        params = self.env["ir.config_parameter"].sudo()
+        stale_minutes = int(params.get_param(JOB_STALE_MINUTES_PARAM, "15"))
+        max_attempts = int(params.get_param(JOB_MAX_ATTEMPTS_PARAM, "3"))
+        limit = fields.Datetime.now() - timedelta(minutes=stale_minutes)
+        stale = self.search([("state", "=", "running"), ("heartbeat", "<", limit)])
+        if not stale:
+            return
+        exhausted = stale.filtered(lambda job: job.attempts >= max_attempts)
+        exhausted.write({
+            "state": "failed",
+            "error_message": _("El trabajo se interrumpió demasiadas veces."),
+            "date_done": fields.Datetime.now(),
+        })
+        exhausted._discard_partial_files()
+        (stale - exhausted).write({"state": "pending", "runner_token": False})
+        _logger.warning("Trabajos de exportación reanudables: %s", (stale - exhausted).ids)
+        self.env.cr.commit()
+
+    def _run(self):
+        self.ensure_one()
+        try:
+            self._check_job_target(self.res_model, self.method_name)
+            record = self._get_source_record()
+            getattr(record, self.method_name)(self.with_user(self.user_id))
+            self._check_ownership()
+        except JobLostError:
+            # Otro ejecutor o una cancelación tomaron el trabajo: no se
+            # escribe nada de esta ejecución.
+            self.env.cr.rollback()
+            self.env.clear()
+            _logger.info("Trabajo de exportación %s abandonado por este ejecutor.", self.id)
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            self.env.cr.rollback()
+            self.env.clear()
+            _logger.exception("Falló el trabajo de exportación %s", self.id)
+            try:
+                self._check_ownership()
+            except JobLostError:
+                self.env.cr.rollback()
+                return
+            self.write({
+                "state": "failed",
+                "runner_token": False,
+                "error_message": str(exc),
+                "date_done": fields.Datetime.now(),
+            })
+            self._discard_partial_files()
+            if self.res_model in JOB_SOURCE_MODELS:
+                record = self.env[self.res_model].with_user(self.user_id).browse(self.res_id)
+                if record.exists() and hasattr(record, "_on_job_failed"):
+                    record._on_job_failed(self, exc)
+            self.env.cr.commit()
+            return
+        finally:
+            _last_heartbeats.pop(self.id, None)
+        self.write({
+            "state": "done",
+            "runner_token": False,
+            "progress": 100.0,
+            "date_done": fields.Datetime.now(),
+        })
+        self.env.cr.commit()
+
+    def _get_source_record(self):
+        """Registro de origen; si era transitorio y se eliminó, se recrea."""
+        Model = self.env[self.res_model].with_user(self.user_id)
+        record = Model.browse(self.res_id).exists()
+        if record:
+            return record
+        if not self.res_values:
+            raise UserError(_("El registro de origen ya no existe."))
+        values = json.loads(self.res_values)
+        if "job_id" in Model._fields:
+            values["job_id"] = self.id
+        record = Model.create(values)
+        self.write({"res_id": record.id})
+        # Se confirma ya: la señal de vida usa otro cursor y no debe esperar
+        # el bloqueo de esta fila.
+        self.env.cr.commit()
+        return record
+
+    # ------------------------------------------------------------------
+    # API para los métodos de trabajo
+    # ------------------------------------------------------------------
+
+    def _get_checkpoint(self):
+        self.ensure_one()
+        return json.loads(self.checkpoint) if self.checkpoint else {}
+
+    def _check_ownership(self, cr=None):
+        """Renueva la señal de vida si el trabajo sigue siendo de este ejecutor.
+
+        Lanza ``JobLostError`` si se canceló o se devolvió a la cola (y quizá
+        lo tomó otro ejecutor) desde que este lo reservó.
+        """
+        self.ensure_one()
+        cr = cr or self.env.cr
+        cr.execute(
+            """
+            UPDATE sec_export_job
+               SET heartbeat = %s
+             WHERE id = %s AND state = 'running' AND runner_token = %s
+            """,
+            (fields.Datetime.now(), self.id, self.env.context.get("sec_export_job_token")),
+        )
+        if not cr.rowcount:
+            raise JobLostError()
+
+    def _heartbeat(self):
+        """Señal de vida durante un tramo largo, sin confirmar el trabajo en curso.
+
+        Usa un cursor propio y se limita a una cada ``JOB_HEARTBEAT_INTERVAL``
+        segundos; los métodos de trabajo pueden llamarla en cada elemento.
+        """
+        self.ensure_one()
+        now = time.monotonic()
+        if now - _last_heartbeats.get(self.id, 0.0) < JOB_HEARTBEAT_INTERVAL:
+            return
+        with self.pool.cursor() as cr:
+            self._check_ownership(cr)
+        _last_heartbeats[self.id] = now
+
+    def _save_checkpoint(self, data=None, progress=None, message=None):
+        """Guarda el avance y lo confirma en la base de datos.
+
+        Todo lo hecho antes de esta llamada queda persistido; si el proceso
+        muere después, el trabajo se reanuda desde ``data``.
+        """
+        self.ensure_one()
+        self._check_ownership()
+        vals = {}
+        if data is not None:
+            vals["checkpoint"] = json.dumps(data)
+        if progress is not None:
+            vals["progress"] = progress
+        if message is not None:
+            vals["progress_message"] = message
+        self.sudo().write(vals)
+        self.env.cr.commit()
+
+    def _get_partial_files(self):
+        """Archivos del trabajo que no son su resultado (partes, volúmenes a medias)."""
+        return self.env["ir.attachment"].sudo().search([
+            ("res_model", "=", self._name),
+            ("res_id", "in", self.ids),
+            ("id", "not in", self.sudo().mapped("attachment_ids").ids),
+        ])
+
+    def _discard_partial_files(self):
+        """Elimina los archivos intermedios; el trabajo empezará de cero."""
+        self._get_partial_files().unlink()
+        self.sudo().write({"checkpoint": False, "progress": 0.0})
+
+    def _set_result(self, attachments):
+        self.ensure_one()
+        self.sudo().write({
+            "attachment_ids": [(6, 0, attachments.ids)],
+            "checkpoint": False,
+        })
+
+    # ------------------------------------------------------------------
+    # Acciones
+    # ------------------------------------------------------------------
+
+    # Los usuarios no escriben en los trabajos: las acciones validan que
+    # puedan verlos (regla por usuario) y escriben como superusuario.
+
+    def action_cancel(self):
+        self.check_access_rule("read")
+        # Un trabajo en ejecución se detiene en su siguiente señal de vida.
+        jobs = self.filtered(lambda job: job.state in ("pending", "running", "failed")).sudo()
+        jobs.write({"state": "cancelled", "runner_token": False})
+        jobs._discard_partial_files()
+        return True
+
+    def action_retry(self):
+        self.check_access_rule("read")
+        self.filtered(lambda job: job.state in ("failed", "cancelled")).sudo().write(
+            {"state": "pending", "attempts": 0, "error_message": False}
+        )
+        self._trigger_runners()
+        return True
+
+    def action_download(self):
+        self.ensure_one()
+        if not self.attachment_ids:
+            raise UserError(_("El trabajo no tiene archivos para descargar."))
+        return {
+            "type": "ir.actions.act_url",
+            "url": "/web/content/%s?download=true" % self.attachment_ids[0].id,
+            "target": "self",
+        }
+
+    def unlink(self):
+        attachments = self.sudo().mapped("attachment_ids") | self._get_partial_files()
+        res = super().unlink()
+        attachments.unlink()
+        return res
+
+    # ------------------------------------------------------------------
+    # Limpieza
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _cron_purge_jobs(self):
+        """Elimina los trabajos terminados, fallidos o cancelados y sus archivos.
+
+        Se conservan ``JOB_RETENTION_DAYS_PARAM`` días (7 por defecto) desde
+        su última modificación.
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        days = int(params.get_param(JOB_RETENTION_DAYS_PARAM, "7"))
+        limit = fields.Datetime.now() - timedelta(days=days)
+        jobs = self.sudo().search([
+            ("state", "in", ["done", "failed", "cancelled"]),
+            ("write_date", "<", limit),
+        ])
+        if jobs:
+            jobs.unlink()
+            _logger.info("Trabajos de exportación eliminados: %d", len(jobs))
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from odoo import _, fields, models, tools
+from odoo.exceptions import UserError
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover
+    xlsxwriter = None
+
+_logger = logging.getLogger(__name__)
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Tamaño de bloque para leer/copiar archivos sin cargarlos completos.
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+
+class SecExportMixin(models.AbstractModel):
+    """Destino común de las exportaciones SECIHTI.
+
+    Los libros se escriben con xlsxwriter en modo ``constant_memory`` sobre
+    un archivo temporal y el resultado se guarda directamente como
+    ``ir.attachment`` en el filestore, sin pasar por base64 ni por un campo
+    Binary del asistente.
+    """
+    _name = "sec.export.mixin"
+    _description = "Exportación SECIHTI"
+
+    attachment_id = fields.Many2one(
+        "ir.attachment", string="Archivo", readonly=True, ondelete="set null"
+    )
+    filename = fields.Char(string="Nombre de archivo", readonly=True)
+
+    # ------------------------------------------------------------------
+    # Control interno
+    # ------------------------------------------------------------------
+
+    @tools.ormcache()
+    def _is_control_interno_installed(self):
+        """Indica si ``om_control_interno`` está instalado.
+
+        Se guarda en la caché del registro, que se reinicia al instalar o
+        desinstalar módulos.
+        """
+        module = self.env["ir.module.module"].sudo().search(
+            [("name", "=", "om_control_interno"), ("state", "=", "installed")],
+            limit=1,
+        )
+        return bool(module)
+
+    def _get_control_interno_lines_by_order(self, orders):
+        """Líneas de control interno de ``orders`` agrupadas por orden.
+
+        Se leen con una sola búsqueda; devuelve ``{order_id: líneas}`` y las
+        órdenes sin líneas no aparecen en el diccionario.
+        """
+        if not orders or not self._is_control_interno_installed():
+            return {}
+        if "costos.gastos.line" not in self.env:
+            return {}
+        CostosGastosLine = self.env["costos.gastos.line"]
+        lines_by_order = {}
+        for line in CostosGastosLine.search([("orden_compra_id", "in", orders.ids)]):
+            order_id = line.orden_compra_id.id
+            lines_by_order[order_id] = lines_by_order.get(order_id, CostosGastosLine) | line
+        return lines_by_order
+
+    # ------------------------------------------------------------------
+    # Conjunto de datos de órdenes de compra
+    # ------------------------------------------------------------------
+
+    def _get_purchase_order_dataset(self, domain, order="date_order asc", with_lines=False):
+        """Lee las órdenes de ``domain`` en forma de columnas.
+
+        Devuelve ``{"size": n, "columns": {columna: [valores]}}`` con los
+        datos de la orden, los nombres ya resueltos de proveedor, proyecto,
+        etapa, actividad, rubro y moneda, y el reparto Programa/Concurrente
+        calculado una sola vez. Se usan unas cuantas lecturas por modelo en
+        lugar de recorrer las relaciones orden por orden. Con
+        ``with_lines`` se agrega ``"lines"``: ``{order_id: [líneas]}``.
+        """
+        orders = self.env["purchase.order"].search(domain, order=order)
+        records = orders.read(
+            [
+                "name",
+                "date_order",
+                "partner_id",
+                "sec_project_id",
+                "sec_stage_id",
+                "sec_activity_id",
+                "sec_rubro_id",
+                "currency_id",
+                "amount_total",
+                "amount_untaxed",
+                "amount_tax",
+                "sec_effective_mxn",
+                "sec_mxn_pending",
+                "notes",
+            ],
+            load=None,
+        )
+        partners = self._read_names("res.partner", records, "partner_id")
+        currencies = self._read_names("res.currency", records, "currency_id")
+        projects = {
+            project["id"]: project
+            for project in self.env["sec.project"].browse(
+                {record["sec_project_id"] for record in records if record["sec_project_id"]}
+            ).read(["name", "code", "pct_programa", "pct_concurrente"], load=None)
+        }
+        stages = self._read_labels("sec.stage", records, "sec_stage_id")
+        activities = self._read_labels("sec.activity", records, "sec_activity_id")
+        rubros = self._read_rubros(records)
+
+        columns = {
+            "id": [],
+            "name": [],
+            "date_order": [],
+            "partner_name": [],
+            "project_id": [],
+            "project_label": [],
+            "stage_id": [],
+            "stage_label": [],
+            "activity_id": [],
+            "activity_label": [],
+            "rubro_id": [],
+            "rubro_name": [],
+            "rubro_label": [],
+            "tipo_gasto_label": [],
+            "currency_name": [],
+            "amount_total": [],
+            "amount_untaxed": [],
+            "amount_tax": [],
+            "amount_mxn": [],
+            "programa": [],
+            "concurrente": [],
+            "total": [],
+            "mxn_pending": [],
+            "notes": [],
+        }
+        empty_rubro = {"name": "", "label": "", "tipo_gasto_label": ""}
+        for record in records:
+            project = projects.get(record["sec_project_id"])
+            rubro = rubros.get(record["sec_rubro_id"], empty_rubro)
+            amount_mxn = record["sec_effective_mxn"] or 0.0
+            programa = concurrente = 0.0
+            if project:
+                programa = amount_mxn * (project["pct_programa"] / 100.0)
+                concurrente = amount_mxn * (project["pct_concurrente"] / 100.0)
+            columns["id"].append(record["id"])
+            columns["name"].append(record["name"])
+            columns["date_order"].append(record["date_order"])
+            columns["partner_name"].append(partners.get(record["partner_id"], ""))
+            columns["project_id"].append(record["sec_project_id"])
+            columns["project_label"].append(self._format_label(project))
+            columns["stage_id"].append(record["sec_stage_id"])
+            columns["stage_label"].append(stages.get(record["sec_stage_id"], ""))
+            columns["activity_id"].append(record["sec_activity_id"])
+            columns["activity_label"].append(activities.get(record["sec_activity_id"], ""))
+            columns["rubro_id"].append(record["sec_rubro_id"])
+            columns["rubro_name"].append(rubro["name"])
+            columns["rubro_label"].append(rubro["label"])
+            columns["tipo_gasto_label"].append(rubro["tipo_gasto_label"])
+            columns["currency_name"].append(currencies.get(record["currency_id"], ""))
+            columns["amount_total"].append(record["amount_total"] or 0.0)
+            columns["amount_untaxed"].append(record["amount_untaxed"] or 0.0)
+            columns["amount_tax"].append(record["amount_tax"] or 0.0)
+            columns["amount_mxn"].append(amount_mxn)
+            columns["programa"].append(programa)
+            columns["concurrente"].append(concurrente)
+            columns["total"].append(programa + concurrente)
+            columns["mxn_pending"].append(record["sec_mxn_pending"])
+            columns["notes"].append(record["notes"] or "")
+
+        dataset = {"size": len(records), "columns": columns}
+        if with_lines:
+            dataset["lines"] = self._read_purchase_order_lines(orders)
+        return dataset
+
+    @staticmethod
+    def _dataset_rows(dataset, mask=None):
+        """Recorre el conjunto como filas (dict); ``mask`` filtra por posición."""
+        columns = dataset["columns"]
+        names = list(columns)
+        for index in range(dataset["size"]):
+            if mask is not None and not mask[index]:
+                continue
+            yield {name: columns[name][index] for name in names}
+
+    def _read_names(self, model, records, fname):
+        ids = {record[fname] for record in records if record[fname]}
+        return {
+            record["id"]: record["name"] or ""
+            for record in self.env[model].browse(ids).read(["name"], load=None)
+        }
+
+    def _read_labels(self, model, records, fname):
+        ids = {record[fname] for record in records if record[fname]}
+        return {
+            record["id"]: self._format_label(record)
+            for record in self.env[model].browse(ids).read(["name", "code"], load=None)
+        }
+
+    def _read_rubros(self, records):
+        Rubro = self.env["sec.rubro"]
+        selection = dict(Rubro._fields["tipo_gasto"].selection)
+        ids = {record["sec_rubro_id"] for record in records if record["sec_rubro_id"]}
+        rubros = {}
+        for rubro in Rubro.browse(ids).read(["name", "tipo_gasto"], load=None):
+            tipo_gasto_label = selection.get(rubro["tipo_gasto"], "") if rubro["tipo_gasto"] else ""
+            rubros[rubro["id"]] = {
+                "name": rubro["name"] or "",
+                "label": "%s / %s" % (rubro["name"], selection.get(rubro["tipo_gasto"], "")),
+                "tipo_gasto_label": tipo_gasto_label,
+            }
+        return rubros
+
+    def _read_purchase_order_lines(self, orders):
+        """Líneas de ``orders`` agrupadas por orden, en el orden de ``order_line``."""
+        Line = self.env["purchase.order.line"]
+        lines = Line.search([("order_id", "in", orders.ids)], order=Line._order).read(
+            ["order_id", "name", "product_id", "product_qty", "price_unit", "price_subtotal"],
+            load=None,
+        )
+        product_names = dict(
+            self.env["product.product"].browse(
+                {line["product_id"] for line in lines if line["product_id"]}
+            ).name_get()
+        )
+        lines_by_order = {}
+        for line in lines:
+            lines_by_order.setdefault(line["order_id"], []).append({
+                "name": line["name"] or "",
+                "product_name": product_names.get(line["product_id"], ""),
+                "product_qty": line["product_qty"] or 0,
+                "price_unit": line["price_unit"] or 0.0,
+                "price_subtotal": line["price_subtotal"] or 0.0,
+            })
+        return lines_by_order
+
+    @staticmethod
+    def _format_label(values):
+        """``código – nombre`` a partir de un dict leído (o vacío)."""
+        if not values:
+            return ""
+        name = values.get("name") or ""
+        code = values.get("code")
+        if code:
+            return "%s – %s" % (code, name)
+        return name
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def _new_export_path(self, suffix):
+        """Ruta de un archivo temporal vacío para escribir la exportación."""
+        handle, path = tempfile.mkstemp(prefix="sec_export_", suffix=suffix)
+        os.close(handle)
+        return path
+
+    def _remove_export_path(self, path):
+        """Elimina el archivo temporal ``path`` si todavía existe.
+
+        Quien crea la ruta la elimina en un ``finally``, de modo que un error
+        al escribir o guardar no deja archivos huérfanos en el disco.
+        """
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            _logger.warning("No se pudo eliminar el archivo temporal %s", path)
+
+    def _new_xlsx_workbook(self, path):
+        """Libro sobre ``path`` en modo de memoria constante.
+
+        En este modo las filas de cada hoja deben escribirse en orden.
+        """
+        if not xlsxwriter:
+            raise UserError(_("No está disponible la librería xlsxwriter."))
+        return xlsxwriter.Workbook(
+            path, {"constant_memory": True, "tmpdir": tempfile.gettempdir()}
+        )
+
+    # ------------------------------------------------------------------
+    # Almacenamiento
+    # ------------------------------------------------------------------
+
+    def _store_export_file(self, path, filename, mimetype, res_model=False, res_id=False):
+        """Guarda ``path`` como adjunto y elimina el archivo temporal."""
+        Attachment = self.env["ir.attachment"].sudo()
+        try:
+            vals = {
+                "name": filename,
+                "type": "binary",
+                "mimetype": mimetype,
+                "res_model": res_model,
+                "res_id": res_id,
+            }
+            if Attachment._storage() == "file":
+                stored = self._copy_to_filestore(path)
+                attachment = Attachment.create(
+                    dict(vals, store_fname=stored["store_fname"])
+                )
+                # ``ir.attachment`` ignora checksum y tamaño en create/write
+                # porque normalmente los calcula a partir del contenido.
+                self.env.cr.execute(
+                    "UPDATE ir_attachment SET checksum = %s, file_size = %s WHERE id = %s",
+                    (stored["checksum"], stored["file_size"], attachment.id),
+                )
+                attachment.invalidate_cache(["checksum", "file_size"])
+            else:
+                with open(path, "rb") as handle:
+                    vals["raw"] = handle.read()
+                attachment = Attachment.create(vals)
+        finally:
+            self._remove_export_path(path)
+        return attachment.sudo(False)
+
+    def _copy_to_filestore(self, path):
+        """Copia ``path`` al filestore por bloques.
+
+        Devuelve los valores de almacenamiento del adjunto (``store_fname``,
+        ``checksum`` y ``file_size``), calculados igual que ``ir.attachment``.
+        """
+        Attachment = self.env["ir.attachment"].sudo()
+        sha = hashlib.sha1()
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(EXPORT_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        checksum = sha.hexdigest()
+        fname = "%s/%s" % (checksum[:2], checksum)
+        full_path = Attachment._full_path(fname)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            shutil.copyfile(path, full_path)
+            Attachment._mark_for_gc(fname)
+        return {
+            "store_fname": fname,
+            "checksum": checksum,
+            "file_size": os.path.getsize(path),
+        }
+
+    def _set_export_result(self, path, filename, mimetype):
+        """Guarda el archivo en el asistente, reemplazando el anterior."""
+        self.ensure_one()
+        previous = self.attachment_id
+        attachment = self._store_export_file(
+            path, filename, mimetype, res_model=self._name, res_id=self.id
+        )
+        self.write({"attachment_id": attachment.id, "filename": filename})
+        if previous:
+            previous.sudo().unlink()
+        return attachment
+
+    # ------------------------------------------------------------------
+    # Acciones
+    # ------------------------------------------------------------------
+
+    def _get_download_action(self, attachment):
+        return {
+            "type": "ir.actions.act_url",
+            "url": "/web/content/%s?download=true" % attachment.id,
+            "target": "self",
+        }
+
+    def action_download(self):
+        self.ensure_one()
+        if not self.attachment_id:
+            raise UserError(_("No hay archivo generado para descargar."))
+        return self._get_download_action(self.attachment_id)
+
+    def unlink(self):
+        # Los asistentes transitorios se limpian periódicamente; su archivo
+        # se elimina con ellos.
+        attachments = self.mapped("attachment_id")
+        res = super().unlink()
+        attachments.sudo().unlink()
+        return res
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import logging
+import uuid
 from collections import defaultdict
 
 from odoo import _, api, fields, models
@@ -9,6 +10,13 @@ from odoo.tools.misc import formatLang
 
 _logger = logging.getLogger(__name__)
 
+# Clave en ``cr.cache`` del memo de agregados de ejecución por transacción.
+EXECUTION_CACHE_KEY = "secihti_budget.execution_data"
+
+# Variable de sesión de PostgreSQL con la versión vigente del memo. Se fija
+# con ``set_config(..., true)``, que se deshace al volver a un savepoint.
+EXECUTION_VERSION_SETTING = "secihti_budget.execution_version"
+
 
 class SecRubro(models.Model):
     _name = "sec.rubro"
@@ -145,6 +153,7 @@ class SecProject(models.Model):
     )
     purchase_order_count = fields.Integer(compute="_compute_purchase_orders")
     purchase_pending_count = fields.Integer(compute="_compute_purchase_orders")
+    execution_ledger_ids = fields.One2many("sec.execution.ledger", "project_id")
 
     @api.constrains("pct_programa", "pct_concurrente")
     def _check_percentages(self):
@@ -163,14 +172,10 @@ class SecProject(models.Model):
             project.amount_stages_total = sum(project.stage_ids.mapped("amount_total"))
 
     @api.depends(
-        "stage_ids.exec_total",
-        "purchase_order_ids.state",
-        "purchase_order_ids.amount_total",
-        "purchase_order_ids.currency_id",
-        "purchase_order_ids.sec_total_mxn_manual",
-        "purchase_order_ids.sec_activity_id",
-        "purchase_order_ids.sec_stage_id",
-        "purchase_order_ids.sec_rubro_id",
+        "amount_total",
+        "pct_programa",
+        "pct_concurrente",
+        "execution_ledger_ids.amount_mxn",
     )
     def _compute_execution_amounts(self):
         execution = self._collect_execution_data()
@@ -249,59 +254,215 @@ class SecProject(models.Model):
         action["domain"] = domain
         return action
 
+    def write(self, vals):
+        res = super().write(vals)
+        if "pct_programa" in vals or "pct_concurrente" in vals:
+            self._invalidate_execution_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        # La bitácora se elimina en cascada.
+        self._invalidate_execution_cache()
+        return res
+
+    # ------------------------------------------------------------------
+    # Execution aggregates
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_execution_cache(self):
+        """Memo de agregados de ejecución compartido por la transacción.
+
+        Vive en ``cr.cache`` y se descarta al hacer commit o rollback. Cada
+        invalidación fija además una versión nueva en la base de datos; si un
+        ``ROLLBACK TO SAVEPOINT`` la deshace, ``_check_execution_cache`` lo
+        detecta y vacía el memo.
+        """
+        cr = self.env.cr
+        cache = cr.cache.get(EXECUTION_CACHE_KEY)
+        if cache is None:
+            cache = cr.cache[EXECUTION_CACHE_KEY] = {
+                "version": 0,
+                "token": None,
+                "entries": {},
+                "hits": 0,
+                "misses": 0,
+            }
+
+            def _discard():
+                cr.cache.pop(EXECUTION_CACHE_KEY, None)
+
+            cr.after("commit", _discard)
+            cr.after("rollback", _discard)
+        return cache
+
+    @api.model
+    def _check_execution_cache(self):
+        """Memo vigente: se vacía si la versión en la base de datos cambió."""
+        cache = self._get_execution_cache()
+        self.env.cr.execute(
+            "SELECT current_setting(%s, true)", (EXECUTION_VERSION_SETTING,)
+        )
+        token = self.env.cr.fetchone()[0] or None
+        if cache["token"] != token:
+            cache["token"] = token
+            cache["entries"].clear()
+        return cache
+
+    @api.model
+    def _invalidate_execution_cache(self):
+        """Descarta los agregados memorizados tras un cambio en la ejecución."""
+        cache = self._get_execution_cache()
+        cache["version"] += 1
+        cache["entries"].clear()
+        # Un valor único: tras volver a un savepoint no se confunde con otro.
+        cache["token"] = uuid.uuid4().hex
+        self.env.cr.execute(
+            "SELECT set_config(%s, %s, true)", (EXECUTION_VERSION_SETTING, cache["token"])
+        )
+
+    @api.model
+    def _get_execution_cache_stats(self):
+        cache = self._get_execution_cache()
+        return {"hits": cache["hits"], "misses": cache["misses"], "version": cache["version"]}
+
     @api.model
     def _collect_execution_data(self, stage_ids=None, activity_ids=None, line_ids=None):
+        """Montos ejecutados por proyecto, etapa, actividad y (actividad, rubro).
+
+        Se agregan siempre todos los niveles de los proyectos, de modo que el
+        cálculo de proyectos, etapas, actividades y líneas comparte una sola
+        consulta sin importar el orden en que se pidan; ``stage_ids``,
+        ``activity_ids`` y ``line_ids`` solo indican qué nivel usará quien
+        llama. El resultado se memoriza por transacción hasta que cambie la
+        bitácora o un porcentaje del proyecto.
+        """
+        cache = self._check_execution_cache()
+        project_key = frozenset(self.ids)
+        entries = cache["entries"]
+        # Un agregado de los mismos proyectos (o más) sirve para cualquiera.
+        result = entries.get(project_key) or next(
+            (data for projects, data in entries.items() if project_key <= projects),
+            None,
+        )
+        if result is not None:
+            cache["hits"] += 1
+            _logger.debug(
+                "Execution data cache hit for projects %s (hits=%s, misses=%s)",
+                sorted(project_key), cache["hits"], cache["misses"],
+            )
+            return result
+
+        cache["misses"] += 1
+        _logger.debug(
+            "Execution data cache miss for projects %s (hits=%s, misses=%s)",
+            sorted(project_key), cache["hits"], cache["misses"],
+        )
+        result = self._aggregate_execution_data()
+        entries[project_key] = result
+        return result
+
+    def _aggregate_execution_data(self, stage_ids=None, activity_ids=None, line_ids=None):
         project_ids = self.ids
-        domain = [
-            ("state", "in", ["purchase", "done"]),  # amplía si quieres contar draft/sent
-            ("sec_project_id", "in", project_ids),
-        ]
-        PurchaseOrder = self.env["purchase.order"]
-        orders = PurchaseOrder.search(domain)
-        
         project_data = defaultdict(lambda: {"programa": 0.0, "concurrente": 0.0, "total": 0.0})
         stage_data = defaultdict(lambda: {"programa": 0.0, "concurrente": 0.0, "total": 0.0})
         activity_data = defaultdict(lambda: {"programa": 0.0, "concurrente": 0.0, "total": 0.0})
         line_data = defaultdict(lambda: {"programa": 0.0, "concurrente": 0.0, "total": 0.0})
+        if not project_ids:
+            return {"project": project_data, "stage": stage_data, "activity": activity_data, "line": line_data}
 
-        for order in orders:
-            #amount_mxn = order.sec_effective_mxn or 0.0
-            amount_mxn = order.sec_total_mxn_manual or 0.0
-            if amount_mxn <= 0.0:
+        self.flush(["pct_programa", "pct_concurrente"])
+        self.env["sec.execution.ledger"].flush(
+            ["project_id", "stage_id", "activity_id", "rubro_id", "amount_mxn"]
+        )
+        query, params = self._get_execution_query(stage_ids, activity_ids, line_ids)
+        if query is None:
+            return {"project": project_data, "stage": stage_data, "activity": activity_data, "line": line_data}
+        self.env.cr.execute(query, params)
+        targets = {
+            0b0111: (project_data, lambda row: row[1]),
+            0b1011: (stage_data, lambda row: row[2]),
+            0b1101: (activity_data, lambda row: row[3]),
+            0b1100: (line_data, lambda row: (row[3], row[4]) if row[3] and row[4] else None),
+        }
+        for row in self.env.cr.fetchall():
+            data, get_key = targets[row[0]]
+            key = get_key(row)
+            if not key:
                 continue
+            programa = row[5] or 0.0
+            concurrente = row[6] or 0.0
+            data[key]["programa"] += programa
+            data[key]["concurrente"] += concurrente
+            data[key]["total"] += programa + concurrente
 
-            project = order.sec_project_id
-            if not project:
-                continue
+        return {"project": project_data, "stage": stage_data, "activity": activity_data, "line": line_data}
 
-            programa = amount_mxn * (project.pct_programa / 100.0)
-            concurrente = amount_mxn * (project.pct_concurrente / 100.0)
-            total = programa + concurrente
-
-            project_data[project.id]["programa"] += programa
-            project_data[project.id]["concurrente"] += concurrente
-            project_data[project.id]["total"] += total
-
-            activity = order.sec_activity_id
-            if activity:
-                activity_data[activity.id]["programa"] += programa
-                activity_data[activity.id]["concurrente"] += concurrente
-                activity_data[activity.id]["total"] += total
-
-            stage = order.sec_stage_id or (activity.stage_id if activity else False)
-            if stage:
-                stage_data[stage.id]["programa"] += programa
-                stage_data[stage.id]["concurrente"] += concurrente
-                stage_data[stage.id]["total"] += total
-
-            rubro = order.sec_rubro_id
-            if rubro and activity:
-                key = (activity.id, rubro.id)
-                line_data[key]["programa"] += programa
-                line_data[key]["concurrente"] += concurrente
-                line_data[key]["total"] += total
+    def _get_execution_query(self, stage_ids=None, activity_ids=None, line_ids=None):
+        """Consulta GROUPING SETS de la bitácora para estos proyectos.
 
-        return {"project": project_data, "stage": stage_data, "activity": activity_data, "line": line_data}
+        Devuelve ``(query, params)``, o ``(None, [])`` si el alcance pedido
+        no tiene registros.
+        """
+        where_clause, where_params = self._get_execution_scope_clause(
+            stage_ids, activity_ids, line_ids
+        )
+        if where_clause is None:
+            return None, []
+        # Un solo recorrido de la bitácora: GROUPING() identifica el nivel
+        # de cada fila (bits: proyecto, etapa, actividad, rubro).
+        query = """
+            SELECT
+                GROUPING(l.project_id, l.stage_id, l.activity_id, l.rubro_id) AS level,
+                l.project_id,
+                l.stage_id,
+                l.activity_id,
+                l.rubro_id,
+                SUM(l.amount_mxn * p.pct_programa / 100.0) AS programa,
+                SUM(l.amount_mxn * p.pct_concurrente / 100.0) AS concurrente
+            FROM sec_execution_ledger l
+            JOIN sec_project p ON p.id = l.project_id
+            WHERE l.project_id IN %%s %s
+            GROUP BY GROUPING SETS (
+                (l.project_id),
+                (l.stage_id),
+                (l.activity_id),
+                (l.activity_id, l.rubro_id)
+            )
+            """ % where_clause
+        return query, [tuple(self.ids)] + where_params
+
+    @api.model
+    def _get_execution_scope_clause(self, stage_ids=None, activity_ids=None, line_ids=None):
+        """Condición SQL adicional para los alcances indicados.
+
+        Devuelve ``(None, [])`` cuando se pidió un alcance sin registros, es
+        decir, cuando no hay nada que agregar.
+        """
+        if stage_ids is None and activity_ids is None and line_ids is None:
+            return "", []
+        conditions = []
+        params = []
+        if stage_ids:
+            conditions.append("l.stage_id IN %s")
+            params.append(tuple(stage_ids))
+        if activity_ids:
+            conditions.append("l.activity_id IN %s")
+            params.append(tuple(activity_ids))
+        if line_ids:
+            lines = self.env["sec.activity.budget.line"].browse(line_ids)
+            pairs = {
+                (line.activity_id.id, line.rubro_id.id)
+                for line in lines
+                if line.activity_id and line.rubro_id
+            }
+            if pairs:
+                conditions.append("(l.activity_id, l.rubro_id) IN %s")
+                params.append(tuple(pairs))
+        if not conditions:
+            return None, []
+        return "AND (%s)" % " OR ".join(conditions), params
 
 
 class SecStage(models.Model):
@@ -355,6 +516,7 @@ class SecStage(models.Model):
     )
 
     sec_activity_ids = fields.One2many("sec.activity", "stage_id")
+    execution_ledger_ids = fields.One2many("sec.execution.ledger", "stage_id")
     activity_count = fields.Integer(compute="_compute_activity_count")
     inconsistency_message = fields.Char(compute="_compute_inconsistency_message")
     has_inconsistency = fields.Boolean(
@@ -369,21 +531,15 @@ class SecStage(models.Model):
             stage.amount_total = (stage.amount_programa or 0.0) + (stage.amount_concurrente or 0.0)
 
     @api.depends(
-        "sec_activity_ids.exec_total",
+        "amount_programa",
+        "amount_concurrente",
         "project_id.pct_programa",
         "project_id.pct_concurrente",
-        "project_id.stage_ids",
-        "project_id.purchase_order_ids.state",
-        "project_id.purchase_order_ids.currency_id",
-        "project_id.purchase_order_ids.amount_total",
-        "project_id.purchase_order_ids.sec_total_mxn_manual",
-        "project_id.purchase_order_ids.sec_activity_id",
-        "project_id.purchase_order_ids.sec_stage_id",
-        "project_id.purchase_order_ids.sec_rubro_id",
+        "execution_ledger_ids.amount_mxn",
     )
     def _compute_execution(self):
         projects = self.mapped("project_id")
-        execution = projects._collect_execution_data()
+        execution = projects._collect_execution_data(stage_ids=self.ids)
         stage_data = execution.get("stage", {})
         for stage in self:
             values = stage_data.get(stage.id, {})
@@ -437,6 +593,12 @@ class SecStage(models.Model):
         for stage in self:
             stage.has_inconsistency = bool(stage.inconsistency_message)
 
+    def unlink(self):
+        res = super().unlink()
+        # La bitácora pierde la etapa (ondelete) sin pasar por el ORM.
+        self.env["sec.project"]._invalidate_execution_cache()
+        return res
+
 
 class SecActivity(models.Model):
     _name = "sec.activity"
@@ -517,6 +679,7 @@ class SecActivity(models.Model):
     )
 
     purchase_order_ids = fields.One2many("purchase.order", "sec_activity_id")
+    execution_ledger_ids = fields.One2many("sec.execution.ledger", "activity_id")
 
     @api.depends("budget_line_ids.amount_programa", "budget_line_ids.amount_concurrente", "budget_line_ids.amount_total")
     def _compute_budget_totals(self):
@@ -528,18 +691,13 @@ class SecActivity(models.Model):
             activity.amount_total = programa + concurrente
 
     @api.depends(
-        "project_id.purchase_order_ids.state",
-        "project_id.purchase_order_ids.currency_id",
-        "project_id.purchase_order_ids.amount_total",
-        "project_id.purchase_order_ids.sec_total_mxn_manual",
-        "project_id.purchase_order_ids.sec_activity_id",
-        "project_id.purchase_order_ids.sec_stage_id",
-        "project_id.purchase_order_ids.sec_rubro_id",
-        "budget_line_ids.exec_total",
+        "project_id.pct_programa",
+        "project_id.pct_concurrente",
+        "execution_ledger_ids.amount_mxn",
     )
     def _compute_execution(self):
         projects = self.mapped("project_id")
-        execution = projects._collect_execution_data()
+        execution = projects._collect_execution_data(activity_ids=self.ids)
         activity_data = execution.get("activity", {})
         for activity in self:
             values = activity_data.get(activity.id, {})
@@ -553,6 +711,20 @@ class SecActivity(models.Model):
             line.rem_total = (line.amount_total or 0.0) - (line.exec_total or 0.0)
             line.rem_color = "red" if line.rem_total < 0 else "green"
 
+    def write(self, vals):
+        res = super().write(vals)
+        if "stage_id" in vals:
+            # La etapa de la bitácora se deriva de la actividad cuando la
+            # orden no tiene etapa propia.
+            self.mapped("purchase_order_ids")._sec_sync_execution_ledger()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        # La bitácora pierde la actividad (ondelete) sin pasar por el ORM.
+        self.env["sec.project"]._invalidate_execution_cache()
+        return res
+
     @api.depends("exec_total", "amount_total")
     def _compute_traffic_light(self):
         for activity in self:
@@ -632,9 +804,59 @@ class SecActivityBudgetLine(models.Model):
         store=True,
     )
     justification = fields.Text(string="Justificación específica")
+    import_hash = fields.Char(
+        string="Huella de importación",
+        readonly=True,
+        copy=False,
+        help="Huella del contenido con el que se importó la línea por última vez.",
+    )
     transfer_ids = fields.One2many(
         "sec.budget.transfer", "line_from_id", string="Transferencias salientes"
     )
+    execution_ledger_ids = fields.One2many("sec.execution.ledger", "budget_line_id")
+    transfer_in_count = fields.Integer(
+        string="Transferencias entrantes confirmadas", readonly=True, copy=False
+    )
+    transfer_out_count = fields.Integer(
+        string="Transferencias salientes confirmadas", readonly=True, copy=False
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._link_execution_ledger()
+        self.env["sec.rubro.dashboard"]._schedule_refresh()
+        return lines
+
+    def write(self, vals):
+        relink = "activity_id" in vals or "rubro_id" in vals
+        previous = self.env["sec.execution.ledger"]
+        if relink:
+            previous = self.sudo().execution_ledger_ids
+        res = super().write(vals)
+        if relink:
+            self._link_execution_ledger(previous)
+        self.env["sec.rubro.dashboard"]._schedule_refresh()
+        return res
+
+    def unlink(self):
+        previous = self.sudo().execution_ledger_ids
+        res = super().unlink()
+        # Las filas quedan sin línea (ondelete); se reasignan a una línea
+        # duplicada de la misma actividad y rubro si existe.
+        previous.exists()._assign_budget_lines()
+        self.env["sec.project"]._invalidate_execution_cache()
+        self.env["sec.rubro.dashboard"]._schedule_refresh()
+        return res
+
+    def _link_execution_ledger(self, previous=None):
+        """Enlaza la bitácora de ejecución con estas líneas (actividad, rubro)."""
+        Ledger = self.env["sec.execution.ledger"].sudo()
+        entries = Ledger.search([
+            ("activity_id", "in", self.mapped("activity_id").ids),
+            ("rubro_id", "in", self.mapped("rubro_id").ids),
+        ])
+        (entries | (previous or Ledger))._assign_budget_lines()
 
     def name_get(self):
         result = []
@@ -662,16 +884,15 @@ class SecActivityBudgetLine(models.Model):
                 line.amount_concurrente = total * (project.pct_concurrente / 100.0)
 
     @api.depends(
-        "project_id.purchase_order_ids.state",
-        "project_id.purchase_order_ids.currency_id",
-        "project_id.purchase_order_ids.amount_total",
-        "project_id.purchase_order_ids.sec_total_mxn_manual",
-        "project_id.purchase_order_ids.sec_activity_id",
-        "project_id.purchase_order_ids.sec_rubro_id",
+        "activity_id",
+        "rubro_id",
+        "project_id.pct_programa",
+        "project_id.pct_concurrente",
+        "execution_ledger_ids.amount_mxn",
     )
     def _compute_execution(self):
         projects = self.mapped("project_id")
-        execution = projects._collect_execution_data()
+        execution = projects._collect_execution_data(line_ids=self.ids)
         line_data = execution.get("line", {})
         for line in self:
             key = (line.activity_id.id, line.rubro_id.id)
@@ -686,34 +907,10 @@ class SecActivityBudgetLine(models.Model):
             line.rem_total = (line.amount_total or 0.0) - (line.exec_total or 0.0)
             line.rem_color = "red" if line.rem_total < 0 else "green"
 
-    @api.depends(
-        "exec_total",
-        "amount_total",
-        "activity_id.transfer_ids.state",
-        "activity_id.transfer_ids.line_from_id",
-        "activity_id.transfer_ids.line_to_id",
-        "activity_id.transfer_in_ids.state",
-        "activity_id.transfer_in_ids.line_from_id",
-        "activity_id.transfer_in_ids.line_to_id",
-    )
+    @api.depends("exec_total", "amount_total", "transfer_in_count", "transfer_out_count")
     def _compute_traffic_light(self):
-        lines_with_transfer = set()
-        line_ids = [line.id for line in self if line.id]
-        if line_ids:
-            Transfer = self.env["sec.budget.transfer"]
-            transfers = Transfer.search(
-                [
-                    ("state", "=", "confirmed"),
-                    "|",
-                    ("line_from_id", "in", line_ids),
-                    ("line_to_id", "in", line_ids),
-                ]
-            )
-            lines_with_transfer.update(transfers.mapped("line_from_id").ids)
-            lines_with_transfer.update(transfers.mapped("line_to_id").ids)
-
         for line in self:
-            if line.id in lines_with_transfer:
+            if line.transfer_in_count or line.transfer_out_count:
                 line.traffic_light = "orange_transfer"
                 line.traffic_light_color = "yellow"
             elif line.exec_total > line.amount_total:
@@ -753,18 +950,27 @@ class SecActivityBudgetLine(models.Model):
         self.ensure_one()
         return formatLang(self.env, amount or 0.0, currency_obj=self._get_currency())
 
-    def _validate_outgoing_transfer(self, amount_programa, amount_concurrente):
+    def _validate_outgoing_transfer(
+        self, amount_programa, amount_concurrente, budget_programa=None, budget_concurrente=None
+    ):
+        """Valida el saldo disponible de la línea para una transferencia saliente.
+
+        ``budget_programa``/``budget_concurrente`` permiten validar contra un
+        presupuesto aún no escrito (confirmación por lotes).
+        """
         self.ensure_one()
         currency = self._get_currency()
         precision = currency.rounding
 
         amount_programa = amount_programa or 0.0
         amount_concurrente = amount_concurrente or 0.0
+        if budget_programa is None:
+            budget_programa = self.amount_programa or 0.0
+        if budget_concurrente is None:
+            budget_concurrente = self.amount_concurrente or 0.0
 
-        available_programa = (self.amount_programa or 0.0) - (self.exec_programa or 0.0)
-        available_concurrente = (self.amount_concurrente or 0.0) - (
-            self.exec_concurrente or 0.0
-        )
+        available_programa = budget_programa - (self.exec_programa or 0.0)
+        available_concurrente = budget_concurrente - (self.exec_concurrente or 0.0)
 
         if float_compare(
             available_programa, amount_programa, precision_rounding=precision
@@ -796,13 +1002,41 @@ class SecActivityBudgetLine(models.Model):
 
     def _apply_transfer_delta(self, delta_programa, delta_concurrente, transfer, direction):
         self.ensure_one()
-        currency = self._get_currency()
-        precision = currency.rounding
-
         new_programa = (self.amount_programa or 0.0) + (delta_programa or 0.0)
         new_concurrente = (self.amount_concurrente or 0.0) + (
             delta_concurrente or 0.0
         )
+        self._check_transfer_result(new_programa, new_concurrente)
+
+        self.write(
+            {
+                "amount_programa": new_programa,
+                "amount_concurrente": new_concurrente,
+            }
+        )
+
+        message = self._get_transfer_message(
+            transfer, direction, delta_programa, delta_concurrente
+        )
+        self.message_post(body="<p>%s</p>" % message, subtype_xmlid="mail.mt_note")
+
+    def _get_transfer_message(self, transfer, direction, delta_programa, delta_concurrente):
+        self.ensure_one()
+        direction_label = _("entrada") if direction == "in" else _("salida")
+        return _(
+            "Transferencia %(transfer)s (%(direction)s): Programa %(programa)s, Concurrente %(concurrente)s.",
+        ) % {
+            "transfer": transfer.display_name if transfer else _("manual"),
+            "direction": direction_label,
+            "programa": self._format_currency(abs(delta_programa or 0.0)),
+            "concurrente": self._format_currency(abs(delta_concurrente or 0.0)),
+        }
+
+    def _check_transfer_result(self, new_programa, new_concurrente):
+        """Valida el presupuesto que quedaría en la línea tras una transferencia."""
+        self.ensure_one()
+        currency = self._get_currency()
+        precision = currency.rounding
 
         if float_compare(new_programa, 0.0, precision_rounding=precision) < 0:
             raise ValidationError(
@@ -840,24 +1074,6 @@ class SecActivityBudgetLine(models.Model):
                 % {"line": self.display_name}
             )
 
-        self.write(
-            {
-                "amount_programa": new_programa,
-                "amount_concurrente": new_concurrente,
-            }
-        )
-
-        direction_label = _("entrada") if direction == "in" else _("salida")
-        message = _(
-            "Transferencia %(transfer)s (%(direction)s): Programa %(programa)s, Concurrente %(concurrente)s.",
-        ) % {
-            "transfer": transfer.display_name if transfer else _("manual"),
-            "direction": direction_label,
-            "programa": self._format_currency(abs(delta_programa or 0.0)),
-            "concurrente": self._format_currency(abs(delta_concurrente or 0.0)),
-        }
-        self.message_post(body="<p>%s</p>" % message, subtype_xmlid="mail.mt_note")
-
     def apply_transfer_out(self, amount_programa, amount_concurrente, transfer):
         self.ensure_one()
         self._validate_outgoing_transfer(amount_programa, amount_concurrente)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import logging
+from datetime import timedelta
+
+import psycopg2
+
+from odoo import api, fields, models
+
+try:
+    from PyPDF2 import PdfFileReader, PdfFileWriter
+except ImportError:  # pragma: no cover
+    PdfFileReader = PdfFileWriter = None
+
+_logger = logging.getLogger(__name__)
+
+PDF_REPORT_XMLID = "purchase.action_report_purchase_order"
+
+# Parámetros del sistema (ir.config_parameter).
+PDF_BATCH_SIZE_PARAM = "secihti_budget.pdf_render_batch_size"
+PDF_CACHE_MAX_MB_PARAM = "secihti_budget.pdf_cache_max_mb"
+PDF_CACHE_MAX_AGE_DAYS_PARAM = "secihti_budget.pdf_cache_max_age_days"
+PDF_CACHE_PREWARM_DAYS_PARAM = "secihti_budget.pdf_cache_prewarm_days"
+PDF_CACHE_PREWARM_LIMIT_PARAM = "secihti_budget.pdf_cache_prewarm_limit"
+
+
+class SecPurchasePdfCache(models.Model):
+    """PDF ya renderizado de una orden de compra.
+
+    Cada entrada vale para una ``write_date`` de la orden y una versión de
+    la plantilla del reporte; si alguna cambia, la entrada deja de usarse y
+    la limpieza periódica la elimina junto con las menos usadas.
+    """
+    _name = "sec.purchase.pdf.cache"
+    _description = "Caché de PDF de órdenes de compra SECIHTI"
+    _rec_name = "order_id"
+
+    order_id = fields.Many2one(
+        "purchase.order", required=True, ondelete="cascade", index=True
+    )
+    order_write_date = fields.Datetime(required=True)
+    template_version = fields.Char(required=True)
+    attachment_id = fields.Many2one("ir.attachment", ondelete="cascade")
+    last_used = fields.Datetime(default=fields.Datetime.now, index=True)
+
+    _sql_constraints = [
+        (
+            "order_version_uniq",
+            "unique(order_id, order_write_date, template_version)",
+            "Ya existe un PDF en caché para esta versión de la orden.",
+        ),
+    ]
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_report(self):
+        """Reporte de la orden con el entorno del usuario que exporta."""
+        return self.env.ref(PDF_REPORT_XMLID)
+
+    @api.model
+    def _get_template_version(self):
+        """Huella de la acción del reporte y de sus vistas QWeb (con herencias)."""
+        report = self._get_report().sudo()
+        views = self.env["ir.ui.view"].sudo().search(
+            [("key", "=like", report.report_name + "%")]
+        )
+        todo = views
+        while todo:
+            todo = todo.mapped("inherit_children_ids") - views
+            views |= todo
+        stamp = ";".join(
+            "%s:%s" % (view.id, view.write_date) for view in views.sorted("id")
+        )
+        stamp += ";%s:%s" % (report.id, report.write_date)
+        return hashlib.sha1(stamp.encode()).hexdigest()[:16]
+
+    @api.model
+    def _get_pdfs(self, orders):
+        """Devuelve ``{order_id: pdf}`` sirviendo desde la caché.
+
+        Las órdenes sin entrada vigente se renderizan en una sola llamada y
+        se guardan para la siguiente exportación.
+        """
+        version = self._get_template_version()
+        entries = self.sudo().search(
+            [
+                ("order_id", "in", orders.ids),
+                ("template_version", "=", version),
+            ]
+        )
+        write_dates = {order.id: order.write_date for order in orders}
+        pdfs = {}
+        hits = self.browse()
+        for entry in entries:
+            if entry.order_write_date != write_dates.get(entry.order_id.id):
+                continue
+            content = entry.attachment_id.raw
+            if content:
+                pdfs[entry.order_id.id] = content
+                hits |= entry
+        if hits:
+            self.env.cr.execute(
+                "UPDATE sec_purchase_pdf_cache SET last_used = %s WHERE id IN %s",
+                (fields.Datetime.now(), tuple(hits.ids)),
+            )
+        missing = orders.filtered(lambda order: order.id not in pdfs)
+        if missing:
+            rendered = self._render_pdfs(missing)
+            self._store_pdfs(missing, rendered, version)
+            pdfs.update(rendered)
+        return pdfs
+
+    # ------------------------------------------------------------------
+    # Render y almacenamiento
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _render_pdfs(self, orders):
+        """Renderiza ``orders`` en una sola llamada y separa el PDF por orden.
+
+        wkhtmltopdf deja un marcador de primer nivel al inicio de cada
+        documento; si no se puede separar así, se renderiza orden por orden.
+        """
+        report = self._get_report()
+        if len(orders) > 1:
+            pdf_content, _content_type = report._render_qweb_pdf(orders.ids)
+            parts = self._split_pdf_by_outlines(pdf_content, len(orders))
+            if parts is not None:
+                return dict(zip(orders.ids, parts))
+        return {
+            order.id: report._render_qweb_pdf([order.id])[0] for order in orders
+        }
+
+    @staticmethod
+    def _split_pdf_by_outlines(pdf_content, count):
+        """Divide un PDF en ``count`` documentos según sus marcadores.
+
+        Devuelve ``None`` si PyPDF2 no está disponible o los marcadores no
+        corresponden a un documento por registro.
+        """
+        if not PdfFileReader or not pdf_content:
+            return None
+        try:
+            reader = PdfFileReader(io.BytesIO(pdf_content), strict=False)
+            root = reader.trailer["/Root"]
+            if "/Outlines" not in root or "/First" not in root["/Outlines"]:
+                return None
+            starts = set()
+            node = root["/Outlines"]["/First"]
+            while True:
+                starts.add(root["/Dests"][node["/Dest"]][0])
+                if "/Next" not in node:
+                    break
+                node = node["/Next"]
+            starts = sorted(starts)
+            if len(starts) != count or starts[0] != 0:
+                return None
+            parts = []
+            for index, first_page in enumerate(starts):
+                last_page = starts[index + 1] if index + 1 < count else reader.numPages
+                writer = PdfFileWriter()
+                for page_number in range(first_page, last_page):
+                    writer.addPage(reader.getPage(page_number))
+                stream = io.BytesIO()
+                writer.write(stream)
+                parts.append(stream.getvalue())
+            return parts
+        except Exception:  # pylint: disable=broad-except
+            return None
+
+    @api.model
+    def _store_pdfs(self, orders, pdfs, version):
+        """Guarda los PDF renderizados; ignora los que otro proceso ya guardó."""
+        cache = self.sudo()
+        for order in orders:
+            content = pdfs.get(order.id)
+            if not content:
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    entry = cache.create(
+                        {
+                            "order_id": order.id,
+                            "order_write_date": order.write_date,
+                            "template_version": version,
+                        }
+                    )
+                    entry.attachment_id = self.env["ir.attachment"].sudo().create(
+                        {
+                            "name": "%s.pdf" % order.name.replace("/", "-"),
+                            "raw": content,
+                            "mimetype": "application/pdf",
+                            "res_model": self._name,
+                            "res_id": entry.id,
+                        }
+                    )
+            except psycopg2.IntegrityError:
+                continue
+
+    def unlink(self):
+        attachments = self.mapped("attachment_id")
+        res = super().unlink()
+        attachments.unlink()
+        return res
+
+    # ------------------------------------------------------------------
+    # Crons
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _cron_evict(self):
+        """Elimina entradas vencidas y las menos usadas hasta cumplir el tope."""
+        params = self.env["ir.config_parameter"].sudo()
+        max_bytes = int(params.get_param(PDF_CACHE_MAX_MB_PARAM, "500")) * 1024 * 1024
+        max_age_days = int(params.get_param(PDF_CACHE_MAX_AGE_DAYS_PARAM, "90"))
+        oldest = fields.Datetime.now() - timedelta(days=max_age_days)
+        self.env.cr.execute(
+            """
+            SELECT c.id,
+                   c.order_write_date IS DISTINCT FROM po.write_date
+                       OR c.template_version != %s
+                       OR c.last_used < %s
+                       OR c.attachment_id IS NULL,
+                   COALESCE(a.file_size, 0)
+              FROM sec_purchase_pdf_cache c
+              JOIN purchase_order po ON po.id = c.order_id
+         LEFT JOIN ir_attachment a ON a.id = c.attachment_id
+             ORDER BY c.last_used DESC, c.id DESC
+            """,
+            (self._get_template_version(), oldest),
+        )
+        to_remove = []
+        total = 0
+        for entry_id, outdated, file_size in self.env.cr.fetchall():
+            if outdated or total + file_size > max_bytes:
+                to_remove.append(entry_id)
+            else:
+                total += file_size
+        if to_remove:
+            self.sudo().browse(to_remove).unlink()
+            _logger.info("Caché de PDF: %d entradas eliminadas.", len(to_remove))
+        self._sweep_orphan_attachments()
+
+    @api.model
+    def _sweep_orphan_attachments(self):
+        """Elimina los PDF cuya entrada ya no existe.
+
+        Al borrar una orden, la base de datos elimina sus entradas en cascada
+        sin pasar por ``unlink``, y los adjuntos quedan sin dueño.
+        """
+        self.env.cr.execute(
+            """
+            SELECT a.id
+              FROM ir_attachment a
+         LEFT JOIN sec_purchase_pdf_cache c ON c.id = a.res_id
+             WHERE a.res_model = %s
+               AND c.id IS NULL
+            """,
+            (self._name,),
+        )
+        orphan_ids = [row[0] for row in self.env.cr.fetchall()]
+        if orphan_ids:
+            self.env["ir.attachment"].sudo().browse(orphan_ids).unlink()
+            _logger.info("Caché de PDF: %d adjuntos huérfanos eliminados.", len(orphan_ids))
+
+    @api.model
+    def _cron_prewarm(self):
+        """Renderiza los PDF de órdenes SECIHTI confirmadas recientemente."""
+        params = self.env["ir.config_parameter"].sudo()
+        days = int(params.get_param(PDF_CACHE_PREWARM_DAYS_PARAM, "2"))
+        limit = int(params.get_param(PDF_CACHE_PREWARM_LIMIT_PARAM, "200"))
+        orders = self.env["purchase.order"].sudo().search(
+            [
+                ("sec_project_id", "!=", False),
+                ("state", "in", ["purchase", "done"]),
+                ("date_approve", ">=", fields.Datetime.now() - timedelta(days=days)),
+            ],
+            order="date_approve desc",
+            limit=limit,
+        )
+        batch_size = max(int(params.get_param(PDF_BATCH_SIZE_PARAM, "10")), 1)
+        for start in range(0, len(orders), batch_size):
+            self._get_pdfs(orders[start:start + batch_size])
+            self.env.cr.commit()
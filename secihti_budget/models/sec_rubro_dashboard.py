@@ -1,10 +1,21 @@
 # -*- coding: utf-8 -*-
 
+import logging
+from datetime import timedelta
+
 from odoo import models, fields, api
 
+_logger = logging.getLogger(__name__)
+
+# Marca en ``cr.cache`` para programar un solo refresco por transacción.
+DASHBOARD_REFRESH_KEY = "secihti_budget.rubro_dashboard_refresh"
+DASHBOARD_CRON_XMLID = "secihti_budget.ir_cron_sec_rubro_dashboard_refresh"
+# Espera antes del refresco disparado, para agrupar cambios seguidos.
+DASHBOARD_REFRESH_DELAY = 60
+
 
 class SecRubroDashboard(models.Model):
-    """Dashboard de rubros por etapa"""
+    """Dashboard de rubros por etapa (vista materializada)"""
     _name = "sec.rubro.dashboard"
     _description = "Dashboard de Rubros por Etapa"
     _auto = False
@@ -82,13 +93,32 @@ class SecRubroDashboard(models.Model):
         string="% Ejecución Total",
         readonly=True,
     )
+    refreshed_at = fields.Datetime(string="Actualizado el", readonly=True)
 
     def init(self):
-        """Crea la vista SQL para el dashboard de rubros"""
-        query = """
-            CREATE OR REPLACE VIEW sec_rubro_dashboard AS (
+        """Crea la vista materializada para el dashboard de rubros"""
+        cr = self.env.cr
+        cr.execute("SELECT relkind FROM pg_class WHERE relname = %s", (self._table,))
+        row = cr.fetchone()
+        if row and row[0] == "v":
+            cr.execute("DROP VIEW %s CASCADE" % self._table)
+        elif row and row[0] == "m":
+            cr.execute("DROP MATERIALIZED VIEW %s CASCADE" % self._table)
+        cr.execute(
+            "CREATE MATERIALIZED VIEW %s AS (%s)" % (self._table, self._get_dashboard_query())
+        )
+        # Necesario para REFRESH ... CONCURRENTLY y para leer por índice.
+        cr.execute(
+            "CREATE UNIQUE INDEX %s_stage_rubro_uniq ON %s (stage_id, rubro_id)"
+            % (self._table, self._table)
+        )
+
+    def _get_dashboard_query(self):
+        return """
                 SELECT
-                    ROW_NUMBER() OVER (ORDER BY s.id, r.id) AS id,
+                    -- Id estable entre refrescos: depende solo de la pareja
+                    -- (etapa, rubro), no de las filas que existan.
+                    (s.id::bigint << 32) + r.id AS id,
                     s.id AS stage_id,
                     s.name AS stage_name,
                     r.id AS rubro_id,
@@ -126,13 +156,16 @@ class SecRubroDashboard(models.Model):
                         WHEN COALESCE(SUM(bl.amount_total), 0) > 0
                         THEN COALESCE(SUM(bl.exec_total), 0) / SUM(bl.amount_total)
                         ELSE 0
-                    END AS pct_exec_total
+                    END AS pct_exec_total,
 
-                FROM sec_stage s
+                    NOW() AT TIME ZONE 'UTC' AS refreshed_at
+
+                -- Parte de las líneas presupuestales (stage_id es related
+                -- almacenado), así que solo aparecen combinaciones existentes.
+                FROM sec_activity_budget_line bl
+                INNER JOIN sec_stage s ON s.id = bl.stage_id
                 INNER JOIN sec_project p ON s.project_id = p.id
-                CROSS JOIN sec_rubro r
-                LEFT JOIN sec_activity a ON a.stage_id = s.id
-                LEFT JOIN sec_activity_budget_line bl ON bl.activity_id = a.id AND bl.rubro_id = r.id
+                INNER JOIN sec_rubro r ON r.id = bl.rubro_id
 
                 WHERE r.active = true
 
@@ -140,6 +173,57 @@ class SecRubroDashboard(models.Model):
 
                 -- Solo mostrar rubros que tienen presupuesto o ejecución en esta etapa
                 HAVING COALESCE(SUM(bl.amount_total), 0) > 0 OR COALESCE(SUM(bl.exec_total), 0) > 0
-            )
         """
-        self.env.cr.execute(query)
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _refresh_dashboard(self, concurrently=True):
+        """Recalcula la vista materializada sin bloquear las lecturas."""
+        self.env["sec.activity.budget.line"].flush()
+        self.env.cr.execute(
+            "REFRESH MATERIALIZED VIEW %s%s"
+            % ("CONCURRENTLY " if concurrently else "", self._table)
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _schedule_refresh(self):
+        """Pide un refresco del dashboard fuera de la petición actual.
+
+        Solo se agrega un disparo del cron de refresco (una vez por
+        transacción, y se descarta si esta se revierte); el cron consume en
+        una sola ejecución todos los disparos vencidos, así que varias
+        confirmaciones seguidas producen un único REFRESH.
+        """
+        cr = self.env.cr
+        if cr.cache.get(DASHBOARD_REFRESH_KEY):
+            return
+        cron = self.env.ref(DASHBOARD_CRON_XMLID, raise_if_not_found=False)
+        if not cron:
+            return
+        cr.cache[DASHBOARD_REFRESH_KEY] = True
+
+        def _reset():
+            cr.cache.pop(DASHBOARD_REFRESH_KEY, None)
+
+        cr.after("commit", _reset)
+        cr.after("rollback", _reset)
+        now = fields.Datetime.now()
+        # Un disparo aún pendiente ya cubre estos cambios.
+        pending = self.env["ir.cron.trigger"].sudo().search_count(
+            [("cron_id", "=", cron.id), ("call_at", ">=", now)]
+        )
+        if not pending:
+            cron.sudo()._trigger(now + timedelta(seconds=DASHBOARD_REFRESH_DELAY))
+
+    @api.model
+    def _cron_refresh_dashboard(self):
+        self._refresh_dashboard()
+
+    @api.model
+    def action_refresh_dashboard(self):
+        self._refresh_dashboard()
+        return {"type": "ir.actions.client", "tag": "reload"}
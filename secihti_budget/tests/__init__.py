@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from . import test_execution_aggregation
+from . import test_export_datasets
+from . import test_attachment_export
+from . import test_zip_volumes
+from . import test_import_activity
+from . import test_purchase_order_indexes
+from . import test_rubro_dashboard
+from . import test_execution_benchmark
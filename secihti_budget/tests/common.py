@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Columnas de la copia de la orden plantilla que varían por fila.
+OVERRIDDEN_COLUMNS = (
+    "name",
+    "state",
+    "sec_project_id",
+    "sec_stage_id",
+    "sec_activity_id",
+    "sec_rubro_id",
+    "sec_total_mxn_manual",
+    "sec_effective_mxn",
+)
+
+
+def insert_purchase_orders(env, template, count, activities, rubros):
+    """Copia por SQL la orden ``template`` ``count`` veces y llena la bitácora.
+
+    Las copias quedan confirmadas y se reparten entre ``activities`` y
+    ``rubros`` de forma determinista; la bitácora se llena igual que lo
+    haría la sincronización incremental de ``purchase.order``. Devuelve los
+    ids de las órdenes creadas, con las estadísticas de ambas tablas al día.
+    """
+    cr = env.cr
+    env["purchase.order"].flush()
+    cr.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+         WHERE table_name = 'purchase_order' AND column_name != 'id'
+        """
+    )
+    copied = [row[0] for row in cr.fetchall() if row[0] not in OVERRIDDEN_COLUMNS]
+    cr.execute(
+        """
+        INSERT INTO purchase_order (%(copied)s, %(overridden)s)
+        SELECT %(copied)s,
+               'BM' || g,
+               'purchase',
+               (%%(projects)s::int[])[mod(g, %%(n)s) + 1],
+               (%%(stages)s::int[])[mod(g, %%(n)s) + 1],
+               (%%(activities)s::int[])[mod(g, %%(n)s) + 1],
+               (%%(rubros)s::int[])[mod(g, %%(r)s) + 1],
+               mod(g, 997) + 0.25,
+               mod(g, 997) + 0.25
+          FROM purchase_order, generate_series(1, %%(count)s) g
+         WHERE purchase_order.id = %%(template)s
+        RETURNING id
+        """ % {
+            "copied": ", ".join('"%s"' % name for name in copied),
+            "overridden": ", ".join(OVERRIDDEN_COLUMNS),
+        },
+        {
+            "projects": [activity.project_id.id for activity in activities],
+            "stages": [activity.stage_id.id for activity in activities],
+            "activities": activities.ids,
+            "rubros": rubros.ids,
+            "n": len(activities),
+            "r": len(rubros),
+            "count": count,
+            "template": template.id,
+        },
+    )
+    order_ids = [row[0] for row in cr.fetchall()]
+    cr.execute(
+        """
+        INSERT INTO sec_execution_ledger (
+            purchase_order_id, project_id, stage_id, activity_id, rubro_id,
+            amount_mxn, create_uid, write_uid, create_date, write_date
+        )
+        SELECT id, sec_project_id, sec_stage_id, sec_activity_id, sec_rubro_id,
+               sec_effective_mxn, %(uid)s, %(uid)s,
+               now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+          FROM purchase_order
+         WHERE id IN %(ids)s
+        """,
+        {"uid": env.uid, "ids": tuple(order_ids)},
+    )
+    cr.execute("ANALYZE purchase_order")
+    cr.execute("ANALYZE sec_execution_ledger")
+    env["sec.project"]._invalidate_execution_cache()
+    env["purchase.order"].invalidate_cache()
+    return order_ids
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import io
+import zipfile
+
+from odoo.tests.common import SavepointCase, tagged
+
+from ..wizards.sec_attachment_export_wizard import DUPLICATES_ARCNAME, REMOVED_ARCNAME
+
+
+@tagged("post_install", "-at_install")
+class TestAttachmentExport(SavepointCase):
+    """Deduplicación, exportación diferencial y rutas eliminadas del ZIP."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env["res.partner"].create({"name": "Proveedor Adjuntos"})
+        cls.rubro_a = cls.env["sec.rubro"].create({"name": "Equipo", "tipo_gasto": "inversion"})
+        cls.rubro_b = cls.env["sec.rubro"].create({"name": "Viaticos", "tipo_gasto": "corriente"})
+        cls.project = cls.env["sec.project"].create(
+            {"name": "Proyecto Adjuntos", "code": "PADJ", "amount_total": 1000.0}
+        )
+        cls.order_1 = cls._create_order(cls.rubro_a)
+        cls.order_2 = cls._create_order(cls.rubro_b)
+        cls.att_a = cls._attach(cls.order_1, "a.txt", b"contenido repetido")
+        cls.att_b = cls._attach(cls.order_1, "b.txt", b"contenido repetido")
+        cls.att_c = cls._attach(cls.order_2, "c.txt", b"contenido unico")
+
+    @classmethod
+    def _create_order(cls, rubro):
+        return cls.env["purchase.order"].create(
+            {
+                "partner_id": cls.partner.id,
+                "sec_project_id": cls.project.id,
+                "sec_rubro_id": rubro.id,
+            }
+        )
+
+    @classmethod
+    def _attach(cls, order, name, content):
+        return cls.env["ir.attachment"].create(
+            {
+                "name": name,
+                "raw": content,
+                "res_model": "purchase.order",
+                "res_id": order.id,
+            }
+        )
+
+    def _export(self, base_manifest=None):
+        values = {
+            "project_id": self.project.id,
+            "state_filter": "all",
+            "export_attachments": True,
+            "export_purchase_orders": False,
+            "volume_max_mb": 0,
+            "export_mode": "full",
+        }
+        if base_manifest:
+            values.update(export_mode="delta", base_manifest_id=base_manifest.id)
+        wizard = self.env["sec.attachment.export.wizard"].create(values)
+        wizard.action_export()
+        self.assertEqual(len(wizard.volume_ids), 1)
+        manifest = self.env["sec.attachment.export.manifest"].search(
+            [("project_id", "=", self.project.id)], limit=1
+        )
+        with zipfile.ZipFile(io.BytesIO(wizard.volume_ids.raw)) as zip_file:
+            contents = {name: zip_file.read(name) for name in zip_file.namelist()}
+        return contents, manifest
+
+    def _path(self, rubro, order, filename):
+        return "%s/%s/%s" % (rubro.name, order.name, filename)
+
+    def test_full_export_deduplicates(self):
+        contents, manifest = self._export()
+        path_a = self._path(self.rubro_a, self.order_1, "a.txt")
+        path_b = self._path(self.rubro_a, self.order_1, "b.txt")
+        path_c = self._path(self.rubro_b, self.order_2, "c.txt")
+        # Los adjuntos se recorren en el orden de ``ir.attachment`` (id
+        # descendente): se escribe b.txt y a.txt queda como duplicado.
+        self.assertEqual(
+            set(contents), {path_b, path_c, DUPLICATES_ARCNAME}
+        )
+        self.assertEqual(contents[path_b], b"contenido repetido")
+        self.assertEqual(
+            contents[DUPLICATES_ARCNAME].decode(), "%s -> %s" % (path_a, path_b)
+        )
+        entries = manifest._get_entries()
+        self.assertEqual(entries[str(self.att_b.id)][1], path_b)
+        self.assertEqual(manifest.entry_count, 3)
+
+    def test_delta_export(self):
+        _contents, base = self._export()
+        old_a = self._path(self.rubro_a, self.order_1, "a.txt")
+        old_b = self._path(self.rubro_a, self.order_1, "b.txt")
+        old_c = self._path(self.rubro_b, self.order_2, "c.txt")
+
+        # Se elimina un adjunto, se agrega otro y la orden 1 cambia de rubro
+        # (sus adjuntos cambian de ruta aunque no de contenido).
+        self.att_c.unlink()
+        self._attach(self.order_2, "d.txt", b"nuevo")
+        self.order_1.write({"sec_rubro_id": self.rubro_b.id})
+
+        contents, manifest = self._export(base)
+        new_a = self._path(self.rubro_b, self.order_1, "a.txt")
+        new_b = self._path(self.rubro_b, self.order_1, "b.txt")
+        new_d = self._path(self.rubro_b, self.order_2, "d.txt")
+        self.assertEqual(
+            set(contents), {new_b, new_d, DUPLICATES_ARCNAME, REMOVED_ARCNAME}
+        )
+        self.assertEqual(contents[new_d], b"nuevo")
+        self.assertEqual(
+            contents[DUPLICATES_ARCNAME].decode(), "%s -> %s" % (new_a, new_b)
+        )
+        self.assertEqual(
+            contents[REMOVED_ARCNAME].decode().split("\n"), sorted([old_a, old_b, old_c])
+        )
+        self.assertEqual(manifest.base_manifest_id, base)
+
+        # Sin cambios desde la última exportación: el ZIP queda vacío.
+        contents, _manifest = self._export(manifest)
+        self.assertEqual(contents, {})
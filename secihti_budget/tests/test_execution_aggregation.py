@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from odoo.tests.common import SavepointCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestExecutionAggregation(SavepointCase):
+    """El agregado GROUPING SETS coincide con la suma orden por orden."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        company_currency = cls.env.company.currency_id
+        cls.currency = cls.env.ref("base.EUR")
+        if cls.currency == company_currency:
+            cls.currency = cls.env.ref("base.USD")
+        cls.partner = cls.env["res.partner"].create({"name": "Proveedor SECIHTI"})
+        cls.rubro_a = cls.env["sec.rubro"].create({"name": "Equipo", "tipo_gasto": "inversion"})
+        cls.rubro_b = cls.env["sec.rubro"].create({"name": "Viáticos", "tipo_gasto": "corriente"})
+
+        cls.project_1 = cls._create_project("P1", 70.0, 30.0)
+        cls.project_2 = cls._create_project("P2", 55.5, 44.5)
+        cls.stage_1a = cls._create_stage(cls.project_1, "E1")
+        cls.stage_1b = cls._create_stage(cls.project_1, "E2")
+        cls.stage_2a = cls._create_stage(cls.project_2, "E1")
+        cls.activity_1a = cls._create_activity(cls.stage_1a, "A1")
+        cls.activity_1b = cls._create_activity(cls.stage_1a, "A2")
+        cls.activity_1c = cls._create_activity(cls.stage_1b, "A3")
+        cls.activity_2a = cls._create_activity(cls.stage_2a, "A1")
+        Line = cls.env["sec.activity.budget.line"]
+        cls.lines = Line.create(
+            [
+                {"activity_id": cls.activity_1a.id, "rubro_id": cls.rubro_a.id,
+                 "amount_programa": 7000.0, "amount_concurrente": 3000.0},
+                # Línea duplicada: comparte la ejecución de la anterior.
+                {"activity_id": cls.activity_1a.id, "rubro_id": cls.rubro_a.id,
+                 "amount_programa": 700.0, "amount_concurrente": 300.0},
+                {"activity_id": cls.activity_1a.id, "rubro_id": cls.rubro_b.id,
+                 "amount_programa": 1400.0, "amount_concurrente": 600.0},
+                {"activity_id": cls.activity_1b.id, "rubro_id": cls.rubro_b.id,
+                 "amount_programa": 3500.0, "amount_concurrente": 1500.0},
+                {"activity_id": cls.activity_1c.id, "rubro_id": cls.rubro_a.id,
+                 "amount_programa": 2100.0, "amount_concurrente": 900.0},
+                {"activity_id": cls.activity_2a.id, "rubro_id": cls.rubro_b.id,
+                 "amount_programa": 5550.0, "amount_concurrente": 4450.0},
+            ]
+        )
+
+        cls.orders = cls.env["purchase.order"]
+        for activity, rubro, amount, state in (
+            (cls.activity_1a, cls.rubro_a, 1200.0, "purchase"),
+            (cls.activity_1a, cls.rubro_a, 345.67, "done"),
+            (cls.activity_1a, cls.rubro_b, 980.0, "purchase"),
+            (cls.activity_1b, cls.rubro_b, 410.25, "purchase"),
+            (cls.activity_1c, cls.rubro_a, 2500.0, "done"),
+            (cls.activity_2a, cls.rubro_b, 1999.99, "purchase"),
+            # No aportan: borrador, sin monto y cancelada.
+            (cls.activity_1a, cls.rubro_a, 5000.0, "draft"),
+            (cls.activity_1b, cls.rubro_b, 0.0, "purchase"),
+            (cls.activity_2a, cls.rubro_b, 750.0, "cancel"),
+            # Sin rubro: cuenta para proyecto, etapa y actividad, no para líneas.
+            (cls.activity_1c, None, 640.0, "purchase"),
+        ):
+            cls.orders |= cls._create_order(activity, rubro, amount, state)
+
+    @classmethod
+    def _create_project(cls, code, pct_programa, pct_concurrente):
+        return cls.env["sec.project"].create(
+            {
+                "name": "Proyecto %s" % code,
+                "code": code,
+                "amount_total": 100000.0,
+                "pct_programa": pct_programa,
+                "pct_concurrente": pct_concurrente,
+            }
+        )
+
+    @classmethod
+    def _create_stage(cls, project, code):
+        return cls.env["sec.stage"].create(
+            {
+                "name": "Etapa %s" % code,
+                "code": code,
+                "project_id": project.id,
+                "amount_programa": 20000.0,
+                "amount_concurrente": 10000.0,
+            }
+        )
+
+    @classmethod
+    def _create_activity(cls, stage, code):
+        return cls.env["sec.activity"].create(
+            {"name": "Actividad %s" % code, "code": code, "stage_id": stage.id}
+        )
+
+    @classmethod
+    def _create_order(cls, activity, rubro, amount, state):
+        # Moneda distinta a la de la compañía: el monto MXN es el manual.
+        order = cls.env["purchase.order"].create(
+            {
+                "partner_id": cls.partner.id,
+                "currency_id": cls.currency.id,
+                "sec_project_id": activity.project_id.id,
+                "sec_activity_id": activity.id,
+                "sec_rubro_id": rubro.id if rubro else False,
+                "sec_total_mxn_manual": amount,
+            }
+        )
+        if state != "draft":
+            order.write({"state": state})
+        return order
+
+    def _python_aggregation(self, projects):
+        """Suma orden por orden, como antes de la bitácora y GROUPING SETS."""
+        data = {
+            level: defaultdict(lambda: {"programa": 0.0, "concurrente": 0.0, "total": 0.0})
+            for level in ("project", "stage", "activity", "line")
+        }
+        for order in self.orders:
+            project = order.sec_project_id
+            amount = order.sec_total_mxn_manual or 0.0
+            if project not in projects or order.state not in ("purchase", "done"):
+                continue
+            if amount <= 0.0:
+                continue
+            activity = order.sec_activity_id
+            stage = order.sec_stage_id or activity.stage_id
+            programa = amount * project.pct_programa / 100.0
+            concurrente = amount * project.pct_concurrente / 100.0
+            keys = [("project", project.id), ("stage", stage.id), ("activity", activity.id)]
+            if activity and order.sec_rubro_id:
+                keys.append(("line", (activity.id, order.sec_rubro_id.id)))
+            for level, key in keys:
+                if not key:
+                    continue
+                data[level][key]["programa"] += programa
+                data[level][key]["concurrente"] += concurrente
+                data[level][key]["total"] += programa + concurrente
+        return data
+
+    def _assert_same_data(self, result, expected, levels=("project", "stage", "activity", "line")):
+        for level in levels:
+            self.assertEqual(
+                set(k for k, v in result[level].items() if any(v.values())),
+                set(expected[level]),
+                "Claves distintas en el nivel %s" % level,
+            )
+            for key, values in expected[level].items():
+                for fname in ("programa", "concurrente", "total"):
+                    self.assertAlmostEqual(
+                        result[level][key][fname],
+                        values[fname],
+                        places=6,
+                        msg="%s %s: %s" % (level, key, fname),
+                    )
+
+    def test_grouping_sets_matches_python(self):
+        projects = self.project_1 | self.project_2
+        expected = self._python_aggregation(projects)
+        self._assert_same_data(projects._aggregate_execution_data(), expected)
+        self._assert_same_data(projects._collect_execution_data(), expected)
+
+    def test_scoped_aggregation(self):
+        expected = self._python_aggregation(self.project_1)
+        stages = self.stage_1a | self.stage_1b
+        result = self.project_1._aggregate_execution_data(stage_ids=stages.ids)
+        self._assert_same_data(result, expected, levels=("stage",))
+        activities = self.activity_1a | self.activity_1c
+        result = self.project_1._aggregate_execution_data(activity_ids=activities.ids)
+        for activity in activities:
+            self.assertAlmostEqual(
+                result["activity"][activity.id]["total"],
+                expected["activity"][activity.id]["total"],
+                places=6,
+            )
+        result = self.project_1._aggregate_execution_data(line_ids=self.lines[:3].ids)
+        for line in self.lines[:3]:
+            key = (line.activity_id.id, line.rubro_id.id)
+            self.assertAlmostEqual(
+                result["line"][key]["total"], expected["line"][key]["total"], places=6
+            )
+
+    def test_stored_execution_amounts(self):
+        projects = self.project_1 | self.project_2
+        expected = self._python_aggregation(projects)
+        for project in projects:
+            self.assertAlmostEqual(
+                project.amount_executed_total,
+                expected["project"][project.id]["total"],
+                places=2,
+            )
+        for stage in projects.mapped("stage_ids"):
+            values = expected["stage"][stage.id]
+            self.assertAlmostEqual(stage.exec_programa, values["programa"], places=2)
+            self.assertAlmostEqual(stage.exec_concurrente, values["concurrente"], places=2)
+            self.assertAlmostEqual(stage.exec_total, values["total"], places=2)
+        for activity in projects.mapped("sec_activity_ids"):
+            values = expected["activity"][activity.id]
+            self.assertAlmostEqual(activity.exec_programa, values["programa"], places=2)
+            self.assertAlmostEqual(activity.exec_concurrente, values["concurrente"], places=2)
+            self.assertAlmostEqual(activity.exec_total, values["total"], places=2)
+        for line in self.lines:
+            values = expected["line"][(line.activity_id.id, line.rubro_id.id)]
+            self.assertAlmostEqual(line.exec_programa, values["programa"], places=2)
+            self.assertAlmostEqual(line.exec_concurrente, values["concurrente"], places=2)
+            self.assertAlmostEqual(line.exec_total, values["total"], places=2)
+
+    def test_changes_are_reflected(self):
+        """Tras modificar órdenes y porcentajes, ambos cálculos siguen iguales."""
+        self.orders[0].write({"sec_total_mxn_manual": 1500.0})
+        self.orders[3].write({"sec_rubro_id": self.rubro_a.id})
+        self.orders[4].write({"state": "cancel"})
+        self.project_1.write({"pct_programa": 60.0, "pct_concurrente": 40.0})
+        projects = self.project_1 | self.project_2
+        expected = self._python_aggregation(projects)
+        self._assert_same_data(projects._collect_execution_data(), expected)
+        for activity in projects.mapped("sec_activity_ids"):
+            self.assertAlmostEqual(
+                activity.exec_total, expected["activity"][activity.id]["total"], places=2
+            )
+
+    def test_savepoint_rollback_discards_memo(self):
+        """Al volver a un savepoint no se sirven agregados que ya no existen."""
+        projects = self.project_1 | self.project_2
+        expected = self._python_aggregation(projects)
+        self._assert_same_data(projects._collect_execution_data(), expected)
+        with self.assertRaises(ValueError):
+            with self.env.cr.savepoint():
+                self.orders[0].write({"sec_total_mxn_manual": 99999.0})
+                self.orders[2].write({"state": "cancel"})
+                changed = projects._collect_execution_data()
+                self.assertNotAlmostEqual(
+                    changed["project"][self.project_1.id]["total"],
+                    expected["project"][self.project_1.id]["total"],
+                    places=2,
+                )
+                raise ValueError("rollback")
+        self._assert_same_data(projects._collect_execution_data(), expected)
+
+    def test_ledger_changes_invalidate_memo(self):
+        """Cambios de la bitácora fuera de las órdenes también vacían el memo."""
+        projects = self.project_1 | self.project_2
+        before = projects._collect_execution_data()
+        entry = self.env["sec.execution.ledger"].search(
+            [("purchase_order_id", "=", self.orders[0].id)]
+        )
+        entry.write({"amount_mxn": entry.amount_mxn + 1000.0})
+        result = projects._collect_execution_data()
+        self.assertAlmostEqual(
+            result["project"][self.project_1.id]["total"],
+            before["project"][self.project_1.id]["total"] + 1000.0,
+            places=6,
+        )
+        # Borrar una actividad deja la bitácora sin ella por ``ondelete``.
+        self.activity_1b.unlink()
+        result = projects._collect_execution_data()
+        self.assertNotIn(self.activity_1b.id, result["activity"])
+        self._assert_same_data(
+            result,
+            {
+                level: {key: values for key, values in data.items() if any(values.values())}
+                for level, data in projects._aggregate_execution_data().items()
+            },
+        )
+
+    def test_scoped_requests_share_one_query(self):
+        projects = self.project_1 | self.project_2
+        self.env["sec.project"]._invalidate_execution_cache()
+        before = self.env["sec.project"]._get_execution_cache_stats()
+        projects._collect_execution_data(line_ids=self.lines.ids)
+        projects._collect_execution_data(stage_ids=projects.mapped("stage_ids").ids)
+        projects._collect_execution_data(activity_ids=projects.mapped("sec_activity_ids").ids)
+        projects._collect_execution_data()
+        stats = self.env["sec.project"]._get_execution_cache_stats()
+        self.assertEqual(stats["misses"] - before["misses"], 1)
+        self.assertEqual(stats["hits"] - before["hits"], 3)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Medición del agregado de ejecución con 10k y 100k órdenes.
+
+No corre con la suite normal (etiqueta ``-standard``). Para reproducirla::
+
+    odoo-bin -d <bd> -i secihti_budget --stop-after-init --test-enable \\
+        --test-tags secihti_benchmark/secihti_budget --log-level=test
+
+Cada prueba registra en el log el tiempo de tres caminos sobre los mismos
+datos: el recorrido orden por orden que se usaba originalmente, los cuatro
+``read_group`` sobre la bitácora y la consulta GROUPING SETS actual; además
+comprueba que los tres devuelven los mismos totales.
+"""
+import logging
+import time
+from collections import defaultdict
+
+from odoo.tests.common import SavepointCase, tagged
+
+from .common import insert_purchase_orders
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged("post_install", "-at_install", "-standard", "secihti_benchmark")
+class TestExecutionBenchmark(SavepointCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env["res.partner"].create({"name": "Proveedor benchmark"})
+        cls.rubros = cls.env["sec.rubro"].create(
+            [
+                {"name": "Equipo", "tipo_gasto": "inversion"},
+                {"name": "Viáticos", "tipo_gasto": "corriente"},
+                {"name": "Servicios", "tipo_gasto": "corriente"},
+            ]
+        )
+        cls.projects = cls.env["sec.project"].create(
+            [
+                {"name": "Benchmark %s" % code, "code": code, "amount_total": 1e9,
+                 "pct_programa": pct, "pct_concurrente": 100.0 - pct}
+                for code, pct in (("BM1", 70.0), ("BM2", 55.5))
+            ]
+        )
+        cls.activities = cls.env["sec.activity"]
+        for project in cls.projects:
+            for stage_code in ("E1", "E2", "E3"):
+                stage = cls.env["sec.stage"].create(
+                    {"name": stage_code, "code": stage_code, "project_id": project.id,
+                     "amount_programa": 0.0, "amount_concurrente": 0.0}
+                )
+                cls.activities |= cls.env["sec.activity"].create(
+                    [
+                        {"name": "A%s" % i, "code": "A%s" % i, "stage_id": stage.id}
+                        for i in range(4)
+                    ]
+                )
+        cls.template = cls.env["purchase.order"].create({"partner_id": cls.partner.id})
+
+    @staticmethod
+    def _new_data():
+        return {
+            level: defaultdict(lambda: {"programa": 0.0, "concurrente": 0.0, "total": 0.0})
+            for level in ("project", "stage", "activity", "line")
+        }
+
+    def _walk_orders(self, orders):
+        """Camino original: un acceso a atributos por orden."""
+        data = self._new_data()
+        for order in orders:
+            project = order.sec_project_id
+            amount = order.sec_effective_mxn or 0.0
+            if order.state not in ("purchase", "done") or amount <= 0.0:
+                continue
+            programa = amount * project.pct_programa / 100.0
+            concurrente = amount * project.pct_concurrente / 100.0
+            activity = order.sec_activity_id
+            stage = order.sec_stage_id or activity.stage_id
+            keys = [("project", project.id), ("stage", stage.id), ("activity", activity.id)]
+            if activity and order.sec_rubro_id:
+                keys.append(("line", (activity.id, order.sec_rubro_id.id)))
+            for level, key in keys:
+                data[level][key]["programa"] += programa
+                data[level][key]["concurrente"] += concurrente
+                data[level][key]["total"] += programa + concurrente
+        return data
+
+    def _read_group_ledger(self, projects):
+        """Camino previo a GROUPING SETS: un ``read_group`` por nivel."""
+        data = self._new_data()
+        pct = {p.id: (p.pct_programa / 100.0, p.pct_concurrente / 100.0) for p in projects}
+        Ledger = self.env["sec.execution.ledger"].sudo()
+        for level, groupby in (
+            ("project", []),
+            ("stage", ["stage_id"]),
+            ("activity", ["activity_id"]),
+            ("line", ["activity_id", "rubro_id"]),
+        ):
+            rows = Ledger.read_group(
+                [("project_id", "in", projects.ids)] + [(f, "!=", False) for f in groupby],
+                ["amount_mxn:sum"],
+                ["project_id"] + groupby,
+                lazy=False,
+            )
+            for row in rows:
+                project_id = row["project_id"][0]
+                if not groupby:
+                    key = project_id
+                elif len(groupby) == 1:
+                    key = row[groupby[0]][0]
+                else:
+                    key = tuple(row[f][0] for f in groupby)
+                pct_programa, pct_concurrente = pct[project_id]
+                amount = row["amount_mxn"] or 0.0
+                data[level][key]["programa"] += amount * pct_programa
+                data[level][key]["concurrente"] += amount * pct_concurrente
+                data[level][key]["total"] += amount * (pct_programa + pct_concurrente)
+        return data
+
+    def _timed(self, label, count, func, *args):
+        self.env["purchase.order"].invalidate_cache()
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        _logger.info("Agregado de ejecución, %s órdenes, %s: %.3f s", count, label, elapsed)
+        return result
+
+    def _assert_same_data(self, result, expected):
+        for level, values in expected.items():
+            self.assertEqual(set(result[level]), set(values), level)
+            for key, amounts in values.items():
+                self.assertAlmostEqual(
+                    result[level][key]["total"], amounts["total"], places=2,
+                    msg="%s %s" % (level, key),
+                )
+
+    def _run_benchmark(self, count):
+        orders = self.env["purchase.order"].browse(
+            insert_purchase_orders(self.env, self.template, count, self.activities, self.rubros)
+        )
+        walked = self._timed("orden por orden", count, self._walk_orders, orders)
+        grouped = self._timed("read_group", count, self._read_group_ledger, self.projects)
+        result = self._timed(
+            "GROUPING SETS", count, self.projects._aggregate_execution_data
+        )
+        self._assert_same_data(grouped, walked)
+        self._assert_same_data(result, walked)
+
+    def test_benchmark_10k(self):
+        self._run_benchmark(10000)
+
+    def test_benchmark_100k(self):
+        self._run_benchmark(100000)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from odoo.tests.common import SavepointCase, tagged
+
+
+class _RecordingSheet:
+    """Hoja que guarda lo escrito en ``cells`` en lugar de un archivo."""
+
+    def __init__(self):
+        self.cells = {}
+
+    def write(self, row, col, value, cell_format=None):
+        self.cells[(row, col)] = value
+
+    write_number = write
+
+    def write_row(self, row, col, values, cell_format=None):
+        for offset, value in enumerate(values):
+            self.cells[(row, col + offset)] = value
+
+    def autofilter(self, *args):
+        pass
+
+    def freeze_panes(self, *args):
+        pass
+
+    def get_rows(self):
+        last_row = max(row for row, _col in self.cells)
+        last_col = max(col for _row, col in self.cells)
+        return [
+            [self.cells.get((row, col)) for col in range(last_col + 1)]
+            for row in range(last_row + 1)
+        ]
+
+
+class _RecordingWorkbook:
+    def __init__(self):
+        self.sheets = {}
+
+    def add_format(self, properties=None):
+        return None
+
+    def add_worksheet(self, name):
+        return self.sheets.setdefault(name, _RecordingSheet())
+
+
+@tagged("post_install", "-at_install")
+class TestExportDatasets(SavepointCase):
+    """Los reportes construidos desde el conjunto de columnas producen las
+    filas que generaba el recorrido registro por registro, fijadas a mano
+    para los datos de prueba."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        company_currency = cls.env.company.currency_id
+        cls.foreign_currency = cls.env.ref("base.EUR")
+        if cls.foreign_currency == company_currency:
+            cls.foreign_currency = cls.env.ref("base.USD")
+        cls.partner_1 = cls.env["res.partner"].create({"name": "Proveedor Uno"})
+        cls.partner_2 = cls.env["res.partner"].create({"name": "Proveedor Dos"})
+        cls.product = cls.env["product.product"].create({"name": "Microscopio", "type": "consu"})
+        cls.rubro_a = cls.env["sec.rubro"].create({"name": "Equipo", "tipo_gasto": "inversion"})
+        cls.rubro_b = cls.env["sec.rubro"].create({"name": "Materiales", "tipo_gasto": "corriente"})
+        cls.project = cls.env["sec.project"].create(
+            {
+                "name": "Proyecto Exportación",
+                "code": "PEX",
+                "amount_total": 500000.0,
+                "pct_programa": 70.0,
+                "pct_concurrente": 30.0,
+            }
+        )
+        cls.stage = cls.env["sec.stage"].create(
+            {
+                "name": "Etapa Uno",
+                "code": "EX1",
+                "project_id": cls.project.id,
+                "amount_programa": 70000.0,
+                "amount_concurrente": 30000.0,
+            }
+        )
+        cls.activity_1 = cls.env["sec.activity"].create(
+            {"name": "Compra de equipo", "code": "EXA1", "stage_id": cls.stage.id}
+        )
+        cls.activity_2 = cls.env["sec.activity"].create(
+            {"name": "Insumos", "code": "EXA2", "stage_id": cls.stage.id}
+        )
+
+        cls.orders = cls.env["purchase.order"]
+        for day, partner, activity, rubro, lines, state, currency in (
+            (3, cls.partner_1, cls.activity_1, cls.rubro_a,
+             [("Microscopio óptico", 2, 15000.0), ("Flete", 1, 0.0)], "purchase", None),
+            (5, cls.partner_2, cls.activity_1, cls.rubro_a,
+             [("Centrífuga", 1, 32000.5)], "done", None),
+            (8, cls.partner_1, cls.activity_2, cls.rubro_b,
+             [("Reactivos", 10, 120.75), ("Guantes", 5, 80.0)], "purchase", None),
+            (11, cls.partner_2, cls.activity_2, None,
+             [("Papelería", 3, 45.5)], "purchase", None),
+            # Moneda extranjera sin monto manual: MXN pendiente.
+            (13, cls.partner_1, cls.activity_1, cls.rubro_a,
+             [("Espectrómetro", 1, 9000.0)], "purchase", cls.foreign_currency),
+            (15, cls.partner_2, cls.activity_2, cls.rubro_b,
+             [("Pipetas", 4, 300.0)], "draft", None),
+        ):
+            cls.orders |= cls._create_order(
+                datetime(2024, 3, day, 10, 0), partner, activity, rubro, lines, state, currency
+            )
+        cls.orders[0].notes = "Entrega en laboratorio"
+
+    def setUp(self):
+        super().setUp()
+        # Con control interno las filas salen de sus líneas, no de la orden.
+        if self.env["sec.assets.report.wizard"]._is_control_interno_installed():
+            self.skipTest("om_control_interno instalado")
+
+    @classmethod
+    def _create_order(cls, date_order, partner, activity, rubro, lines, state, currency):
+        vals = {
+            "partner_id": partner.id,
+            "date_order": date_order,
+            "sec_project_id": activity.project_id.id,
+            "sec_stage_id": activity.stage_id.id,
+            "sec_activity_id": activity.id,
+            "sec_rubro_id": rubro.id if rubro else False,
+            "order_line": [
+                (0, 0, {
+                    "product_id": cls.product.id,
+                    "name": name,
+                    "product_qty": qty,
+                    "price_unit": price,
+                    "product_uom": cls.product.uom_po_id.id,
+                    "date_planned": date_order,
+                    "taxes_id": [(6, 0, [])],
+                })
+                for name, qty, price in lines
+            ],
+        }
+        if currency:
+            vals["currency_id"] = currency.id
+        order = cls.env["purchase.order"].create(vals)
+        if state != "draft":
+            order.write({"state": state})
+        return order
+
+    # ------------------------------------------------------------------
+    # Filas esperadas, fijas para los datos de ``setUpClass``
+    # ------------------------------------------------------------------
+
+    def _expected_detail_rows(self):
+        company = self.env.company.currency_id.name
+        foreign = self.foreign_currency.name
+        project = "PEX – Proyecto Exportación"
+        stage = "EX1 – Etapa Uno"
+        activity_1 = "EXA1 – Compra de equipo"
+        activity_2 = "EXA2 – Insumos"
+        names = self.orders.mapped("name")
+        return [
+            ["2024-03-03", "Proveedor Uno", names[0], project, stage, activity_1,
+             "Equipo / Inversión", 30000.0, 21000.0, 9000.0, 30000.0,
+             company, 30000.0, "No", "Entrega en laboratorio"],
+            ["2024-03-05", "Proveedor Dos", names[1], project, stage, activity_1,
+             "Equipo / Inversión", 32000.5, 22400.35, 9600.15, 32000.5,
+             company, 32000.5, "No", ""],
+            ["2024-03-08", "Proveedor Uno", names[2], project, stage, activity_2,
+             "Materiales / Corriente", 1607.5, 1125.25, 482.25, 1607.5,
+             company, 1607.5, "No", ""],
+            ["2024-03-11", "Proveedor Dos", names[3], project, stage, activity_2,
+             "", 136.5, 95.55, 40.95, 136.5,
+             company, 136.5, "No", ""],
+            ["2024-03-13", "Proveedor Uno", names[4], project, stage, activity_1,
+             "Equipo / Inversión", 0.0, 0.0, 0.0, 0.0,
+             foreign, 9000.0, "Sí", ""],
+            ["2024-03-15", "Proveedor Dos", names[5], project, stage, activity_2,
+             "Materiales / Corriente", 1200.0, 840.0, 360.0, 1200.0,
+             company, 1200.0, "No", ""],
+        ]
+
+    @staticmethod
+    def _expected_summary_rows():
+        return [
+            ["Proyecto", "PEX – Proyecto Exportación", 45461.15, 19483.35, 64944.5],
+            ["Etapa", "EX1 – Etapa Uno", 45461.15, 19483.35, 64944.5],
+            ["Actividad", "EXA1 – Compra de equipo", 43400.35, 18600.15, 62000.5],
+            ["Actividad", "EXA2 – Insumos", 2060.8, 883.2, 2944.0],
+            [None, None, None, None, None],
+        ]
+
+    def _expected_assets_rows(self):
+        company = self.env.company.currency_id.name
+        foreign = self.foreign_currency.name
+        rows = []
+        for consecutivo, (rubro, articulo, cantidad, proveedor, precio, moneda, sku) in enumerate(
+            (
+                ("Equipo", "Microscopio óptico", 2.0, "Proveedor Uno", 15000.0, company, "240303"),
+                ("Equipo", "Centrífuga", 1.0, "Proveedor Dos", 32000.5, company, "240305"),
+                ("Materiales", "Reactivos", 10.0, "Proveedor Uno", 120.75, company, "240308"),
+                ("Materiales", "Guantes", 5.0, "Proveedor Uno", 80.0, company, "240308"),
+                ("Equipo", "Espectrómetro", 1.0, "Proveedor Uno", 9000.0, foreign, "240313"),
+            ),
+            start=1,
+        ):
+            rows.append({
+                "consecutivo": consecutivo,
+                "rubro": rubro,
+                "articulo": articulo,
+                "cantidad": cantidad,
+                "proveedor": proveedor,
+                "fecha_contrato": "N/A",
+                "fecha_entrega_contrato": "N/A",
+                "folio_fiscal": "",
+                "precio_unitario": precio,
+                "monto_factura": "",
+                "moneda": moneda,
+                "fecha_pago": "",
+                "poliza": "",
+                "fecha_recepcion": "",
+                "modificatorios": "",
+                "no_serie": "",
+                "no_inventario": "IMGO-%s-%04d" % (sku, consecutivo),
+                "marca": "",
+                "modelo": "",
+                "evidencia_fotografica": "",
+            })
+        return rows
+
+    def _expected_csv_rows(self, export_mode):
+        names = self.orders.mapped("name")
+        orders = (
+            # (fecha, proveedor, rubro, tipo de gasto, subtotal, monto total)
+            ("03/03/2024", "Proveedor Uno", "Equipo", "Inversión", "30000.00", "30000.00"),
+            ("05/03/2024", "Proveedor Dos", "Equipo", "Inversión", "32000.50", "32000.50"),
+            ("08/03/2024", "Proveedor Uno", "Materiales", "Corriente", "1607.50", "1607.50"),
+            ("11/03/2024", "Proveedor Dos", "", "", "136.50", "136.50"),
+            # Sin MXN: se usa el total en moneda original.
+            ("13/03/2024", "Proveedor Uno", "Equipo", "Inversión", "9000.00", "9000.00"),
+            ("15/03/2024", "Proveedor Dos", "Materiales", "Corriente", "1200.00", "1200.00"),
+        )
+        # Reparto 70/30 redondeado a centavos de cada subtotal.
+        splits = {
+            "30000.00": ("21000.00", "9000.00"),
+            "32000.50": ("22400.35", "9600.15"),
+            "1607.50": ("1125.25", "482.25"),
+            "136.50": ("95.55", "40.95"),
+            "9000.00": ("6300.00", "2700.00"),
+            "1200.00": ("840.00", "360.00"),
+        }
+        rows = []
+        for name, (fecha, proveedor, rubro, tipo_gasto, subtotal, monto) in zip(names, orders):
+            base_row = {
+                "no_orden_compra": name,
+                "no_rubro": "",
+                "nombre_rubro": rubro,
+                "no_factura": name,
+                "fecha_factura": fecha,
+                "proveedor": proveedor,
+                "concepto": "",
+                "fecha_pago": "",
+                "no_poliza": "",
+                "beneficiario": proveedor,
+                "observaciones": "",
+                "tipo_gasto": tipo_gasto,
+                "iva": "0.00",
+                "impuestos_retenidos": "0.00",
+                "monto_pagado": monto,
+            }
+            if export_mode == "split":
+                for label, part_subtotal, part_monto in (
+                    ("PP F003 Programa (70%)", splits[subtotal][0], splits[monto][0]),
+                    ("Concurrente (30%)", splits[subtotal][1], splits[monto][1]),
+                ):
+                    rows.append(dict(
+                        base_row,
+                        no=len(rows) + 1,
+                        tipo_aportacion=label,
+                        subtotal=part_subtotal,
+                        monto_total=part_monto,
+                    ))
+            else:
+                rows.append(dict(
+                    base_row,
+                    no=len(rows) + 1,
+                    tipo_aportacion="PP F003 70% / Concurrente 30%",
+                    subtotal=subtotal,
+                    monto_total=monto,
+                ))
+        return rows
+
+    def _assert_rows_equal(self, rows, expected):
+        self.assertEqual(len(rows), len(expected))
+        for row, expected_row in zip(rows, expected):
+            self.assertEqual(len(row), len(expected_row))
+            for value, expected_value in zip(row, expected_row):
+                if isinstance(expected_value, float):
+                    self.assertAlmostEqual(value, expected_value, places=6)
+                else:
+                    self.assertEqual(value, expected_value)
+
+    # ------------------------------------------------------------------
+    # Pruebas
+    # ------------------------------------------------------------------
+
+    def test_export_report(self):
+        expected_detail = self._expected_detail_rows()
+        pending_order = self.orders[4]
+        for include_pending in (False, True):
+            wizard = self.env["sec.export.report.wizard"].create(
+                {
+                    "project_id": self.project.id,
+                    "state_filter": "all",
+                    "include_pending": include_pending,
+                }
+            )
+            dataset, order_mask, pending_mask = wizard._get_dataset()
+            workbook = _RecordingWorkbook()
+            formats = wizard._get_formats(workbook)
+            wizard._build_detail_sheet(workbook, dataset, order_mask, formats)
+            wizard._build_summary_sheet(workbook, dataset, order_mask, pending_mask, formats)
+
+            detail = workbook.sheets["Detalle"].get_rows()
+            expected = expected_detail if include_pending else (
+                expected_detail[:4] + expected_detail[5:]
+            )
+            self._assert_rows_equal(detail[1:], expected)
+
+            # La orden pendiente no aporta MXN: el resumen es el mismo.
+            summary = workbook.sheets["Resumen"].get_rows()
+            alerts_index = next(i for i, row in enumerate(summary) if row[0] == "Alertas")
+            self._assert_rows_equal(summary[1:alerts_index], self._expected_summary_rows())
+            self.assertEqual(summary[alerts_index + 1][0], "Órdenes con MXN pendiente")
+            self.assertEqual(
+                summary[alerts_index + 2][:3],
+                ["2024-03-13", "Proveedor Uno", pending_order.name],
+            )
+
+    def test_assets_report(self):
+        wizard = self.env["sec.assets.report.wizard"].create(
+            {
+                "stage_id": self.stage.id,
+                "rubro_ids": [(6, 0, (self.rubro_a | self.rubro_b).ids)],
+            }
+        )
+        rows = wizard._build_rows(wizard._get_purchase_orders())
+        self.assertEqual(rows, self._expected_assets_rows())
+
+    def test_purchase_order_export(self):
+        for export_mode in ("single", "split"):
+            wizard = self.env["sec.purchase.order.export.wizard"].create(
+                {
+                    "stage_id": self.stage.id,
+                    "state_filter": "all",
+                    "export_mode": export_mode,
+                }
+            )
+            rows = wizard._build_csv_rows(wizard._get_orders())
+            self.assertEqual(rows, self._expected_csv_rows(export_mode))
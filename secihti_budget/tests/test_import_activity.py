@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import base64
+
+from odoo.exceptions import UserError
+from odoo.tests.common import SavepointCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestImportActivity(SavepointCase):
+    """El modo actualizar deja una línea por (etapa, actividad, rubro)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.rubro_a = cls.env["sec.rubro"].create({"name": "Equipo", "tipo_gasto": "inversion"})
+        cls.rubro_b = cls.env["sec.rubro"].create({"name": "Viáticos", "tipo_gasto": "corriente"})
+        cls.project = cls.env["sec.project"].create(
+            {
+                "name": "Proyecto importación",
+                "code": "PIMP",
+                "amount_total": 100000.0,
+                "pct_programa": 70.0,
+                "pct_concurrente": 30.0,
+            }
+        )
+        cls.stage = cls.env["sec.stage"].create(
+            {
+                "name": "E1",
+                "code": "E1",
+                "project_id": cls.project.id,
+                "amount_programa": 0.0,
+                "amount_concurrente": 0.0,
+            }
+        )
+        cls.activity = cls.env["sec.activity"].create(
+            {"name": "A1", "code": "A1", "stage_id": cls.stage.id}
+        )
+        Line = cls.env["sec.activity.budget.line"]
+        # Dos líneas del mismo rubro, como las deja una importación en modo agregar.
+        cls.line = Line.create(
+            {"activity_id": cls.activity.id, "rubro_id": cls.rubro_a.id,
+             "amount_programa": 700.0, "amount_concurrente": 300.0}
+        )
+        cls.duplicate = Line.create(
+            {"activity_id": cls.activity.id, "rubro_id": cls.rubro_a.id,
+             "amount_programa": 700.0, "amount_concurrente": 300.0}
+        )
+        cls.other = Line.create(
+            {"activity_id": cls.activity.id, "rubro_id": cls.rubro_b.id,
+             "amount_programa": 140.0, "amount_concurrente": 60.0}
+        )
+
+    def _wizard(self):
+        return self.env["sec.import.activity.wizard"].create(
+            {
+                "project_id": self.project.id,
+                "data_file": base64.b64encode(b"-"),
+                "import_mode": "upsert",
+            }
+        )
+
+    def _payload(self):
+        return {
+            "E1": {
+                "total": 1000.0,
+                "activities": {
+                    "A1": {
+                        "justificacion": False,
+                        "lines": [
+                            {"rubro_id": self.rubro_a.id, "total": 1000.0,
+                             "programa": 700.0, "concurrente": 300.0,
+                             "justificacion": False},
+                        ],
+                    },
+                },
+            },
+        }
+
+    def test_upsert_merges_duplicates(self):
+        result = self._wizard()._import_payload(self._payload())
+        self.assertEqual(result["merged"], 1)
+        self.assertEqual(result["updated"] | result["unchanged"], self.line)
+        self.assertFalse(self.duplicate.exists())
+        lines = self.activity.budget_line_ids
+        self.assertEqual(lines, self.line | self.other)
+        self.assertAlmostEqual(self.stage.amount_programa, 840.0)
+        self.assertAlmostEqual(self.stage.amount_concurrente, 360.0)
+
+        # Repetir la importación no cambia nada.
+        result = self._wizard()._import_payload(self._payload())
+        self.assertEqual(result["merged"], 0)
+        self.assertEqual(result["unchanged"], self.line)
+        self.assertFalse(result["updated"] | result["created"])
+        self.assertAlmostEqual(self.stage.amount_programa, 840.0)
+        self.assertAlmostEqual(self.stage.amount_concurrente, 360.0)
+
+    def test_upsert_refuses_duplicates_with_transfers(self):
+        self.env["sec.budget.transfer"].create(
+            {
+                "stage_id": self.stage.id,
+                "activity_from_id": self.activity.id,
+                "activity_to_id": self.activity.id,
+                "line_from_id": self.duplicate.id,
+                "line_to_id": self.other.id,
+                "amount_programa": 10.0,
+                "amount_concurrente": 0.0,
+            }
+        )
+        with self.assertRaises(UserError):
+            self._wizard()._import_payload(self._payload())
+        self.assertTrue(self.duplicate.exists())
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import json
+
+from odoo.tests.common import SavepointCase, tagged
+
+from .common import insert_purchase_orders
+
+
+@tagged("post_install", "-at_install")
+class TestPurchaseOrderIndexes(SavepointCase):
+    """Los filtros SECIHTI de órdenes y bitácora usan sus índices."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.rubros = cls.env["sec.rubro"].create(
+            [
+                {"name": "Equipo", "tipo_gasto": "inversion"},
+                {"name": "Viáticos", "tipo_gasto": "corriente"},
+                {"name": "Servicios", "tipo_gasto": "corriente"},
+            ]
+        )
+        cls.projects = cls.env["sec.project"].create(
+            [
+                {"name": "Índices %s" % i, "code": "IDX%s" % i, "amount_total": 1e9,
+                 "pct_programa": 70.0, "pct_concurrente": 30.0}
+                for i in range(40)
+            ]
+        )
+        cls.activities = cls.env["sec.activity"]
+        for project in cls.projects:
+            stage = cls.env["sec.stage"].create(
+                {"name": "E1", "code": "E1", "project_id": project.id,
+                 "amount_programa": 0.0, "amount_concurrente": 0.0}
+            )
+            cls.activities |= cls.env["sec.activity"].create(
+                {"name": "A1", "code": "A1", "stage_id": stage.id}
+            )
+        partner = cls.env["res.partner"].create({"name": "Proveedor índices"})
+        template = cls.env["purchase.order"].create({"partner_id": partner.id})
+        order_ids = insert_purchase_orders(cls.env, template, 20000, cls.activities, cls.rubros)
+        # Pocas órdenes pendientes de monto MXN, como en producción.
+        cls.env.cr.execute(
+            """
+            UPDATE purchase_order SET sec_mxn_pending = (mod(id, 100) = 0)
+             WHERE id IN %s
+            """,
+            [tuple(order_ids)],
+        )
+        cls.env.cr.execute("ANALYZE purchase_order")
+        cls.project = cls.projects[7]
+        cls.activity = cls.activities[7]
+
+    def _explain(self, query, params):
+        self.env.cr.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = self.env.cr.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]
+
+    def _used_indexes(self, node, relation=None):
+        """Índices de todos los nodos del plan, opcionalmente de una tabla."""
+        indexes = set()
+        if node.get("Index Name") and relation in (None, node.get("Relation Name")):
+            indexes.add(node["Index Name"])
+        for child in node.get("Plans", []):
+            indexes |= self._used_indexes(child, relation)
+        return indexes
+
+    def _explain_domain(self, domain, select='"purchase_order".id'):
+        PurchaseOrder = self.env["purchase.order"]
+        query = PurchaseOrder._where_calc(domain)
+        PurchaseOrder._apply_ir_rules(query, "read")
+        from_clause, where_clause, params = query.get_sql()
+        return self._explain(
+            "SELECT %s FROM %s WHERE %s" % (select, from_clause, where_clause), params
+        )
+
+    def test_project_state_index(self):
+        plan = self._explain_domain(
+            [("sec_project_id", "in", self.project.ids), ("state", "in", ["purchase", "done"])]
+        )
+        self.assertIn("purchase_order_sec_project_state_idx", self._used_indexes(plan))
+
+    def test_stage_export_domain(self):
+        """Dominio del asistente de exportación de órdenes por etapa."""
+        plan = self._explain_domain(
+            [("sec_stage_id", "=", self.activity.stage_id.id), ("state", "in", ["purchase", "done"])]
+        )
+        self.assertIn("purchase_order_sec_stage_rubro_state_idx", self._used_indexes(plan))
+
+    def test_pending_partial_index(self):
+        """Conteo de pendientes de ``_compute_purchase_orders``."""
+        plan = self._explain_domain(
+            [
+                ("sec_project_id", "in", self.project.ids),
+                ("state", "in", ["purchase", "done"]),
+                ("sec_mxn_pending", "=", True),
+            ]
+        )
+        self.assertIn("purchase_order_sec_mxn_pending_idx", self._used_indexes(plan))
+
+    def test_ledger_queries(self):
+        query, params = self.project._get_execution_query()
+        plan = self._explain(query, params)
+        self.assertTrue(
+            self._used_indexes(plan, "sec_execution_ledger"),
+            "La agregación de un proyecto recorre toda la bitácora",
+        )
+        lines = self.env["sec.activity.budget.line"].create(
+            {"activity_id": self.activity.id, "rubro_id": self.rubros[0].id}
+        )
+        query, params = self.projects._get_execution_query(line_ids=lines.ids)
+        plan = self._explain(query, params)
+        self.assertIn(
+            "sec_execution_ledger_activity_rubro_idx",
+            self._used_indexes(plan, "sec_execution_ledger"),
+        )
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+
+from odoo.tests.common import SavepointCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+COMPARED_COLUMNS = (
+    "stage_id",
+    "rubro_id",
+    "project_id",
+    "currency_id",
+    "amount_programa",
+    "amount_concurrente",
+    "amount_total",
+    "exec_programa",
+    "exec_concurrente",
+    "exec_total",
+    "rem_programa",
+    "rem_concurrente",
+    "rem_total",
+    "pct_exec_programa",
+    "pct_exec_concurrente",
+    "pct_exec_total",
+)
+
+# Consulta del dashboard antes de partir de las líneas: todas las parejas
+# etapa × rubro activo, filtradas después con HAVING.
+LEGACY_DASHBOARD_QUERY = """
+    SELECT
+        s.id AS stage_id,
+        r.id AS rubro_id,
+        s.project_id AS project_id,
+        p.currency_id AS currency_id,
+        COALESCE(SUM(bl.amount_programa), 0) AS amount_programa,
+        COALESCE(SUM(bl.amount_concurrente), 0) AS amount_concurrente,
+        COALESCE(SUM(bl.amount_total), 0) AS amount_total,
+        COALESCE(SUM(bl.exec_programa), 0) AS exec_programa,
+        COALESCE(SUM(bl.exec_concurrente), 0) AS exec_concurrente,
+        COALESCE(SUM(bl.exec_total), 0) AS exec_total,
+        COALESCE(SUM(bl.amount_programa), 0) - COALESCE(SUM(bl.exec_programa), 0) AS rem_programa,
+        COALESCE(SUM(bl.amount_concurrente), 0) - COALESCE(SUM(bl.exec_concurrente), 0) AS rem_concurrente,
+        COALESCE(SUM(bl.amount_total), 0) - COALESCE(SUM(bl.exec_total), 0) AS rem_total,
+        CASE
+            WHEN COALESCE(SUM(bl.amount_programa), 0) > 0
+            THEN COALESCE(SUM(bl.exec_programa), 0) / SUM(bl.amount_programa)
+            ELSE 0
+        END AS pct_exec_programa,
+        CASE
+            WHEN COALESCE(SUM(bl.amount_concurrente), 0) > 0
+            THEN COALESCE(SUM(bl.exec_concurrente), 0) / SUM(bl.amount_concurrente)
+            ELSE 0
+        END AS pct_exec_concurrente,
+        CASE
+            WHEN COALESCE(SUM(bl.amount_total), 0) > 0
+            THEN COALESCE(SUM(bl.exec_total), 0) / SUM(bl.amount_total)
+            ELSE 0
+        END AS pct_exec_total
+    FROM sec_stage s
+    INNER JOIN sec_project p ON s.project_id = p.id
+    CROSS JOIN sec_rubro r
+    LEFT JOIN sec_activity a ON a.stage_id = s.id
+    LEFT JOIN sec_activity_budget_line bl ON bl.activity_id = a.id AND bl.rubro_id = r.id
+    WHERE r.active = true
+    GROUP BY s.id, s.name, r.id, r.name, s.project_id, p.currency_id
+    HAVING COALESCE(SUM(bl.amount_total), 0) > 0 OR COALESCE(SUM(bl.exec_total), 0) > 0
+"""
+
+
+class DashboardParityMixin(object):
+
+    def _fetch_rows(self, query):
+        self.env.cr.execute(
+            "SELECT %s FROM (%s) q ORDER BY stage_id, rubro_id"
+            % (", ".join(COMPARED_COLUMNS), query)
+        )
+        return [
+            tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+            for row in self.env.cr.fetchall()
+        ]
+
+    def _assert_dashboard_parity(self):
+        Dashboard = self.env["sec.rubro.dashboard"]
+        # Las consultas leen también rubros, etapas y montos ejecutados.
+        self.env["base"].flush()
+        Dashboard._refresh_dashboard(concurrently=False)
+        expected = self._fetch_rows(LEGACY_DASHBOARD_QUERY)
+        self.assertTrue(expected)
+        self.assertEqual(self._fetch_rows(Dashboard._get_dashboard_query()), expected)
+        self.assertEqual(self._fetch_rows("SELECT * FROM %s" % Dashboard._table), expected)
+
+
+@tagged("post_install", "-at_install")
+class TestRubroDashboard(DashboardParityMixin, SavepointCase):
+    """El dashboard desde las líneas coincide con el de etapa × rubro."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        company_currency = cls.env.company.currency_id
+        cls.currency = cls.env.ref("base.EUR")
+        if cls.currency == company_currency:
+            cls.currency = cls.env.ref("base.USD")
+        Rubro = cls.env["sec.rubro"]
+        cls.rubro_a = Rubro.create({"name": "Equipo", "tipo_gasto": "inversion"})
+        cls.rubro_b = Rubro.create({"name": "Viáticos", "tipo_gasto": "corriente"})
+        cls.rubro_unused = Rubro.create({"name": "Sin uso", "tipo_gasto": "corriente"})
+        cls.rubro_inactive = Rubro.create({"name": "Inactivo", "tipo_gasto": "corriente"})
+        project = cls.env["sec.project"].create(
+            {"name": "Proyecto dashboard", "code": "PDSH", "amount_total": 100000.0,
+             "pct_programa": 70.0, "pct_concurrente": 30.0}
+        )
+        stages = cls.env["sec.stage"].create(
+            [
+                {"name": code, "code": code, "project_id": project.id,
+                 "amount_programa": 0.0, "amount_concurrente": 0.0}
+                for code in ("E1", "E2", "E3")
+            ]
+        )
+        activity_1, activity_2, activity_3, activity_4 = cls.env["sec.activity"].create(
+            [
+                {"name": "A1", "code": "A1", "stage_id": stages[0].id},
+                {"name": "A2", "code": "A2", "stage_id": stages[0].id},
+                {"name": "A3", "code": "A3", "stage_id": stages[1].id},
+                # Etapa E3 solo con una línea sin monto: no aparece.
+                {"name": "A4", "code": "A4", "stage_id": stages[2].id},
+            ]
+        )
+        cls.env["sec.activity.budget.line"].create(
+            [
+                # Dos actividades de la misma etapa y rubro se suman.
+                {"activity_id": activity_1.id, "rubro_id": cls.rubro_a.id,
+                 "amount_programa": 700.0, "amount_concurrente": 300.0},
+                {"activity_id": activity_2.id, "rubro_id": cls.rubro_a.id,
+                 "amount_programa": 350.0, "amount_concurrente": 150.0},
+                {"activity_id": activity_1.id, "rubro_id": cls.rubro_b.id,
+                 "amount_programa": 140.0, "amount_concurrente": 60.0},
+                {"activity_id": activity_1.id, "rubro_id": cls.rubro_inactive.id,
+                 "amount_programa": 70.0, "amount_concurrente": 30.0},
+                # Sin presupuesto pero con ejecución: sí aparece.
+                {"activity_id": activity_3.id, "rubro_id": cls.rubro_b.id,
+                 "amount_programa": 0.0, "amount_concurrente": 0.0},
+                {"activity_id": activity_4.id, "rubro_id": cls.rubro_a.id,
+                 "amount_programa": 0.0, "amount_concurrente": 0.0},
+            ]
+        )
+        partner = cls.env["res.partner"].create({"name": "Proveedor dashboard"})
+        for activity, rubro, amount in (
+            (activity_1, cls.rubro_a, 400.0),
+            (activity_3, cls.rubro_b, 250.0),
+        ):
+            order = cls.env["purchase.order"].create(
+                {
+                    "partner_id": partner.id,
+                    "currency_id": cls.currency.id,
+                    "sec_project_id": project.id,
+                    "sec_activity_id": activity.id,
+                    "sec_rubro_id": rubro.id,
+                    "sec_total_mxn_manual": amount,
+                }
+            )
+            order.write({"state": "purchase"})
+        cls.rubro_inactive.active = False
+        cls.stages = stages
+
+    def _dashboard_ids(self):
+        self.env.cr.execute(
+            """
+            SELECT stage_id, rubro_id, id FROM sec_rubro_dashboard
+             WHERE stage_id IN %s ORDER BY stage_id, rubro_id
+            """,
+            [tuple(self.stages.ids)],
+        )
+        return {(stage_id, rubro_id): id_ for stage_id, rubro_id, id_ in self.env.cr.fetchall()}
+
+    def test_same_rows_as_stage_rubro_query(self):
+        self._assert_dashboard_parity()
+        self.assertEqual(
+            sorted(self._dashboard_ids()),
+            [
+                (self.stages[0].id, self.rubro_a.id),
+                (self.stages[0].id, self.rubro_b.id),
+                (self.stages[1].id, self.rubro_b.id),
+            ],
+        )
+
+    def test_ids_stable_between_refreshes(self):
+        Dashboard = self.env["sec.rubro.dashboard"]
+        Dashboard._refresh_dashboard(concurrently=False)
+        before = self._dashboard_ids()
+        # Una fila nueva en la primera etapa no cambia los ids de las demás.
+        self.env["sec.activity.budget.line"].create(
+            {"activity_id": self.stages[0].sec_activity_ids[0].id,
+             "rubro_id": self.rubro_unused.id,
+             "amount_programa": 70.0, "amount_concurrente": 30.0}
+        )
+        Dashboard._refresh_dashboard(concurrently=False)
+        after = self._dashboard_ids()
+        self.assertEqual(set(after) - set(before), {(self.stages[0].id, self.rubro_unused.id)})
+        for key, id_ in before.items():
+            self.assertEqual(after[key], id_, key)
+        record = Dashboard.browse(before[(self.stages[1].id, self.rubro_b.id)])
+        self.assertEqual(record.stage_id, self.stages[1])
+        self.assertEqual(record.rubro_id, self.rubro_b)
+
+
+@tagged("post_install", "-at_install", "-standard", "secihti_benchmark")
+class TestRubroDashboardBenchmark(DashboardParityMixin, SavepointCase):
+    """EXPLAIN ANALYZE de ambas consultas con 50 etapas × 200 rubros.
+
+    No corre con la suite normal; se ejecuta igual que
+    ``test_execution_benchmark`` y deja los planes y tiempos en el log.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ctx = dict(cls.env.context, tracking_disable=True, mail_create_nolog=True)
+        rubros = cls.env["sec.rubro"].with_context(ctx).create(
+            [
+                {"name": "Rubro %03d" % i, "tipo_gasto": "corriente" if i % 2 else "inversion"}
+                for i in range(200)
+            ]
+        )
+        project = cls.env["sec.project"].with_context(ctx).create(
+            {"name": "Proyecto benchmark", "code": "PBDSH", "amount_total": 1e9,
+             "pct_programa": 70.0, "pct_concurrente": 30.0}
+        )
+        line_vals = []
+        for i in range(50):
+            stage = cls.env["sec.stage"].with_context(ctx).create(
+                {"name": "E%02d" % i, "code": "E%02d" % i, "project_id": project.id,
+                 "amount_programa": 0.0, "amount_concurrente": 0.0}
+            )
+            activities = cls.env["sec.activity"].with_context(ctx).create(
+                [
+                    {"name": "A%s" % j, "code": "A%s" % j, "stage_id": stage.id}
+                    for j in range(2)
+                ]
+            )
+            # Cada etapa usa 20 de los 200 rubros, como un catálogo real.
+            for j, rubro in enumerate(rubros[i % 10::10]):
+                line_vals.append(
+                    {"activity_id": activities[j % 2].id, "rubro_id": rubro.id,
+                     "amount_programa": 70.0 * (j + 1), "amount_concurrente": 30.0 * (j + 1)}
+                )
+        cls.env["sec.activity.budget.line"].with_context(ctx).create(line_vals)
+
+    def _explain_analyze(self, label, query):
+        self.env.cr.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query)
+        plan = self.env.cr.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        _logger.info(
+            "Dashboard de rubros, %s: %.3f ms\n%s",
+            label,
+            plan[0]["Execution Time"],
+            json.dumps(plan[0]["Plan"], indent=2),
+        )
+        return plan[0]
+
+    def test_explain_analyze(self):
+        self.env["base"].flush()
+        self.env.cr.execute("ANALYZE sec_activity_budget_line")
+        self.env.cr.execute("ANALYZE sec_rubro")
+        self.env.cr.execute("ANALYZE sec_stage")
+        legacy = self._explain_analyze("etapa × rubro", LEGACY_DASHBOARD_QUERY)
+        current = self._explain_analyze(
+            "desde las líneas", self.env["sec.rubro.dashboard"]._get_dashboard_query()
+        )
+        # La consulta anterior agrupa todas las parejas etapa × rubro; la
+        # actual solo las líneas existentes.
+        self.assertEqual(legacy["Plan"]["Actual Rows"], current["Plan"]["Actual Rows"])
+        self._assert_dashboard_parity()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from odoo.tests.common import SavepointCase, tagged
+
+from ..models.sec_purchase_pdf_cache import PdfFileReader, PdfFileWriter
+from ..wizards.sec_attachment_export_wizard import ZipVolumeWriter
+
+try:
+    from PyPDF2.generic import (
+        ArrayObject,
+        DictionaryObject,
+        NameObject,
+        NumberObject,
+        TextStringObject,
+    )
+except ImportError:
+    ArrayObject = DictionaryObject = NameObject = NumberObject = TextStringObject = None
+
+
+@tagged("post_install", "-at_install")
+class TestZipVolumes(SavepointCase):
+    """Los volúmenes respetan el tope, incluido su directorio central."""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp(prefix="sec_volumes_")
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def _new_path(self, suffix):
+        handle, path = tempfile.mkstemp(suffix=suffix, dir=self.directory)
+        os.close(handle)
+        return path
+
+    def _writer(self, max_size):
+        return ZipVolumeWriter(self._new_path, lambda path, index: path, max_size)
+
+    @staticmethod
+    def _write(volumes, arcname, size):
+        volumes.reserve(size, arcname).writestr(
+            arcname, os.urandom(size), compress_type=zipfile.ZIP_STORED
+        )
+
+    def _namelists(self, paths, max_size=None):
+        namelists = []
+        for path in paths:
+            if max_size:
+                self.assertLessEqual(os.path.getsize(path), max_size, path)
+            with zipfile.ZipFile(path) as zip_file:
+                self.assertIsNone(zip_file.testzip())
+                namelists.append(zip_file.namelist())
+        return namelists
+
+    def test_volumes_include_central_directory(self):
+        # Con nombres largos el directorio central pesa lo mismo que un
+        # cuarto de los datos: sin contarlo, el volumen se pasa del tope.
+        names = ["%02d/%s.bin" % (i, "x" * 194) for i in range(12)]
+        volumes = self._writer(4000)
+        for name in names:
+            self._write(volumes, name, 1000)
+        namelists = self._namelists(volumes.close(), max_size=4000)
+        self.assertGreater(len(namelists), 1)
+        self.assertEqual(sum(namelists, []), names)
+
+    def test_oversized_entry_gets_own_volume(self):
+        volumes = self._writer(4000)
+        self._write(volumes, "a.bin", 500)
+        self._write(volumes, "grande.bin", 6000)
+        self._write(volumes, "b.bin", 500)
+        self.assertEqual(
+            self._namelists(volumes.close()),
+            [["a.bin"], ["grande.bin"], ["b.bin"]],
+        )
+
+    def test_group_boundaries(self):
+        groups = [
+            ("A", ["A/1.bin", "A/2.bin"]),
+            ("B", ["B/1.bin", "B/2.bin"]),
+            # No cabe en un volumen nuevo: se parte.
+            ("C", ["C/%s.bin" % i for i in range(5)]),
+        ]
+        volumes = self._writer(4000)
+        for group, names in groups:
+            volumes.start_group(
+                group, sum(ZipVolumeWriter.entry_size(1000, name) for name in names)
+            )
+            for name in names:
+                self._write(volumes, name, 1000)
+        namelists = self._namelists(volumes.close(), max_size=4000)
+        # B cabe después de A entrada por entrada, pero no completo.
+        self.assertEqual(namelists[0], ["A/1.bin", "A/2.bin"])
+        self.assertEqual(namelists[1], ["B/1.bin", "B/2.bin"])
+        self.assertGreater(len(namelists), 3)
+        self.assertEqual(sum(namelists[2:], []), groups[2][1])
+
+    def test_close_without_entries(self):
+        self.assertEqual(self._namelists(self._writer(4000).close()), [[]])
+
+    def test_copy_entry(self):
+        contents = {
+            "texto.txt": (b"SECIHTI " * 4000, zipfile.ZIP_DEFLATED),
+            "datos.bin": (os.urandom(3000), zipfile.ZIP_STORED),
+        }
+        source_path = self._new_path(".zip")
+        with zipfile.ZipFile(source_path, "w") as source:
+            for name, (data, compress_type) in contents.items():
+                source.writestr(name, data, compress_type=compress_type)
+        volumes = self._writer(0)
+        with zipfile.ZipFile(source_path) as source:
+            for info in source.infolist():
+                volumes.copy_entry(source, info)
+        paths = volumes.close()
+        self.assertEqual(self._namelists(paths), [list(contents)])
+        with zipfile.ZipFile(paths[0]) as zip_file:
+            for name, (data, compress_type) in contents.items():
+                self.assertEqual(zip_file.getinfo(name).compress_type, compress_type)
+                self.assertEqual(zip_file.read(name), data)
+
+
+@tagged("post_install", "-at_install")
+@unittest.skipIf(not PdfFileWriter or not DictionaryObject, "PyPDF2 no disponible")
+class TestSplitPdfByOutlines(SavepointCase):
+    """División del PDF combinado en un documento por orden."""
+
+    @staticmethod
+    def _pdf(page_count, starts):
+        """PDF de ``page_count`` páginas con un marcador por página de ``starts``.
+
+        Los destinos van en ``/Root /Dests`` con el número de página, como
+        los escribe wkhtmltopdf.
+        """
+        writer = PdfFileWriter()
+        for _index in range(page_count):
+            writer.addBlankPage(72, 72)
+        if starts:
+            dests = DictionaryObject()
+            nodes = []
+            for index, page_number in enumerate(starts):
+                name = NameObject("/orden%s" % index)
+                dests[name] = ArrayObject(
+                    [NumberObject(page_number), NameObject("/XYZ"),
+                     NumberObject(0), NumberObject(0), NumberObject(0)]
+                )
+                nodes.append(
+                    DictionaryObject(
+                        {NameObject("/Title"): TextStringObject("Orden %s" % index),
+                         NameObject("/Dest"): name}
+                    )
+                )
+            refs = [writer._addObject(node) for node in nodes]
+            for node, next_ref in zip(nodes, refs[1:]):
+                node[NameObject("/Next")] = next_ref
+            root = writer._root_object
+            root[NameObject("/Dests")] = writer._addObject(dests)
+            root[NameObject("/Outlines")] = writer._addObject(
+                DictionaryObject(
+                    {NameObject("/Type"): NameObject("/Outlines"),
+                     NameObject("/First"): refs[0],
+                     NameObject("/Last"): refs[-1]}
+                )
+            )
+        stream = io.BytesIO()
+        writer.write(stream)
+        return stream.getvalue()
+
+    def _split(self, pdf_content, count):
+        return self.env["sec.purchase.pdf.cache"]._split_pdf_by_outlines(pdf_content, count)
+
+    def test_split_by_outlines(self):
+        parts = self._split(self._pdf(5, [0, 2, 3]), 3)
+        self.assertEqual(
+            [PdfFileReader(io.BytesIO(part)).getNumPages() for part in parts],
+            [2, 1, 2],
+        )
+
+    def test_unusable_outlines(self):
+        # Menos marcadores que órdenes.
+        self.assertIsNone(self._split(self._pdf(5, [0, 2, 3]), 4))
+        # El primer marcador no está en la primera página.
+        self.assertIsNone(self._split(self._pdf(5, [1, 3]), 2))
+        self.assertIsNone(self._split(self._pdf(3, []), 1))
+        self.assertIsNone(self._split(False, 1))
@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
-import base64
-import io
-
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
+from ..models.sec_export_mixin import XLSX_MIMETYPE
+
 try:
     import xlsxwriter
 except ImportError:  # pragma: no cover
@@ -13,6 +12,7 @@ except ImportError:  # pragma: no cover
 
 class SecAssetsReportWizard(models.TransientModel):
     _name = "sec.assets.report.wizard"
+    _inherit = "sec.export.mixin"
     _description = "Reporte de Bienes"
 
     stage_id = fields.Many2one("sec.stage", string="Etapa", required=True)
@@ -22,35 +22,11 @@ class SecAssetsReportWizard(models.TransientModel):
         help="Solo incluir órdenes de compra cuyo Total MXN manual sea mayor a este valor. Dejar en 0 para incluir todas.",
         default=0.0,
     )
-    file_data = fields.Binary(string="Archivo", readonly=True)
-    filename = fields.Char(string="Nombre de archivo", readonly=True)
 
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
 
-    def _is_control_interno_installed(self):
-        module = (
-            self.env["ir.module.module"]
-            .sudo()
-            .search(
-                [("name", "=", "om_control_interno"), ("state", "=", "installed")],
-                limit=1,
-            )
-        )
-        return bool(module)
-
-    def _get_control_interno_lines(self, purchase_order):
-        if not self._is_control_interno_installed():
-            return []
-        try:
-            CostosGastosLine = self.env["costos.gastos.line"]
-            return CostosGastosLine.search(
-                [("orden_compra_id", "=", purchase_order.id)]
-            )
-        except Exception:
-            return []
-
     def _format_date(self, date_value):
         if not date_value:
             return ""
@@ -70,7 +46,7 @@ class SecAssetsReportWizard(models.TransientModel):
     # ------------------------------------------------------------------
 
     def _get_purchase_orders(self):
-        """Get purchase orders for the selected stage and rubros."""
+        """Get purchase orders (with their lines) for the selected stage and rubros."""
         self.ensure_one()
         domain = [
             ("sec_stage_id", "=", self.stage_id.id),
@@ -79,23 +55,25 @@ class SecAssetsReportWizard(models.TransientModel):
         ]
         if self.min_amount:
             domain.append(("sec_total_mxn_manual", ">=", self.min_amount))
-        return self.env["purchase.order"].search(domain, order="date_order asc")
+        return self._get_purchase_order_dataset(
+            domain, order="date_order asc", with_lines=True
+        )
 
-    def _build_rows(self, orders):
+    def _build_rows(self, dataset):
         """Build report rows: one row per PO line with amount > 0."""
         rows = []
         consecutivo = 1
-        control_installed = self._is_control_interno_installed()
+        ci_lines_by_order = self._get_control_interno_lines_by_order(
+            self.env["purchase.order"].browse(dataset["columns"]["id"])
+        )
 
-        for order in orders:
-            rubro_name = order.sec_rubro_id.name if order.sec_rubro_id else ""
-            purchase_date = order.date_order
-            currency_name = order.currency_id.name if order.currency_id else ""
+        for order in self._dataset_rows(dataset):
+            rubro_name = order["rubro_name"]
+            purchase_date = order["date_order"]
+            currency_name = order["currency_name"]
 
             # Get control interno data for this order (if available)
-            ci_lines = []
-            if control_installed:
-                ci_lines = self._get_control_interno_lines(order)
+            ci_lines = ci_lines_by_order.get(order["id"], [])
 
             ci_line = ci_lines[0] if ci_lines else None
 
@@ -116,11 +94,11 @@ class SecAssetsReportWizard(models.TransientModel):
                 fecha_pago = self._format_date(ci_line.fecha_pago)
 
             if not proveedor:
-                proveedor = order.partner_id.name if order.partner_id else ""
+                proveedor = order["partner_name"]
 
             # Iterate over PO lines (order_line) with price_subtotal > 0
-            for po_line in order.order_line:
-                if po_line.price_subtotal <= 0:
+            for po_line in dataset["lines"].get(order["id"], []):
+                if po_line["price_subtotal"] <= 0:
                     continue
 
                 sku = "IMGO-%s-%04d" % (
@@ -131,17 +109,13 @@ class SecAssetsReportWizard(models.TransientModel):
                 row = {
                     "consecutivo": consecutivo,
                     "rubro": rubro_name,
-                    "articulo": po_line.name or (
-                        po_line.product_id.display_name
-                        if po_line.product_id
-                        else ""
-                    ),
-                    "cantidad": po_line.product_qty or 0,
+                    "articulo": po_line["name"] or po_line["product_name"],
+                    "cantidad": po_line["product_qty"],
                     "proveedor": proveedor,
                     "fecha_contrato": "N/A",
                     "fecha_entrega_contrato": "N/A",
                     "folio_fiscal": folio_fiscal,
-                    "precio_unitario": po_line.price_unit or 0.0,
+                    "precio_unitario": po_line["price_unit"],
                     "monto_factura": monto_factura,
                     "moneda": currency_name,
                     "fecha_pago": fecha_pago,
@@ -187,9 +161,8 @@ class SecAssetsReportWizard(models.TransientModel):
             "Evidencia Fotográfica",
         ]
 
-    def _build_workbook(self, rows):
-        buf = io.BytesIO()
-        workbook = xlsxwriter.Workbook(buf, {"in_memory": True})
+    def _build_workbook(self, path, rows):
+        workbook = self._new_xlsx_workbook(path)
         sheet = workbook.add_worksheet("Reporte de Bienes")
 
         # Formats
@@ -256,8 +229,6 @@ class SecAssetsReportWizard(models.TransientModel):
         sheet.freeze_panes(1, 0)
 
         workbook.close()
-        buf.seek(0)
-        return buf
 
     # ------------------------------------------------------------------
     # Main action
@@ -268,15 +239,15 @@ class SecAssetsReportWizard(models.TransientModel):
         if not xlsxwriter:
             raise UserError(_("No está disponible la librería xlsxwriter."))
 
-        orders = self._get_purchase_orders()
-        if not orders:
+        dataset = self._get_purchase_orders()
+        if not dataset["size"]:
             raise UserError(
                 _(
                     "No se encontraron órdenes de compra para la etapa y rubros seleccionados."
                 )
             )
 
-        rows = self._build_rows(orders)
+        rows = self._build_rows(dataset)
         if not rows:
             raise UserError(
                 _(
@@ -284,19 +255,17 @@ class SecAssetsReportWizard(models.TransientModel):
                 )
             )
 
-        workbook_data = self._build_workbook(rows)
-
         stage_name = (
             self.stage_id.code or self.stage_id.name or "Etapa"
         ).replace(" ", "_").replace("/", "-")
         filename = "Reporte_Bienes_%s.xlsx" % stage_name
 
-        self.write(
-            {
-                "file_data": base64.b64encode(workbook_data.getvalue()),
-                "filename": filename,
-            }
-        )
+        path = self._new_export_path(".xlsx")
+        try:
+            self._build_workbook(path, rows)
+            self._set_export_result(path, filename, XLSX_MIMETYPE)
+        finally:
+            self._remove_export_path(path)
         return {
             "type": "ir.actions.act_window",
             "res_model": self._name,
@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
-import base64
-import io
 from collections import defaultdict
 
 from odoo import _, fields, models
 from odoo.exceptions import UserError
 
+from ..models.sec_export_mixin import XLSX_MIMETYPE
+
 try:
     import xlsxwriter
 except ImportError:  # pragma: no cover
@@ -14,6 +14,7 @@ except ImportError:  # pragma: no cover
 
 class SecExportReportWizard(models.TransientModel):
     _name = "sec.export.report.wizard"
+    _inherit = "sec.export.mixin"
     _description = "Exportar presupuesto SECIHTI"
 
     project_id = fields.Many2one("sec.project", string="Proyecto", required=True)
@@ -30,20 +31,19 @@ class SecExportReportWizard(models.TransientModel):
         string="Estados",
     )
     include_pending = fields.Boolean(string="Incluir MXN pendiente", default=False)
-    file_data = fields.Binary(string="Archivo", readonly=True)
-    filename = fields.Char(string="Nombre de archivo", readonly=True)
 
     def action_export(self):
         self.ensure_one()
         if not xlsxwriter:
             raise UserError(_("No está disponible la librería xlsxwriter."))
-        orders, pending_orders = self._get_orders()
-        workbook_data = self._build_workbook(orders, pending_orders)
+        dataset, order_mask, pending_mask = self._get_dataset()
         filename = "Reporte_SECIHTI_%s.xlsx" % (self.project_id.code or self.project_id.name)
-        self.write({
-            "file_data": base64.b64encode(workbook_data.getvalue()),
-            "filename": filename,
-        })
+        path = self._new_export_path(".xlsx")
+        try:
+            self._build_workbook(path, dataset, order_mask, pending_mask)
+            self._set_export_result(path, filename, XLSX_MIMETYPE)
+        finally:
+            self._remove_export_path(path)
         return {
             "type": "ir.actions.act_window",
             "res_model": self._name,
@@ -52,7 +52,12 @@ class SecExportReportWizard(models.TransientModel):
             "target": "new",
         }
 
-    def _get_orders(self):
+    def _get_dataset(self):
+        """Conjunto de órdenes del reporte y máscaras de filas.
+
+        Devuelve ``(dataset, order_mask, pending_mask)``: las órdenes a
+        detallar y las que tienen MXN pendiente, por posición.
+        """
         self.ensure_one()
         project = self.project_id
         states = self._get_state_list()
@@ -65,11 +70,13 @@ class SecExportReportWizard(models.TransientModel):
             domain.append(("date_order", ">=", self.date_from))
         if self.date_to:
             domain.append(("date_order", "<=", self.date_to))
-        orders = self.env["purchase.order"].search(domain, order="date_order asc")
-        pending_orders = orders.filtered(lambda o: o.sec_mxn_pending)
-        if not self.include_pending:
-            orders = orders - pending_orders
-        return orders, pending_orders
+        dataset = self._get_purchase_order_dataset(domain, order="date_order asc")
+        pending_mask = [bool(pending) for pending in dataset["columns"]["mxn_pending"]]
+        if self.include_pending:
+            order_mask = [True] * dataset["size"]
+        else:
+            order_mask = [not pending for pending in pending_mask]
+        return dataset, order_mask, pending_mask
 
     def _get_state_list(self):
         if self.state_filter == "all":
@@ -78,15 +85,12 @@ class SecExportReportWizard(models.TransientModel):
             return ["purchase", "done"]
         return [self.state_filter]
 
-    def _build_workbook(self, orders, pending_orders):
-        buffer = io.BytesIO()
-        workbook = xlsxwriter.Workbook(buffer, {"in_memory": True})
+    def _build_workbook(self, path, dataset, order_mask, pending_mask):
+        workbook = self._new_xlsx_workbook(path)
         formats = self._get_formats(workbook)
-        self._build_detail_sheet(workbook, orders, pending_orders, formats)
-        self._build_summary_sheet(workbook, orders, pending_orders, formats)
+        self._build_detail_sheet(workbook, dataset, order_mask, formats)
+        self._build_summary_sheet(workbook, dataset, order_mask, pending_mask, formats)
         workbook.close()
-        buffer.seek(0)
-        return buffer
 
     def _get_formats(self, workbook):
         header = workbook.add_format({"bold": True, "bg_color": "#004080", "font_color": "#FFFFFF"})
@@ -100,7 +104,7 @@ class SecExportReportWizard(models.TransientModel):
             "text": text,
         }
 
-    def _build_detail_sheet(self, workbook, orders, pending_orders, formats):
+    def _build_detail_sheet(self, workbook, dataset, order_mask, formats):
         sheet = workbook.add_worksheet("Detalle")
         headers = [
             "Fecha de compra",
@@ -121,39 +125,30 @@ class SecExportReportWizard(models.TransientModel):
         ]
         sheet.write_row(0, 0, headers, formats["header"])
         row = 1
-        for order in orders:
-            amount_mxn = order._sec_get_amount_mxn()
-            programa = concurrente = total = 0.0
-            if order.sec_project_id:
-                programa = amount_mxn * (order.sec_project_id.pct_programa / 100.0)
-                concurrente = amount_mxn * (order.sec_project_id.pct_concurrente / 100.0)
-                total = programa + concurrente
+        for order in self._dataset_rows(dataset, order_mask):
             date_value = ""
-            if order.date_order:
-                date_value = fields.Date.to_string(order.date_order.date())
+            if order["date_order"]:
+                date_value = fields.Date.to_string(order["date_order"].date())
             sheet.write(row, 0, date_value, formats["text"])
-            sheet.write(row, 1, order.partner_id.name or "", formats["text"])
-            sheet.write(row, 2, order.name, formats["text"])
-            sheet.write(row, 3, self._format_name(order.sec_project_id), formats["text"])
-            sheet.write(row, 4, self._format_name(order.sec_stage_id), formats["text"])
-            sheet.write(row, 5, self._format_name(order.sec_activity_id), formats["text"])
-            rubro_label = order.sec_rubro_id.name or ""
-            if order.sec_rubro_id:
-                rubro_label = "%s / %s" % (order.sec_rubro_id.name, dict(order.sec_rubro_id._fields['tipo_gasto'].selection).get(order.sec_rubro_id.tipo_gasto, ""))
-            sheet.write(row, 6, rubro_label, formats["text"])
-            sheet.write_number(row, 7, amount_mxn, formats["money"])
-            sheet.write_number(row, 8, programa, formats["money"])
-            sheet.write_number(row, 9, concurrente, formats["money"])
-            sheet.write_number(row, 10, total, formats["money"])
-            sheet.write(row, 11, order.currency_id.name or "", formats["text"])
-            sheet.write_number(row, 12, order.amount_total, formats["money"])
-            sheet.write(row, 13, "Sí" if order.sec_mxn_pending else "No", formats["text"])
-            sheet.write(row, 14, order.notes or "", formats["text"])
+            sheet.write(row, 1, order["partner_name"], formats["text"])
+            sheet.write(row, 2, order["name"], formats["text"])
+            sheet.write(row, 3, order["project_label"], formats["text"])
+            sheet.write(row, 4, order["stage_label"], formats["text"])
+            sheet.write(row, 5, order["activity_label"], formats["text"])
+            sheet.write(row, 6, order["rubro_label"], formats["text"])
+            sheet.write_number(row, 7, order["amount_mxn"], formats["money"])
+            sheet.write_number(row, 8, order["programa"], formats["money"])
+            sheet.write_number(row, 9, order["concurrente"], formats["money"])
+            sheet.write_number(row, 10, order["total"], formats["money"])
+            sheet.write(row, 11, order["currency_name"], formats["text"])
+            sheet.write_number(row, 12, order["amount_total"], formats["money"])
+            sheet.write(row, 13, "Sí" if order["mxn_pending"] else "No", formats["text"])
+            sheet.write(row, 14, order["notes"], formats["text"])
             row += 1
         sheet.autofilter(0, 0, row - 1, len(headers) - 1)
         sheet.freeze_panes(1, 0)
 
-    def _build_summary_sheet(self, workbook, orders, pending_orders, formats):
+    def _build_summary_sheet(self, workbook, dataset, order_mask, pending_mask, formats):
         sheet = workbook.add_worksheet("Resumen")
         headers = [
             "Nivel",
@@ -164,19 +159,13 @@ class SecExportReportWizard(models.TransientModel):
         ]
         sheet.write_row(0, 0, headers, formats["header"])
         summary = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {"programa": 0.0, "concurrente": 0.0, "total": 0.0})))
-        for order in orders:
-            amount_mxn = order._sec_get_amount_mxn()
-            if not amount_mxn or not order.sec_project_id:
+        for order in self._dataset_rows(dataset, order_mask):
+            if not order["amount_mxn"] or not order["project_id"]:
                 continue
-            programa = amount_mxn * (order.sec_project_id.pct_programa / 100.0)
-            concurrente = amount_mxn * (order.sec_project_id.pct_concurrente / 100.0)
-            total = programa + concurrente
-            project_key = order.sec_project_id.id
-            stage_key = order.sec_stage_id.id if order.sec_stage_id else False
-            activity_key = order.sec_activity_id.id if order.sec_activity_id else False
-            summary[project_key][stage_key][activity_key]["programa"] += programa
-            summary[project_key][stage_key][activity_key]["concurrente"] += concurrente
-            summary[project_key][stage_key][activity_key]["total"] += total
+            values = summary[order["project_id"]][order["stage_id"]][order["activity_id"]]
+            values["programa"] += order["programa"]
+            values["concurrente"] += order["concurrente"]
+            values["total"] += order["total"]
 
         row = 1
         for project in self.project_id:
@@ -217,16 +206,16 @@ class SecExportReportWizard(models.TransientModel):
         alerts_row = row
         sheet.write(alerts_row, 0, "Alertas", formats["header"])
         row = alerts_row + 1
-        if pending_orders:
+        if any(pending_mask):
             sheet.write(row, 0, "Órdenes con MXN pendiente", formats["bold"])
             row += 1
-            for order in pending_orders:
+            for order in self._dataset_rows(dataset, pending_mask):
                 date_value = ""
-                if order.date_order:
-                    date_value = fields.Date.to_string(order.date_order.date())
+                if order["date_order"]:
+                    date_value = fields.Date.to_string(order["date_order"].date())
                 sheet.write(row, 0, date_value, formats["text"])
-                sheet.write(row, 1, order.partner_id.name or "", formats["text"])
-                sheet.write(row, 2, order.name, formats["text"])
+                sheet.write(row, 1, order["partner_name"], formats["text"])
+                sheet.write(row, 2, order["name"], formats["text"])
                 row += 1
         inconsistencies = []
         if self.project_id.inconsistency_message:
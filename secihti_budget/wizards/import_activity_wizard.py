@@ -1,31 +1,149 @@
 # -*- coding: utf-8 -*-
 import base64
 import csv
+import hashlib
 import io
+import json
 import logging
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover
+    openpyxl = None
+
 _logger = logging.getLogger(__name__)
 
+REQUIRED_HEADERS = {
+    "Etapa",
+    "Actividad",
+    "Concepto",
+    "Tipo de Gasto",
+    "Total",
+    "Monto Programa",
+    "Monto Concurrente",
+    "Justificación Específica",
+    "Justificacion General",
+}
+
 
 class SecImportActivityWizard(models.TransientModel):
     _name = "sec.import.activity.wizard"
     _description = "Importar actividades SECIHTI"
 
     project_id = fields.Many2one("sec.project", string="Proyecto", required=True)
-    data_file = fields.Binary(string="Archivo CSV", required=True)
+    data_file = fields.Binary(string="Archivo CSV o XLSX", required=True)
     filename = fields.Char(string="Nombre del archivo")
+    import_mode = fields.Selection(
+        [
+            ("upsert", "Actualizar líneas existentes"),
+            ("append", "Agregar siempre líneas nuevas"),
+        ],
+        string="Modo",
+        default="upsert",
+        required=True,
+        help="Actualizar: las filas se emparejan por etapa, actividad y rubro; solo se "
+        "escriben las que cambiaron y el presupuesto de la etapa se recalcula a partir "
+        "de sus líneas.\nAgregar: cada fila crea una línea nueva y su total se suma a la etapa.",
+    )
+    state = fields.Selection(
+        [("draft", "Archivo"), ("preview", "Vista previa")],
+        default="draft",
+        readonly=True,
+    )
+    payload = fields.Text(readonly=True)
+    payload_key = fields.Char(readonly=True)
+    issues = fields.Text(string="Observaciones", readonly=True)
+    error_count = fields.Integer(string="Errores", readonly=True)
+    warning_count = fields.Integer(string="Advertencias", readonly=True)
+    preview_line_ids = fields.One2many(
+        "sec.import.activity.preview", "wizard_id", string="Vista previa", readonly=True
+    )
+
+    @api.onchange("data_file", "project_id", "import_mode")
+    def _onchange_data_file(self):
+        # Un archivo o proyecto distinto invalida la validación previa.
+        self.state = "draft"
+        self.payload = False
+        self.payload_key = False
+        self.issues = False
+        self.error_count = 0
+        self.warning_count = 0
+        self.preview_line_ids = [(5, 0, 0)]
+
+    # ------------------------------------------------------------------
+    # Acciones
+    # ------------------------------------------------------------------
+
+    def action_validate(self):
+        """Valida el archivo sin escribir nada y muestra la vista previa."""
+        self.ensure_one()
+        self._validate_file()
+        return self._reopen()
 
     def action_import(self):
         self.ensure_one()
+        # El reinicio del onchange no llega al servidor (campos de solo
+        # lectura): se valida de nuevo si el archivo, el proyecto o el modo
+        # no son los de la validación guardada.
+        if not self.payload or self.payload_key != self._get_payload_key():
+            self._validate_file()
+        if self.error_count:
+            raise UserError(
+                _("El archivo contiene errores y no se importó:\n%s") % self.issues
+            )
+        stage_payload, rubro_tipos = self._load_payload()
+        self._apply_rubro_tipos(rubro_tipos)
+        result = self._import_payload(stage_payload)
+
+        self.project_id.message_post(
+            body=_(
+                "Importación completada. Se crearon %(created)s líneas de presupuesto, "
+                "se actualizaron %(updated)s y %(unchanged)s quedaron sin cambios. "
+                "Se fusionaron %(merged)s líneas duplicadas."
+            ) % {
+                "created": len(result["created"]),
+                "updated": len(result["updated"]),
+                "unchanged": len(result["unchanged"]),
+                "merged": result["merged"],
+            }
+        )
+        return {"type": "ir.actions.act_window_close"}
+
+    def _reopen(self):
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "view_mode": "form",
+            "res_id": self.id,
+            "target": "new",
+        }
+
+    # ------------------------------------------------------------------
+    # Lectura y validación
+    # ------------------------------------------------------------------
+
+    def _read_rows(self):
+        """Devuelve un iterador de filas (dict) del archivo CSV o XLSX."""
         if not self.data_file:
-            raise UserError(_("Debe seleccionar un archivo CSV."))
+            raise UserError(_("Debe seleccionar un archivo CSV o XLSX."))
         try:
             decoded = base64.b64decode(self.data_file)
         except Exception as exc:  # pylint: disable=broad-except
             raise UserError(_("El archivo no pudo decodificarse: %s") % exc) from exc
+        if self._is_xlsx(decoded):
+            return self._read_xlsx_rows(decoded)
+        return self._read_csv_rows(decoded)
+
+    def _is_xlsx(self, decoded):
+        if self.filename:
+            return self.filename.lower().endswith(".xlsx")
+        # Los .xlsx son archivos zip.
+        return decoded[:4] == b"PK\x03\x04"
+
+    def _read_csv_rows(self, decoded):
         try:
             content = decoded.decode("utf-8-sig")
         except UnicodeDecodeError:
@@ -37,27 +155,74 @@ class SecImportActivityWizard(models.TransientModel):
         except csv.Error:
             dialect = csv.get_dialect("excel")
         reader = csv.DictReader(io.StringIO(content), dialect=dialect)
-        required_headers = {
-            "Etapa",
-            "Actividad",
-            "Concepto",
-            "Tipo de Gasto",
-            "Total",
-            "Monto Programa",
-            "Monto Concurrente",
-            "Justificación Específica",
-            "Justificacion General",
-        }
-        missing = required_headers.difference(reader.fieldnames or [])
+        self._check_headers(reader.fieldnames)
+        return reader
+
+    def _read_xlsx_rows(self, decoded):
+        """Lee la primera hoja fila por fila con openpyxl en modo de solo lectura.
+
+        Las celdas se entregan como texto para compartir el mismo análisis que
+        el CSV; los números se convierten sin separadores de miles, por lo que
+        ``_parse_float`` los interpreta sin pérdida.
+        """
+        if not openpyxl:
+            raise UserError(_("No está disponible la librería openpyxl para leer archivos XLSX."))
+        try:
+            workbook = openpyxl.load_workbook(io.BytesIO(decoded), read_only=True, data_only=True)
+        except Exception as exc:  # pylint: disable=broad-except
+            raise UserError(_("El archivo XLSX no pudo leerse: %s") % exc) from exc
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        fieldnames = [self._cell_to_text(value) for value in header or []]
+        try:
+            self._check_headers(fieldnames)
+        except UserError:
+            workbook.close()
+            raise
+        return self._iter_xlsx_rows(workbook, rows, fieldnames)
+
+    def _iter_xlsx_rows(self, workbook, rows, fieldnames):
+        try:
+            for values in rows:
+                yield {
+                    fieldname: self._cell_to_text(value)
+                    for fieldname, value in zip(fieldnames, values)
+                    if fieldname
+                }
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _cell_to_text(value):
+        if value is None:
+            return ""
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value).strip()
+
+    @staticmethod
+    def _check_headers(fieldnames):
+        missing = REQUIRED_HEADERS.difference(fieldnames or [])
         if missing:
-            raise UserError(_("El archivo CSV no contiene las columnas requeridas: %s") % ", ".join(sorted(missing)))
+            raise UserError(_("El archivo no contiene las columnas requeridas: %s") % ", ".join(sorted(missing)))
+
+    def _parse_rows(self, rows):
+        """Recorre las filas una sola vez, sin escribir en la base de datos.
 
+        Devuelve ``(stage_payload, rubro_tipos, issues)`` donde ``issues`` es
+        una lista de ``(nivel, fila, mensaje)`` con todos los problemas
+        encontrados en lugar de detenerse en el primero.
+        """
         project = self.project_id
         pct_programa = project.pct_programa / 100.0
         pct_concurrente = project.pct_concurrente / 100.0
 
+        rubros = self._get_rubro_catalog()
         stage_payload = {}
-        for row in reader:
+        rubro_tipos = {}
+        issues = []
+        # La fila 1 es el encabezado.
+        for row_number, row in enumerate(rows, start=2):
             stage_name = (row.get("Etapa") or "").strip()
             activity_name = (row.get("Actividad") or "").strip()
             rubro_name = (row.get("Concepto") or "").strip()
@@ -68,8 +233,11 @@ class SecImportActivityWizard(models.TransientModel):
             justific_especifica = (row.get("Justificación Específica") or "").strip()
             justific_general = (row.get("Justificacion General") or "").strip()
 
+            if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+                # Fila vacía (frecuente al final de las hojas de Excel).
+                continue
             if not stage_name or not activity_name or not rubro_name:
-                _logger.warning("Fila omitida por falta de datos mínimos: %s", row)
+                issues.append(("warning", row_number, _("Fila omitida por falta de etapa, actividad o concepto.")))
                 continue
 
             total = self._parse_float(total_str)
@@ -80,19 +248,35 @@ class SecImportActivityWizard(models.TransientModel):
                 continue
 
             if float_compare(total, programa + concurrente, precision_digits=2) != 0:
+                issues.append((
+                    "warning",
+                    row_number,
+                    _("El total %(total)s no coincide con Programa + Concurrente (%(suma)s); "
+                      "se reparte según los porcentajes del proyecto.") % {
+                        "total": total,
+                        "suma": programa + concurrente,
+                    },
+                ))
                 programa = total * pct_programa
                 concurrente = total * pct_concurrente
 
-            rubro = self.env["sec.rubro"].search([("name", "=ilike", rubro_name)], limit=1)
+            rubro = rubros.get(self._normalize_name(rubro_name))
             if not rubro:
-                raise UserError(_("El rubro '%s' no existe en el catálogo." % rubro_name))
+                issues.append(("error", row_number, _("El rubro '%s' no existe en el catálogo.") % rubro_name))
+                continue
 
             desired_tipo = "inversion" if "invers" in tipo_gasto_label else "corriente"
-            if desired_tipo and rubro.tipo_gasto != desired_tipo:
-                _logger.warning(
-                    "Ajustando tipo de gasto del rubro %s de %s a %s durante la importación", rubro.name, rubro.tipo_gasto, desired_tipo
-                )
-                rubro.tipo_gasto = desired_tipo
+            if rubro.tipo_gasto != desired_tipo and rubro_tipos.get(rubro.id) != desired_tipo:
+                issues.append((
+                    "warning",
+                    row_number,
+                    _("El tipo de gasto del rubro %(rubro)s cambiará de %(actual)s a %(nuevo)s.") % {
+                        "rubro": rubro.name,
+                        "actual": rubro.tipo_gasto,
+                        "nuevo": desired_tipo,
+                    },
+                ))
+            rubro_tipos[rubro.id] = desired_tipo
 
             payload_stage = stage_payload.setdefault(stage_name, {
                 "total": 0.0,
@@ -106,68 +290,369 @@ class SecImportActivityWizard(models.TransientModel):
             if justific_general:
                 payload_activity["justificacion"] = justific_general
             payload_activity["lines"].append({
-                "rubro": rubro,
+                "rubro_id": rubro.id,
                 "total": total,
                 "programa": programa,
                 "concurrente": concurrente,
                 "justificacion": justific_especifica,
             })
+        return stage_payload, rubro_tipos, issues
 
-        created_lines = self.env["sec.activity.budget.line"]
+    def _validate_file(self):
+        """Analiza el archivo, guarda el resultado y la vista previa."""
+        self.ensure_one()
+        stage_payload, rubro_tipos, issues = self._parse_rows(self._read_rows())
+        labels = {"error": _("Error"), "warning": _("Advertencia")}
+        self.preview_line_ids.unlink()
+        self.write({
+            "state": "preview",
+            "payload": json.dumps({"stages": stage_payload, "rubro_tipos": rubro_tipos}),
+            "payload_key": self._get_payload_key(),
+            "issues": "\n".join(
+                _("Fila %(fila)s [%(nivel)s]: %(mensaje)s") % {
+                    "fila": row_number,
+                    "nivel": labels[level],
+                    "mensaje": message,
+                }
+                for level, row_number, message in issues
+            ) or False,
+            "error_count": len([issue for issue in issues if issue[0] == "error"]),
+            "warning_count": len([issue for issue in issues if issue[0] == "warning"]),
+            "preview_line_ids": [(0, 0, vals) for vals in self._get_preview_values(stage_payload)],
+        })
+
+    def _get_payload_key(self):
+        """Huella del archivo, proyecto y modo con que se generó ``payload``."""
+        data = self.data_file or b""
+        if isinstance(data, str):
+            data = data.encode()
+        digest = hashlib.sha1(data)
+        digest.update(("%s:%s" % (self.project_id.id, self.import_mode)).encode())
+        return digest.hexdigest()
+
+    def _load_payload(self):
+        data = json.loads(self.payload)
+        rubro_tipos = {int(rubro_id): tipo for rubro_id, tipo in data["rubro_tipos"].items()}
+        return data["stages"], rubro_tipos
+
+    def _get_preview_values(self, stage_payload):
+        """Totales proyectados por etapa y actividad tras la importación."""
+        project = self.project_id
+        pct_programa = project.pct_programa / 100.0
+        pct_concurrente = project.pct_concurrente / 100.0
+        upsert = self.import_mode == "upsert"
+        stages = self._get_stage_catalog()
+        stage_records = self.env["sec.stage"].concat(*stages.values())
+        activities = self._get_activity_catalog(stage_records)
+        existing_lines = self._get_line_catalog(stage_records) if upsert else {}
+        values = []
         for stage_name, data in stage_payload.items():
-            stage = self.env["sec.stage"].search([
-                ("project_id", "=", project.id),
-                ("name", "=", stage_name),
-            ], limit=1)
-            if not stage:
+            stage = stages.get(stage_name)
+            stage_values = {
+                "sequence": len(values),
+                "level": "stage",
+                "stage_name": stage_name,
+                "is_new": not stage,
+                "line_count": sum(len(activity["lines"]) for activity in data["activities"].values()),
+            }
+            values.append(stage_values)
+            if upsert:
+                # El presupuesto de la etapa será la suma final de sus líneas.
+                stage_programa = sum(stage.sec_activity_ids.mapped("amount_programa")) if stage else 0.0
+                stage_concurrente = sum(stage.sec_activity_ids.mapped("amount_concurrente")) if stage else 0.0
+            else:
                 total = data["total"]
-                stage_vals = {
+                stage_programa = (stage.amount_programa if stage else 0.0) + total * pct_programa
+                stage_concurrente = (stage.amount_concurrente if stage else 0.0) + total * pct_concurrente
+
+            for activity_name, activity_data in data["activities"].items():
+                activity = activities.get((stage.id, activity_name)) if stage else False
+                activity_programa = activity.amount_programa if activity else 0.0
+                activity_concurrente = activity.amount_concurrente if activity else 0.0
+                rows = activity_data["lines"]
+                if upsert:
+                    rows = self._merge_rows_by_rubro(rows)
+                for line_vals in rows:
+                    delta_programa = line_vals["programa"]
+                    delta_concurrente = line_vals["concurrente"]
+                    lines = existing_lines.get(
+                        (stage.id, activity.id, line_vals["rubro_id"])
+                    ) if activity else False
+                    if lines:
+                        # Los duplicados se funden en la línea importada.
+                        delta_programa -= sum(lines.mapped("amount_programa"))
+                        delta_concurrente -= sum(lines.mapped("amount_concurrente"))
+                    activity_programa += delta_programa
+                    activity_concurrente += delta_concurrente
+                    if upsert:
+                        stage_programa += delta_programa
+                        stage_concurrente += delta_concurrente
+                values.append({
+                    "sequence": len(values),
+                    "level": "activity",
+                    "stage_name": stage_name,
+                    "activity_name": activity_name,
+                    "is_new": not activity,
+                    "line_count": len(activity_data["lines"]),
+                    "amount_programa": activity_programa,
+                    "amount_concurrente": activity_concurrente,
+                    "amount_total": activity_programa + activity_concurrente,
+                })
+            stage_values.update({
+                "amount_programa": stage_programa,
+                "amount_concurrente": stage_concurrente,
+                "amount_total": stage_programa + stage_concurrente,
+            })
+        return values
+
+    # ------------------------------------------------------------------
+    # Catálogos
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _normalize_name(name):
+        return (name or "").strip().lower()
+
+    def _get_rubro_catalog(self):
+        """Rubros activos por nombre normalizado (equivale a ``=ilike``)."""
+        rubros = {}
+        for rubro in self.env["sec.rubro"].search([]):
+            rubros.setdefault(self._normalize_name(rubro.name), rubro)
+        return rubros
+
+    def _get_stage_catalog(self):
+        """Etapas del proyecto por nombre."""
+        stages = {}
+        for stage in self.env["sec.stage"].search([("project_id", "=", self.project_id.id)]):
+            stages.setdefault(stage.name, stage)
+        return stages
+
+    def _get_activity_catalog(self, stages):
+        """Actividades de ``stages`` por (etapa, nombre)."""
+        activities = {}
+        for activity in self.env["sec.activity"].search([("stage_id", "in", stages.ids)]):
+            activities.setdefault((activity.stage_id.id, activity.name), activity)
+        return activities
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def _apply_rubro_tipos(self, rubro_tipos):
+        """Ajusta el tipo de gasto de los rubros según el archivo."""
+        for rubro in self.env["sec.rubro"].browse(list(rubro_tipos)):
+            desired_tipo = rubro_tipos[rubro.id]
+            if rubro.tipo_gasto != desired_tipo:
+                _logger.warning(
+                    "Ajustando tipo de gasto del rubro %s de %s a %s durante la importación", rubro.name, rubro.tipo_gasto, desired_tipo
+                )
+                rubro.tipo_gasto = desired_tipo
+
+    def _import_payload(self, stage_payload):
+        """Crea o actualiza etapas, actividades y líneas con los datos leídos.
+
+        Los catálogos se cargan una sola vez y las líneas se crean en un solo
+        ``create``; así no hay búsquedas entre escrituras y el recálculo de
+        los campos almacenados (ejecución, semáforo, totales) se hace una vez
+        al final.
+
+        En modo ``upsert`` las filas se emparejan con las líneas existentes
+        por (etapa, actividad, rubro) y solo se escriben las que cambiaron
+        respecto de la última importación; los montos de las etapas se
+        recalculan a partir de sus líneas.
+
+        Devuelve un dict con las líneas ``created``, ``updated`` y
+        ``unchanged`` y el número de duplicados fundidos en ``merged``.
+        """
+        project = self.project_id
+        pct_programa = project.pct_programa / 100.0
+        pct_concurrente = project.pct_concurrente / 100.0
+        upsert = self.import_mode == "upsert"
+        ctx = dict(self.env.context, tracking_disable=True, mail_create_nolog=True)
+        Stage = self.env["sec.stage"].with_context(ctx)
+        Activity = self.env["sec.activity"].with_context(ctx)
+        Line = self.env["sec.activity.budget.line"].with_context(ctx)
+        Rubro = self.env["sec.rubro"]
+
+        stages = self._get_stage_catalog()
+        activities = self._get_activity_catalog(Stage.concat(*stages.values()))
+        existing_lines = self._get_line_catalog(Stage.concat(*stages.values())) if upsert else {}
+
+        result = {"created": Line, "updated": Line, "unchanged": Line, "merged": 0}
+        touched_stages = Stage
+        duplicates = Line
+        line_vals_list = []
+        for stage_name, data in stage_payload.items():
+            total = data["total"]
+            stage = stages.get(stage_name)
+            if not stage:
+                stage = Stage.create({
                     "name": stage_name,
                     "code": stage_name,
                     "project_id": project.id,
                     "amount_programa": total * pct_programa,
                     "amount_concurrente": total * pct_concurrente,
-                }
-                stage = self.env["sec.stage"].create(stage_vals)
-            else:
-                total = data["total"]
-                stage_vals = {
+                })
+                stages[stage_name] = stage
+            elif not upsert:
+                stage.write({
                     "amount_programa": stage.amount_programa + total * pct_programa,
                     "amount_concurrente": stage.amount_concurrente + total * pct_concurrente,
-                }
-                stage.write(stage_vals)
+                })
+            touched_stages |= stage
 
             for activity_name, activity_data in data["activities"].items():
-                activity = self.env["sec.activity"].search([
-                    ("stage_id", "=", stage.id),
-                    ("name", "=", activity_name),
-                ], limit=1)
+                activity = activities.get((stage.id, activity_name))
                 if not activity:
-                    activity = self.env["sec.activity"].create({
+                    activity = Activity.create({
                         "name": activity_name,
                         "code": activity_name,
                         "stage_id": stage.id,
                         "justif_general": activity_data.get("justificacion"),
                     })
-                else:
-                    if activity_data.get("justificacion"):
-                        activity.write({"justif_general": activity_data["justificacion"]})
-
-                for line_vals in activity_data["lines"]:
-                    line = self.env["sec.activity.budget.line"].create({
-                        "activity_id": activity.id,
-                        "rubro_id": line_vals["rubro"].id,
-                        "name": line_vals["rubro"].name,
+                    activities[(stage.id, activity_name)] = activity
+                elif activity_data.get("justificacion") and (
+                    not upsert or activity.justif_general != activity_data["justificacion"]
+                ):
+                    activity.write({"justif_general": activity_data["justificacion"]})
+
+                rows = activity_data["lines"]
+                if upsert:
+                    rows = self._merge_rows_by_rubro(rows)
+                for line_vals in rows:
+                    rubro = Rubro.browse(line_vals["rubro_id"])
+                    vals = {
+                        "name": rubro.name,
                         "amount_programa": line_vals["programa"],
                         "amount_concurrente": line_vals["concurrente"],
                         "justification": line_vals["justificacion"],
-                    })
-                    created_lines |= line
+                    }
+                    vals["import_hash"] = self._get_line_hash(vals)
+                    lines = existing_lines.get((stage.id, activity.id, rubro.id), Line)
+                    line = lines[:1]
+                    # Duplicados de importaciones previas en modo agregar:
+                    # la fila del archivo representa a toda la clave.
+                    duplicates |= lines[1:]
+                    if not line:
+                        vals.update(activity_id=activity.id, rubro_id=rubro.id)
+                        line_vals_list.append(vals)
+                    elif line.import_hash == vals["import_hash"]:
+                        result["unchanged"] |= line
+                    else:
+                        line.with_context(ctx).write(vals)
+                        result["updated"] |= line
+
+        if line_vals_list:
+            result["created"] = Line.create(line_vals_list)
+        if duplicates:
+            self._merge_duplicate_lines(duplicates)
+            result["merged"] = len(duplicates)
+        if upsert:
+            self._recompute_stage_amounts(touched_stages)
+        # Un solo recálculo de los campos almacenados pendientes.
+        self.flush()
+        return result
+
+    def _get_line_catalog(self, stages):
+        """Líneas existentes de ``stages`` por (etapa, actividad, rubro).
+
+        Cada clave apunta a todas sus líneas ordenadas por id: la primera es
+        la que recibe la fila importada y el resto son duplicados.
+        """
+        Line = self.env["sec.activity.budget.line"]
+        lines = {}
+        for line in Line.search([("stage_id", "in", stages.ids)], order="id"):
+            key = (line.stage_id.id, line.activity_id.id, line.rubro_id.id)
+            lines[key] = lines.get(key, Line) | line
+        return lines
 
-        project.message_post(
-            body=_("Importación completada. Se crearon %s líneas de presupuesto." % len(created_lines))
+    def _merge_duplicate_lines(self, duplicates):
+        """Elimina los duplicados ya cubiertos por una línea importada.
+
+        La ejecución de ``duplicates`` se reasigna a la línea que se conserva
+        (ver ``unlink`` de la línea). Si alguno participa en una transferencia
+        no se puede eliminar sin perder su historial y la importación se
+        rechaza para que se revise a mano.
+        """
+        transfers = self.env["sec.budget.transfer"].sudo().search(
+            ["|", ("line_from_id", "in", duplicates.ids), ("line_to_id", "in", duplicates.ids)]
         )
-        return {"type": "ir.actions.act_window_close"}
+        if transfers:
+            blocked = (transfers.mapped("line_from_id") | transfers.mapped("line_to_id")) & duplicates
+            raise UserError(
+                _(
+                    "Hay líneas duplicadas (misma etapa, actividad y rubro) con "
+                    "transferencias y no se pueden fusionar con la importación:\n%s"
+                )
+                % "\n".join(
+                    "- %s / %s / %s" % (line.stage_id.display_name, line.activity_id.display_name,
+                                        line.rubro_id.display_name)
+                    for line in blocked
+                )
+            )
+        duplicates.unlink()
+
+    @staticmethod
+    def _merge_rows_by_rubro(rows):
+        """Une las filas repetidas de un mismo rubro en una actividad.
+
+        En modo ``upsert`` cada (etapa, actividad, rubro) corresponde a una
+        sola línea: se suman los montos y se conserva la última
+        justificación no vacía.
+        """
+        merged = {}
+        for row in rows:
+            current = merged.get(row["rubro_id"])
+            if not current:
+                merged[row["rubro_id"]] = dict(row)
+                continue
+            current["total"] += row["total"]
+            current["programa"] += row["programa"]
+            current["concurrente"] += row["concurrente"]
+            if row["justificacion"]:
+                current["justificacion"] = row["justificacion"]
+        return list(merged.values())
+
+    @staticmethod
+    def _get_line_hash(vals):
+        content = json.dumps(
+            [
+                vals["name"] or "",
+                float_round(vals["amount_programa"] or 0.0, precision_digits=2),
+                float_round(vals["amount_concurrente"] or 0.0, precision_digits=2),
+                vals["justification"] or "",
+            ]
+        )
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def _recompute_stage_amounts(self, stages):
+        """Fija el presupuesto de ``stages`` como la suma de sus líneas."""
+        if not stages:
+            return
+        Line = self.env["sec.activity.budget.line"]
+        Line.flush(["amount_programa", "amount_concurrente", "stage_id"])
+        groups = Line.read_group(
+            [("stage_id", "in", stages.ids)],
+            ["stage_id", "amount_programa", "amount_concurrente"],
+            ["stage_id"],
+        )
+        totals = {
+            group["stage_id"][0]: (group["amount_programa"], group["amount_concurrente"])
+            for group in groups
+        }
+        for stage in stages:
+            amount_programa, amount_concurrente = totals.get(stage.id, (0.0, 0.0))
+            if float_compare(stage.amount_programa, amount_programa, precision_digits=2) or float_compare(
+                stage.amount_concurrente, amount_concurrente, precision_digits=2
+            ):
+                stage.write({
+                    "amount_programa": amount_programa,
+                    "amount_concurrente": amount_concurrente,
+                })
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
 
     @staticmethod
     def _parse_float(value):
@@ -182,6 +667,27 @@ class SecImportActivityWizard(models.TransientModel):
 
 
 try:
-    from odoo.tools.float_utils import float_compare
+    from odoo.tools.float_utils import float_compare, float_round
 except ImportError:  # pragma: no cover
-    from odoo.tools import float_compare
+    from odoo.tools import float_compare, float_round
+
+
+class SecImportActivityPreview(models.TransientModel):
+    _name = "sec.import.activity.preview"
+    _description = "Vista previa de importación de actividades SECIHTI"
+    _order = "sequence, id"
+
+    wizard_id = fields.Many2one(
+        "sec.import.activity.wizard", required=True, ondelete="cascade"
+    )
+    sequence = fields.Integer()
+    level = fields.Selection(
+        [("stage", "Etapa"), ("activity", "Actividad")], string="Nivel"
+    )
+    stage_name = fields.Char(string="Etapa")
+    activity_name = fields.Char(string="Actividad")
+    is_new = fields.Boolean(string="Nueva")
+    line_count = fields.Integer(string="Líneas")
+    amount_programa = fields.Float(string="Programa proyectado")
+    amount_concurrente = fields.Float(string="Concurrente proyectado")
+    amount_total = fields.Float(string="Total proyectado")
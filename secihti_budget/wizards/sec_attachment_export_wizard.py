@@ -1,19 +1,204 @@
 # -*- coding: utf-8 -*-
-import base64
 import io
-import logging
-import threading
+import os
+import shutil
+import struct
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import odoo
-from odoo import _, fields, models
+from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
-_logger = logging.getLogger(__name__)
+from ..models.sec_attachment_export_manifest import MANIFEST_SCOPE_FIELDS
+from ..models.sec_export_mixin import EXPORT_CHUNK_SIZE
+from ..models.sec_purchase_pdf_cache import PDF_BATCH_SIZE_PARAM
+
+ZIP_MIMETYPE = "application/zip"
+
+# Formatos que ya vienen comprimidos: se guardan sin volver a comprimir.
+ZIP_STORED_MIMETYPES = {
+    "application/pdf",
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/gzip",
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+}
+ZIP_STORED_MIMETYPE_PREFIXES = (
+    "application/vnd.openxmlformats-officedocument.",
+    "application/vnd.oasis.opendocument.",
+    "audio/",
+    "video/",
+)
+
+# Índice de archivos repetidos que se escribieron una sola vez.
+DUPLICATES_ARCNAME = "DUPLICADOS.txt"
+# En exportaciones diferenciales, rutas que ya no existen desde la base.
+REMOVED_ARCNAME = "ELIMINADOS.txt"
+
+# Órdenes por parte (y por punto de control) en los trabajos en cola.
+JOB_CHUNK_SIZE = 25
+
+# Renders de PDF simultáneos (el tamaño de lote vive junto a la caché).
+PDF_WORKERS_PARAM = "secihti_budget.pdf_render_workers"
+
+# Tamaño máximo por volumen propuesto en el asistente (MB, 0 = sin límite).
+VOLUME_MAX_MB_PARAM = "secihti_budget.export_volume_max_mb"
+
+# Bytes que ocupa cada entrada además de su nombre y sus datos: cabecera
+# local y registro del directorio central, con sus campos extra ZIP64.
+ZIP_LOCAL_OVERHEAD = zipfile.sizeFileHeader + 20
+ZIP_CENTRAL_OVERHEAD = zipfile.sizeCentralDir + 28
+# Fin del directorio central, con los registros ZIP64.
+ZIP_END_OVERHEAD = (
+    zipfile.sizeEndCentDir + zipfile.sizeEndCentDir64 + zipfile.sizeEndCentDir64Locator
+)
+
+
+class ZipVolumeWriter:
+    """Escribe un ZIP dividido en volúmenes de hasta ``max_size`` bytes.
+
+    Los tamaños se estiman antes de escribir cada entrada (ver
+    ``entry_size``) y cuentan también el directorio central que se escribe
+    al cerrar el volumen, así que un archivo mayor que el tope ocupa su
+    propio volumen. Un grupo (carpeta de rubro) que cabe completo en un
+    volumen nuevo no se parte entre dos. Cada volumen se entrega a
+    ``on_close(path, index)`` en cuanto se cierra.
+    """
+
+    def __init__(self, new_path, on_close, max_size=0):
+        self._new_path = new_path
+        self._on_close = on_close
+        self.max_size = max_size
+        self.results = []
+        self.zip_file = None
+        self._path = None
+        self._group = None
+        # Directorio central pendiente de las entradas del volumen actual.
+        self._directory_size = 0
+
+    @staticmethod
+    def entry_size(size, arcname):
+        """Bytes que ocupa en el volumen una entrada de ``size`` bytes.
+
+        Incluye sus cabeceras, su registro del directorio central y lo que
+        deflate puede agregar a datos que no se comprimen (5 bytes por
+        bloque de 16 KB).
+        """
+        name_size = len(arcname.encode("utf-8"))
+        return (
+            ZIP_LOCAL_OVERHEAD
+            + ZIP_CENTRAL_OVERHEAD
+            + 2 * name_size
+            + size
+            + 5 * (size // 16384 + 1)
+        )
+
+    def _open(self):
+        self._path = self._new_path(".zip")
+        self.zip_file = zipfile.ZipFile(
+            self._path, mode="w", compression=zipfile.ZIP_DEFLATED, allowZip64=True
+        )
+        self._directory_size = 0
+
+    def _close_current(self):
+        self.zip_file.close()
+        path, self.zip_file, self._path = self._path, None, None
+        self.results.append(self._on_close(path, len(self.results) + 1))
+
+    def _needs_room(self, size):
+        """Indica si ``size`` bytes más (con su directorio) exceden el volumen."""
+        return (
+            self.max_size
+            and self.zip_file.filelist
+            and self.zip_file.fp.tell() + self._directory_size + ZIP_END_OVERHEAD + size
+            > self.max_size
+        )
+
+    def start_group(self, group, size):
+        """Empieza volumen nuevo si el grupo ``group`` no cabe en el actual.
+
+        ``size`` es la suma de ``entry_size`` de las entradas del grupo.
+        """
+        if self.zip_file is None:
+            self._open()
+        if group != self._group and self._needs_room(size):
+            self._close_current()
+            self._open()
+        self._group = group
+
+    def reserve(self, size, arcname):
+        """Devuelve el ZIP donde escribir la entrada ``arcname`` de ``size`` bytes."""
+        if self.zip_file is None:
+            self._open()
+        elif self._needs_room(self.entry_size(size, arcname)):
+            self._close_current()
+            self._open()
+        self._directory_size += ZIP_CENTRAL_OVERHEAD + len(arcname.encode("utf-8"))
+        return self.zip_file
+
+    def close(self):
+        """Cierra el último volumen (siempre hay al menos uno)."""
+        if self.zip_file is None:
+            self._open()
+        self._close_current()
+        return self.results
+
+    def abort(self):
+        if self.zip_file is not None:
+            self.zip_file.close()
+            os.unlink(self._path)
+            self.zip_file = None
+
+    def copy_entry(self, source_zip, info):
+        """Copia la entrada ``info`` de ``source_zip`` tal como está comprimida.
+
+        No se descomprime ni se vuelve a comprimir: se escribe una cabecera
+        local nueva (con CRC y tamaños ya conocidos) y se copian los bytes
+        comprimidos por bloques.
+        """
+        zip_file = self.reserve(info.compress_size, info.filename)
+        source = source_zip.fp
+        source.seek(info.header_offset)
+        header = struct.unpack(
+            zipfile.structFileHeader, source.read(zipfile.sizeFileHeader)
+        )
+        source.seek(
+            header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH],
+            os.SEEK_CUR,
+        )
+        target_info = zipfile.ZipInfo(info.filename, info.date_time)
+        target_info.compress_type = info.compress_type
+        target_info.external_attr = info.external_attr
+        target_info.create_system = info.create_system
+        # Sin descriptor de datos: la cabecera ya lleva CRC y tamaños.
+        target_info.flag_bits = info.flag_bits & ~0x08
+        target_info.CRC = info.CRC
+        target_info.compress_size = info.compress_size
+        target_info.file_size = info.file_size
+        target_info.header_offset = zip_file.fp.tell()
+        zip_file.fp.write(target_info.FileHeader())
+        remaining = info.compress_size
+        while remaining:
+            chunk = source.read(min(remaining, EXPORT_CHUNK_SIZE))
+            if not chunk:
+                raise zipfile.BadZipFile("Entrada truncada: %s" % info.filename)
+            zip_file.fp.write(chunk)
+            remaining -= len(chunk)
+        zip_file.filelist.append(target_info)
+        zip_file.NameToInfo[target_info.filename] = target_info
+        zip_file.start_dir = zip_file.fp.tell()
+        zip_file._didModify = True
 
 
 class SecAttachmentExportWizard(models.TransientModel):
     _name = "sec.attachment.export.wizard"
+    _inherit = "sec.export.mixin"
     _description = "Exportar adjuntos de ordenes SECIHTI"
 
     project_id = fields.Many2one("sec.project", string="Proyecto", required=True)
@@ -48,8 +233,63 @@ class SecAttachmentExportWizard(models.TransientModel):
     )
     progress_message = fields.Char(string="Progreso", readonly=True)
     error_message = fields.Text(string="Mensaje de error", readonly=True)
-    file_data = fields.Binary(string="Archivo", readonly=True)
-    filename = fields.Char(string="Nombre de archivo", readonly=True)
+    job_id = fields.Many2one(
+        "sec.export.job", string="Trabajo", readonly=True, ondelete="set null"
+    )
+    export_mode = fields.Selection(
+        [
+            ("full", "Completa"),
+            ("delta", "Solo nuevos o modificados"),
+        ],
+        default="full",
+        required=True,
+        string="Tipo de exportación",
+    )
+    volume_max_mb = fields.Integer(
+        string="Tamaño máximo por volumen (MB)",
+        default=lambda self: int(
+            self.env["ir.config_parameter"].sudo().get_param(VOLUME_MAX_MB_PARAM, "0")
+        ),
+        help="Divide la exportación en varios ZIP de este tamaño como máximo, "
+        "agrupados por carpeta de rubro. 0 genera un solo archivo.",
+    )
+    volume_ids = fields.Many2many(
+        "ir.attachment",
+        "sec_attachment_export_wizard_volume_rel",
+        "wizard_id",
+        "attachment_id",
+        string="Volúmenes",
+        readonly=True,
+    )
+    volume_count = fields.Integer(compute="_compute_volume_count")
+    base_manifest_id = fields.Many2one(
+        "sec.attachment.export.manifest",
+        string="Desde la exportación",
+        domain="[('scope_key', '=', scope_key)]",
+        help="Solo se incluyen los archivos nuevos o modificados desde esta exportación. "
+        "Debe haberse generado con los mismos filtros.",
+    )
+    scope_key = fields.Char(compute="_compute_scope_key")
+
+    @api.depends("volume_ids")
+    def _compute_volume_count(self):
+        for wizard in self:
+            wizard.volume_count = len(wizard.volume_ids)
+
+    @api.depends(*MANIFEST_SCOPE_FIELDS)
+    def _compute_scope_key(self):
+        manifests = self.env["sec.attachment.export.manifest"]
+        for wizard in self:
+            wizard.scope_key = manifests._get_scope_key(wizard._get_scope_values())
+
+    @api.onchange("export_mode", *MANIFEST_SCOPE_FIELDS)
+    def _onchange_export_mode(self):
+        if self.export_mode != "delta":
+            self.base_manifest_id = False
+        elif self.base_manifest_id.scope_key != self.scope_key:
+            self.base_manifest_id = self.env["sec.attachment.export.manifest"].search(
+                [("scope_key", "=", self.scope_key)], limit=1
+            )
 
     # ------------------------------------------------------------------
     # Actions
@@ -61,16 +301,44 @@ class SecAttachmentExportWizard(models.TransientModel):
             raise UserError(
                 _("Debe seleccionar al menos una opción de exportación.")
             )
+        if self.export_mode == "delta" and not self.base_manifest_id:
+            raise UserError(
+                _("Seleccione la exportación desde la cual generar la diferencia.")
+            )
+        if (
+            self.export_mode == "delta"
+            and self.base_manifest_id.scope_key != self.scope_key
+        ):
+            raise UserError(
+                _(
+                    "La exportación base se generó con otros filtros (proyecto, "
+                    "fechas, estados, rubro, MXN pendiente o contenido). Elija una "
+                    "exportación con los mismos filtros o genere una completa."
+                )
+            )
 
         # Fast path: attachments only (no PDF rendering) – synchronous
         if not self.export_purchase_orders:
-            orders = self._get_orders()
-            zip_buffer = self._build_zip_buffer(orders)
-            filename = self._build_filename()
+            orders = self._sort_orders_for_volumes(self._get_orders())
+            zip_state = self._new_zip_state()
+            self._clear_export_result()
+            volumes = self._build_zip_volumes(
+                orders,
+                zip_state,
+                lambda path, index: self._store_volume(path, index, self._name, self.id),
+                max_size=self._get_volume_max_size(),
+            )
+            volumes = self._finalize_volumes(volumes)
+            self.write(
+                {
+                    "attachment_id": volumes[:1].id,
+                    "filename": self._build_filename(),
+                    "volume_ids": [(6, 0, volumes.ids)],
+                }
+            )
+            self._record_manifest(zip_state)
             self.write(
                 {
-                    "file_data": base64.b64encode(zip_buffer.getvalue()),
-                    "filename": filename,
                     "state": "done",
                     "progress_message": _(
                         "Exportación completada: %d órdenes."
@@ -79,18 +347,19 @@ class SecAttachmentExportWizard(models.TransientModel):
             )
             return self._reopen_wizard()
 
-        # Slow path: PDF generation required – background thread
+        # Slow path: PDF generation required – export job queue
+        self._clear_export_result()
+        job = self.env["sec.export.job"]._enqueue(
+            self, "_job_export_zip", self._build_filename()
+        )
         self.write(
             {
                 "state": "processing",
-                "progress_message": _("Iniciando exportación..."),
-                "file_data": False,
-                "filename": False,
+                "job_id": job.id,
+                "progress_message": _("Exportación en cola..."),
                 "error_message": False,
             }
         )
-        self.env.cr.commit()
-        self._launch_background_export()
         return self._reopen_wizard()
 
     def action_refresh(self):
@@ -99,17 +368,42 @@ class SecAttachmentExportWizard(models.TransientModel):
 
     def action_reset(self):
         self.ensure_one()
+        self.job_id.action_cancel()
         self.write(
             {
                 "state": "draft",
-                "file_data": False,
-                "filename": False,
+                "job_id": False,
                 "error_message": False,
                 "progress_message": False,
             }
         )
+        self._clear_export_result()
         return self._reopen_wizard()
 
+    def action_download(self):
+        self.ensure_one()
+        if not self.attachment_id and self.job_id:
+            return self.job_id.action_download()
+        return super().action_download()
+
+    def _clear_export_result(self):
+        attachments = self._get_own_export_attachments()
+        self.write({"attachment_id": False, "filename": False, "volume_ids": [(5, 0, 0)]})
+        attachments.sudo().unlink()
+
+    def _get_own_export_attachments(self):
+        """Archivos generados por el asistente (no los de su trabajo en cola)."""
+        return (self.mapped("attachment_id") | self.mapped("volume_ids")).filtered(
+            lambda attachment: attachment.res_model == self._name
+        )
+
+    def unlink(self):
+        # ``attachment_id`` ya lo elimina el mixin; aquí solo los demás volúmenes.
+        attachments = self._get_own_export_attachments() - self.mapped("attachment_id")
+        res = super().unlink()
+        attachments.sudo().unlink()
+        return res
+
     def _reopen_wizard(self):
         return {
             "type": "ir.actions.act_window",
@@ -123,86 +417,149 @@ class SecAttachmentExportWizard(models.TransientModel):
     # Background export
     # ------------------------------------------------------------------
 
-    def _launch_background_export(self):
-        db_name = self.env.cr.dbname
-        uid = self.env.uid
-        wizard_id = self.id
-
-        def _generate():
-            with odoo.api.Environment.manage():
-                try:
-                    with odoo.registry(db_name).cursor() as new_cr:
-                        env = odoo.api.Environment(new_cr, uid, {})
-                        wizard = env["sec.attachment.export.wizard"].browse(
-                            wizard_id
-                        )
-                        if not wizard.exists():
-                            _logger.warning(
-                                "Export wizard %s no longer exists, aborting.",
-                                wizard_id,
-                            )
-                            return
-
-                        orders = wizard._get_orders()
-                        total = len(orders)
-                        wizard.write(
-                            {
-                                "progress_message": _(
-                                    "Procesando %d órdenes..."
-                                ) % total,
-                            }
-                        )
-                        new_cr.commit()
+    def _job_export_zip(self, job):
+        """Genera el ZIP desde la cola de trabajos, por partes.
 
-                        zip_buffer = wizard._build_zip_buffer_with_progress(
-                            orders, new_cr
-                        )
-                        filename = wizard._build_filename()
-
-                        wizard.write(
-                            {
-                                "file_data": base64.b64encode(
-                                    zip_buffer.getvalue()
-                                ),
-                                "filename": filename,
-                                "state": "done",
-                                "progress_message": _(
-                                    "Exportación completada: %d órdenes."
-                                ) % total,
-                            }
-                        )
-                        new_cr.commit()
-                except Exception as e:
-                    _logger.exception(
-                        "Background export failed for wizard %s", wizard_id
-                    )
-                    try:
-                        with odoo.registry(db_name).cursor() as err_cr:
-                            env = odoo.api.Environment(err_cr, uid, {})
-                            wizard = env[
-                                "sec.attachment.export.wizard"
-                            ].browse(wizard_id)
-                            if wizard.exists():
-                                wizard.write(
-                                    {
-                                        "state": "error",
-                                        "error_message": str(e),
-                                        "progress_message": False,
-                                    }
-                                )
-                            err_cr.commit()
-                    except Exception:
-                        _logger.exception(
-                            "Failed to write error state for wizard %s",
-                            wizard_id,
-                        )
+        Cada parte cubre ``JOB_CHUNK_SIZE`` órdenes y se guarda como adjunto
+        del trabajo junto con el punto de control; si el proceso muere, el
+        trabajo continúa desde la última parte guardada. Al final las partes
+        se unen en un solo ZIP.
+        """
+        self.ensure_one()
+        checkpoint = job._get_checkpoint()
+        if not checkpoint:
+            checkpoint = {
+                "order_ids": self._sort_orders_for_volumes(self._get_orders()).ids,
+                "done": 0,
+                "part_ids": [],
+                "zip_state": self._new_zip_state(),
+            }
+        order_ids = checkpoint["order_ids"]
+        total = len(order_ids)
+        zip_state = checkpoint["zip_state"]
+        filename = self._build_filename()
+        while checkpoint["done"] < total:
+            start = checkpoint["done"]
+            orders = self.env["purchase.order"].browse(
+                order_ids[start:start + JOB_CHUNK_SIZE]
+            ).exists()
+            part_name = "%s.parte%03d" % (filename, len(checkpoint["part_ids"]) + 1)
+            part = self._build_zip_volumes(
+                orders,
+                zip_state,
+                lambda path, index: self._store_export_file(
+                    path, part_name, ZIP_MIMETYPE, res_model=job._name, res_id=job.id
+                ),
+                with_index=False,
+                heartbeat=job._heartbeat,
+            )[0]
+            checkpoint["part_ids"].append(part.id)
+            checkpoint["done"] = min(start + JOB_CHUNK_SIZE, total)
+            message = _("Procesando orden %d de %d...") % (checkpoint["done"], total)
+            self.write({"progress_message": message})
+            job._save_checkpoint(
+                checkpoint, progress=100.0 * checkpoint["done"] / total, message=message
+            )
+
+        parts = self.env["ir.attachment"].browse(checkpoint["part_ids"])
+        max_size = self._get_volume_max_size()
+        if (
+            len(parts) == 1
+            and not self._get_zip_indexes(zip_state)
+            and (not max_size or parts.file_size <= max_size)
+        ):
+            volumes = parts
+        else:
+            volumes = self._merge_zip_parts(
+                parts,
+                zip_state,
+                lambda path, index: self._store_volume(path, index, job._name, job.id),
+                max_size,
+                heartbeat=job._heartbeat,
+            )
+            parts.sudo().unlink()
+        volumes = self._finalize_volumes(volumes)
+        job._set_result(volumes)
+        self._record_manifest(zip_state)
+        self.write(
+            {
+                "state": "done",
+                "filename": filename,
+                "volume_ids": [(6, 0, volumes.ids)],
+                "progress_message": _("Exportación completada: %d órdenes.") % total,
+            }
+        )
 
-        thread = threading.Thread(
-            target=_generate,
-            name="export-wizard-%d" % wizard_id,
-            daemon=True,
+    def _get_job_values(self):
+        """Parámetros para recrear el asistente si se limpia antes del trabajo."""
+        self.ensure_one()
+        return {
+            "project_id": self.project_id.id,
+            "date_from": fields.Date.to_string(self.date_from) if self.date_from else False,
+            "date_to": fields.Date.to_string(self.date_to) if self.date_to else False,
+            "state_filter": self.state_filter,
+            "rubro_id": self.rubro_id.id,
+            "include_pending": self.include_pending,
+            "export_attachments": self.export_attachments,
+            "export_purchase_orders": self.export_purchase_orders,
+            "export_mode": self.export_mode,
+            "base_manifest_id": self.base_manifest_id.id,
+            "volume_max_mb": self.volume_max_mb,
+            "state": "processing",
+        }
+
+    def _on_job_failed(self, job, error):
+        self.write(
+            {
+                "state": "error",
+                "error_message": str(error),
+                "progress_message": False,
+            }
         )
-        thread.start()
+
+    def _merge_zip_parts(self, parts, zip_state, on_close, max_size=0, heartbeat=None):
+        """Une las partes en volúmenes nuevos copiando cada entrada por bloques.
+
+        Las entradas se copian ya comprimidas (``ZipVolumeWriter.copy_entry``).
+        ``heartbeat`` (opcional) se llama por cada entrada copiada.
+        """
+        group_sizes = {}
+        for part in parts:
+            with self._open_attachment_file(part) as source, zipfile.ZipFile(
+                source
+            ) as part_zip:
+                for info in part_zip.infolist():
+                    group = self._get_arcname_group(info.filename)
+                    group_sizes[group] = group_sizes.get(group, 0) + ZipVolumeWriter.entry_size(
+                        info.compress_size, info.filename
+                    )
+        volumes = ZipVolumeWriter(self._new_export_path, on_close, max_size)
+        try:
+            for part in parts:
+                with self._open_attachment_file(part) as source, zipfile.ZipFile(
+                    source
+                ) as part_zip:
+                    for info in part_zip.infolist():
+                        if heartbeat:
+                            heartbeat()
+                        group = self._get_arcname_group(info.filename)
+                        volumes.start_group(group, group_sizes[group])
+                        volumes.copy_entry(part_zip, info)
+            self._write_zip_indexes(volumes, zip_state)
+            results = volumes.close()
+        except Exception:
+            volumes.abort()
+            raise
+        return self.env["ir.attachment"].union(*results)
+
+    @staticmethod
+    def _open_attachment_file(attachment):
+        """Abre el contenido del adjunto como archivo binario de solo lectura."""
+        if attachment.store_fname:
+            full_path = attachment._full_path(attachment.store_fname)
+            if os.path.isfile(full_path):
+                return open(full_path, "rb")
+        return io.BytesIO(attachment.raw or b"")
 
     # ------------------------------------------------------------------
     # Order query helpers
@@ -237,75 +594,339 @@ class SecAttachmentExportWizard(models.TransientModel):
     # ZIP builders
     # ------------------------------------------------------------------
 
-    def _build_zip_buffer(self, orders):
-        """Synchronous ZIP builder (used for attachments-only export)."""
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(
-            buffer, mode="w", compression=zipfile.ZIP_DEFLATED
-        ) as zip_file:
+    def _new_zip_state(self):
+        """Estado de una exportación que se conserva entre partes.
+
+        ``written``: checksum -> ruta escrita; ``duplicates``: pares (ruta
+        omitida, ruta con el contenido); ``manifest``: clave -> [checksum,
+        ruta] de todo lo que abarca la exportación, se haya escrito o no.
+        """
+        return {"written": {}, "duplicates": [], "manifest": {}}
+
+    def _build_zip_volumes(
+        self, orders, zip_state, on_close, max_size=0, with_index=True, heartbeat=None
+    ):
+        """Escribe el ZIP en volúmenes y devuelve los adjuntos guardados.
+
+        Los adjuntos idénticos (mismo checksum) se escriben una sola vez; las
+        demás rutas se listan en ``DUPLICADOS.txt``. En modo diferencial solo
+        se escribe lo que cambió respecto al manifiesto base. ``zip_state``
+        permite continuar entre partes de un trabajo; con
+        ``with_index=False`` los índices no se escriben. Cada volumen se
+        guarda con ``on_close(path, index)`` en cuanto se cierra y
+        ``heartbeat`` (opcional) se llama por cada orden.
+        """
+        attachments_by_order = {}
+        if self.export_attachments:
+            attachments_by_order = self._get_attachments_by_order(orders)
+        pdf_orders = orders.browse()
+        if self.export_purchase_orders:
+            pdf_orders = self._get_changed_pdf_orders(orders, zip_state)
+        group_sizes = {}
+        for order in orders:
+            group = self._get_order_group(order)
+            group_sizes[group] = group_sizes.get(group, 0) + sum(
+                ZipVolumeWriter.entry_size(
+                    attachment.file_size, self._get_attachment_arcname(order, attachment)
+                )
+                for attachment in attachments_by_order.get(order.id, [])
+            )
+        volumes = ZipVolumeWriter(self._new_export_path, on_close, max_size)
+        try:
+            # Único consumidor: el orden del ZIP sigue el de ``orders``
+            # aunque los PDF se generen en paralelo.
+            pdfs = self._iter_order_pdfs(pdf_orders)
             for order in orders:
+                if heartbeat:
+                    heartbeat()
+                group = self._get_order_group(order)
+                volumes.start_group(group, group_sizes[group])
                 if self.export_attachments:
-                    self._add_attachments_to_zip(zip_file, order)
-                if self.export_purchase_orders:
-                    self._add_order_pdf_to_zip(zip_file, order)
-        buffer.seek(0)
-        return buffer
-
-    def _build_zip_buffer_with_progress(self, orders, cr):
-        """ZIP builder with periodic progress commits (background thread)."""
-        buffer = io.BytesIO()
-        total = len(orders)
-        with zipfile.ZipFile(
-            buffer, mode="w", compression=zipfile.ZIP_DEFLATED
-        ) as zip_file:
-            for idx, order in enumerate(orders, 1):
-                if self.export_attachments:
-                    self._add_attachments_to_zip(zip_file, order)
-                if self.export_purchase_orders:
-                    self._add_order_pdf_to_zip(zip_file, order)
-
-                if idx % 10 == 0 or idx == total:
-                    self.write(
-                        {
-                            "progress_message": _(
-                                "Procesando orden %d de %d..."
-                            ) % (idx, total),
-                        }
+                    self._add_attachments_to_zip(
+                        volumes,
+                        order,
+                        attachments_by_order.get(order.id, []),
+                        zip_state,
                     )
-                    cr.commit()
-        buffer.seek(0)
-        return buffer
+                if order in pdf_orders:
+                    _order, pdf_content = next(pdfs)
+                    if pdf_content:
+                        self._add_order_pdf_to_zip(volumes, order, pdf_content)
+            if with_index:
+                self._write_zip_indexes(volumes, zip_state)
+            results = volumes.close()
+        except Exception:
+            volumes.abort()
+            raise
+        return self.env["ir.attachment"].union(*results)
+
+    def _get_zip_indexes(self, zip_state):
+        """Archivos de índice a escribir al final: ``{ruta: contenido}``."""
+        indexes = {}
+        if zip_state["duplicates"]:
+            indexes[DUPLICATES_ARCNAME] = "\n".join(
+                "%s -> %s" % tuple(pair) for pair in zip_state["duplicates"]
+            )
+        if self.export_mode == "delta":
+            # Ya no están, o siguen pero en otra ruta (cambió el rubro o el
+            # nombre de la orden): en ambos casos la ruta anterior sobra.
+            manifest = zip_state["manifest"]
+            removed = sorted(
+                entry[1]
+                for key, entry in self._get_base_manifest().items()
+                if key not in manifest or manifest[key][1] != entry[1]
+            )
+            if removed:
+                indexes[REMOVED_ARCNAME] = "\n".join(removed)
+        return indexes
+
+    def _write_zip_indexes(self, volumes, zip_state):
+        for arcname, content in self._get_zip_indexes(zip_state).items():
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            volumes.reserve(len(content), arcname).writestr(arcname, content)
+
+    # ------------------------------------------------------------------
+    # Volumes
+    # ------------------------------------------------------------------
+
+    def _get_volume_max_size(self):
+        return max(self.volume_max_mb, 0) * 1024 * 1024
+
+    def _sort_orders_for_volumes(self, orders):
+        """Agrupa las órdenes por carpeta de rubro si se divide en volúmenes."""
+        if not self.volume_max_mb or self.rubro_id:
+            return orders
+        return orders.sorted(key=self._get_rubro_folder)
+
+    def _get_order_group(self, order):
+        return False if self.rubro_id else self._get_rubro_folder(order)
+
+    def _get_arcname_group(self, arcname):
+        if self.rubro_id or "/" not in arcname:
+            return False
+        return arcname.split("/", 1)[0]
+
+    def _get_volume_filename(self, index):
+        return "%s_vol%02d.zip" % (self._build_filename()[:-len(".zip")], index)
+
+    def _store_volume(self, path, index, res_model, res_id):
+        return self._store_export_file(
+            path,
+            self._get_volume_filename(index),
+            ZIP_MIMETYPE,
+            res_model=res_model,
+            res_id=res_id,
+        )
+
+    def _finalize_volumes(self, volumes):
+        """Con un solo volumen, el archivo conserva el nombre sin sufijo."""
+        if len(volumes) == 1:
+            volumes.sudo().write({"name": self._build_filename()})
+        return volumes
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+
+    def _get_base_manifest(self):
+        """Manifiesto de la exportación base (vacío en modo completo)."""
+        if self.export_mode != "delta":
+            return {}
+        return self.base_manifest_id._get_entries()
+
+    def _is_unchanged(self, key, entry):
+        return self._get_base_manifest().get(key) == entry
+
+    def _get_scope_values(self):
+        """Filtros que determinan qué abarca la exportación."""
+        values = {name: self[name] for name in MANIFEST_SCOPE_FIELDS}
+        values["project_id"] = self.project_id.id
+        values["rubro_id"] = self.rubro_id.id
+        return values
+
+    def _record_manifest(self, zip_state):
+        manifests = self.env["sec.attachment.export.manifest"].sudo()
+        scope_values = self._get_scope_values()
+        return manifests.create(
+            dict(
+                scope_values,
+                name=self._build_filename(),
+                export_mode=self.export_mode,
+                base_manifest_id=self.base_manifest_id.id,
+                user_id=self.env.uid,
+                scope_key=manifests._get_scope_key(scope_values),
+            )
+        )._set_entries(zip_state["manifest"])
 
-    def _add_attachments_to_zip(self, zip_file, order):
+    def _get_attachments_by_order(self, orders):
+        """Adjuntos de ``orders`` con una sola búsqueda, agrupados por orden."""
         attachments = self.env["ir.attachment"].search(
             [
                 ("res_model", "=", "purchase.order"),
-                ("res_id", "=", order.id),
+                ("res_id", "in", orders.ids),
                 ("type", "=", "binary"),
             ]
         )
+        attachments_by_order = {}
+        for attachment in attachments:
+            attachments_by_order.setdefault(attachment.res_id, []).append(attachment)
+        return attachments_by_order
+
+    def _add_attachments_to_zip(self, volumes, order, attachments, zip_state):
+        written = zip_state["written"]
+        duplicates = zip_state["duplicates"]
         for attachment in attachments:
-            if not attachment.datas:
+            arcname = self._get_attachment_arcname(order, attachment)
+            checksum = attachment.checksum
+            entry = [checksum or "", arcname]
+            zip_state["manifest"][str(attachment.id)] = entry
+            if self._is_unchanged(str(attachment.id), entry):
                 continue
-            filename = (
-                getattr(attachment, "datas_fname", False)
-                or attachment.name
-                or "adjunto"
-            )
-            arcname = self._get_attachment_path(order, filename)
-            zip_file.writestr(arcname, base64.b64decode(attachment.datas))
+            if checksum and checksum in written:
+                duplicates.append([arcname, written[checksum]])
+                continue
+            zip_file = volumes.reserve(attachment.file_size, arcname)
+            if self._add_attachment_file_to_zip(zip_file, attachment, arcname) and checksum:
+                written[checksum] = arcname
+
+    def _get_attachment_arcname(self, order, attachment):
+        filename = (
+            getattr(attachment, "datas_fname", False)
+            or attachment.name
+            or "adjunto"
+        )
+        return self._get_attachment_path(order, filename)
+
+    @staticmethod
+    def _get_zip_compression(mimetype):
+        """ZIP_STORED para formatos ya comprimidos, ZIP_DEFLATED para el resto."""
+        mimetype = (mimetype or "").lower()
+        if mimetype in ZIP_STORED_MIMETYPES or mimetype.startswith(
+            ZIP_STORED_MIMETYPE_PREFIXES
+        ):
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+    def _add_attachment_file_to_zip(self, zip_file, attachment, arcname):
+        """Copia el contenido del adjunto al ZIP sin cargarlo completo.
+
+        Los adjuntos del filestore se leen por bloques directamente del
+        archivo; los guardados en base de datos se leen con ``raw`` (sin
+        pasar por base64). Devuelve ``True`` si se escribió algo.
+        """
+        compress_type = self._get_zip_compression(attachment.mimetype)
+        full_path = False
+        if attachment.store_fname:
+            full_path = attachment._full_path(attachment.store_fname)
+        if full_path and os.path.isfile(full_path):
+            if not os.path.getsize(full_path):
+                return False
+            info = zipfile.ZipInfo.from_file(full_path, arcname)
+            info.compress_type = compress_type
+            with open(full_path, "rb") as source, zip_file.open(
+                info, mode="w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT
+            ) as target:
+                shutil.copyfileobj(source, target, EXPORT_CHUNK_SIZE)
+            return True
+        content = attachment.raw
+        if not content:
+            return False
+        zip_file.writestr(arcname, content, compress_type=compress_type)
+        return True
+
+    def _get_order_pdf_arcname(self, order):
+        pdf_filename = "%s.pdf" % order.name.replace("/", "-")
+        return self._get_attachment_path(order, pdf_filename)
+
+    def _get_changed_pdf_orders(self, orders, zip_state):
+        """Órdenes cuyo PDF hay que escribir; registra todas en el manifiesto.
+
+        El PDF renderizado no es idéntico byte a byte entre renders, así que
+        su "checksum" en el manifiesto es la ``write_date`` de la orden.
+        """
+        changed = orders.browse()
+        for order in orders:
+            key = "pdf-%d" % order.id
+            entry = [
+                fields.Datetime.to_string(order.write_date),
+                self._get_order_pdf_arcname(order),
+            ]
+            zip_state["manifest"][key] = entry
+            if not self._is_unchanged(key, entry):
+                changed |= order
+        return changed
+
+    def _add_order_pdf_to_zip(self, volumes, order, pdf_content):
+        arcname = self._get_order_pdf_arcname(order)
+        volumes.reserve(len(pdf_content), arcname).writestr(
+            arcname, pdf_content, compress_type=zipfile.ZIP_STORED
+        )
+
+    # ------------------------------------------------------------------
+    # PDF rendering
+    # ------------------------------------------------------------------
+
+    def _get_pdf_render_settings(self):
+        params = self.env["ir.config_parameter"].sudo()
+        batch_size = int(params.get_param(PDF_BATCH_SIZE_PARAM, "10"))
+        workers = int(params.get_param(PDF_WORKERS_PARAM, "2"))
+        return max(batch_size, 1), max(workers, 1)
+
+    def _iter_order_pdfs(self, orders):
+        """Genera ``(orden, pdf)`` en el orden de ``orders``.
+
+        Las órdenes se renderizan por lotes; con más de un render simultáneo
+        cada lote corre en un hilo con su propio cursor y solo se mantienen
+        ``workers`` lotes en curso a la vez.
+        """
+        batch_size, workers = self._get_pdf_render_settings()
+        batches = iter(
+            [orders[i:i + batch_size] for i in range(0, len(orders), batch_size)]
+        )
+        if workers == 1:
+            for batch in batches:
+                pdfs = self._render_order_pdfs(batch)
+                for order in batch:
+                    yield order, pdfs.get(order.id)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append(
+                    (batch, executor.submit(self._render_order_pdfs_in_thread, batch.ids))
+                )
+                if len(pending) == workers:
+                    break
+            while pending:
+                batch, future = pending.popleft()
+                pdfs = future.result()
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    pending.append(
+                        (
+                            next_batch,
+                            executor.submit(
+                                self._render_order_pdfs_in_thread, next_batch.ids
+                            ),
+                        )
+                    )
+                for order in batch:
+                    yield order, pdfs.get(order.id)
+
+    def _render_order_pdfs_in_thread(self, order_ids):
+        """Renderiza un lote desde un hilo del pool, con un cursor propio."""
+        with api.Environment.manage(), self.pool.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            wizard = self.with_env(env)
+            return wizard._render_order_pdfs(env["purchase.order"].browse(order_ids))
 
-    def _add_order_pdf_to_zip(self, zip_file, order):
-        pdf_content = self._render_order_pdf(order)
-        if pdf_content:
-            pdf_filename = "%s.pdf" % order.name.replace("/", "-")
-            arcname = self._get_attachment_path(order, pdf_filename)
-            zip_file.writestr(arcname, pdf_content)
+    def _render_order_pdfs(self, orders):
+        """PDF de ``orders`` por id, servidos desde la caché de PDF."""
+        return self.env["sec.purchase.pdf.cache"]._get_pdfs(orders)
 
     def _render_order_pdf(self, order):
-        report = self.env.ref("purchase.action_report_purchase_order")
-        pdf_content, _content_type = report._render_qweb_pdf([order.id])
-        return pdf_content
+        return self._render_order_pdfs(order).get(order.id)
 
     # ------------------------------------------------------------------
     # Path helpers